@@ -20,5 +20,7 @@ class PluginApp(AppConfig):
         from . import urls  # NOQA
         from . import models  # NOQA
 
+        signals.connect_bank_connection_changed()
+
 
 default_app_config = "byro_directdebit.PluginApp"
@@ -0,0 +1,93 @@
+import gzip
+import hashlib
+import os
+from tempfile import TemporaryFile
+from typing import BinaryIO
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.db.models.fields.files import FieldFile
+from django.utils.deconstruct import deconstructible
+
+CHUNK_SIZE = 64 * 1024
+
+
+def private_root() -> str:
+    return getattr(settings, "DIRECTDEBIT_PRIVATE_ROOT", None) or os.path.join(
+        settings.DATA_DIR, "directdebit"
+    )
+
+
+@deconstructible
+class PrivateStorage(FileSystemStorage):
+    """Files outside of ``MEDIA_ROOT``, which may be served without a login.
+
+    They have no URL, views hand them out after checking permissions. The
+    directory is ``DIRECTDEBIT_PRIVATE_ROOT``, by default ``directdebit`` in
+    byro's data directory."""
+
+    @property
+    def base_location(self):
+        return private_root()
+
+    @property
+    def location(self):
+        return os.path.abspath(self.base_location)
+
+    def url(self, name):
+        raise ValueError("{} is not publicly accessible".format(name))
+
+
+private_storage = PrivateStorage()
+
+
+class _GzipReader(gzip.GzipFile):
+    """Decompresses a stored file and closes it together with itself."""
+
+    def __init__(self, fileobj):
+        super().__init__(fileobj=fileobj, mode="rb")
+        self._stored_file = fileobj
+
+    def close(self):
+        try:
+            super().close()
+        finally:
+            self._stored_file.close()
+
+
+def _compress(source: BinaryIO, target: BinaryIO) -> str:
+    digest = hashlib.sha256()
+    # A fixed mtime makes the compressed file depend only on the content
+    with gzip.GzipFile(fileobj=target, mode="wb", mtime=0) as compressed:
+        for chunk in iter(lambda: source.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+            compressed.write(chunk)
+    return digest.hexdigest()
+
+
+def blob_name(directory: str, digest: str) -> str:
+    return "{}{}/{}.xml.gz".format(directory, digest[:2], digest)
+
+
+def store(field_file: FieldFile, source: BinaryIO) -> str:
+    """Store ``source`` gzip-compressed under its SHA-256 and point ``field_file`` to it.
+
+    Identical content is only stored once. Returns the hex digest, the
+    instance of ``field_file`` is not saved."""
+    with TemporaryFile() as compressed:
+        digest = _compress(source, compressed)
+        name = blob_name(field_file.field.upload_to, digest)
+        if not field_file.storage.exists(name):
+            compressed.seek(0)
+            name = field_file.storage.save(name, File(compressed))
+    field_file.name = name
+    return digest
+
+
+def open_blob(field_file: FieldFile) -> BinaryIO:
+    """Open the uncompressed content of ``field_file`` for reading."""
+    stored = field_file.storage.open(field_file.name, "rb")
+    if field_file.name.endswith(".gz"):
+        return _GzipReader(stored)
+    return stored
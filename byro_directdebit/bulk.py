@@ -0,0 +1,62 @@
+from typing import Iterable, List, Tuple
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from byro.common.models import LogEntry
+from byro.common.models.log import flatten_objects
+from byro.mails.models import EMail
+from byro.members.models import Member
+
+
+def bulk_batch_size() -> int:
+    return getattr(settings, "DIRECTDEBIT_BULK_BATCH_SIZE", 1000)
+
+
+def save_mails(mails: List[EMail], members: List[Member]):
+    """Save unsaved mails and link each of them to the member at the same index."""
+    if connection.features.can_return_rows_from_bulk_insert:
+        EMail.objects.bulk_create(mails, batch_size=bulk_batch_size())
+    else:
+        # The primary keys are needed for the member relation, and only
+        # some databases report them back from a bulk insert.
+        for mail in mails:
+            mail.save()
+
+    EMail.members.through.objects.bulk_create(
+        [
+            EMail.members.through(email_id=mail.pk, member_id=member.pk)
+            for mail, member in zip(mails, members)
+        ],
+        batch_size=bulk_batch_size(),
+    )
+
+
+def log_many(context, entries: Iterable[Tuple[object, str, dict]], user=None):
+    """Like calling ``obj.log(context, action, **data)`` for every entry.
+
+    The entries are saved in one transaction after locking the newest log
+    entry, so that concurrent calls append one after the other. The end of
+    the log chain is looked up once, instead of once per entry."""
+    if hasattr(context, "request"):
+        context = context.request
+    user = user or getattr(context, "user", None)
+
+    with transaction.atomic():
+        LogEntry.objects.select_for_update().order_by("-pk").first()
+        prev = LogEntry.objects.get_chain_end()
+        for obj, action, data in entries:
+            if isinstance(context, str) and "source" not in data:
+                data = dict(data, source=context)
+            if obj.LOG_TARGET_BASE and action.startswith("."):
+                action = obj.LOG_TARGET_BASE + action
+
+            entry = LogEntry(
+                content_object=obj,
+                user=user,
+                action_type=action,
+                data=dict(flatten_objects(data)),
+                auth_prev=prev,
+            )
+            entry.save()
+            prev = entry
@@ -0,0 +1,118 @@
+import datetime
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Dict, FrozenSet, Iterable, Optional, Tuple
+
+from django.conf import settings
+from workalendar.europe import EuropeanCentralBank
+from workalendar.registry import registry
+
+# The settlement calendar of SEPA direct debits
+TARGET2 = "TARGET2"
+
+
+def cache_size() -> int:
+    return getattr(settings, "DIRECTDEBIT_CALENDAR_CACHE_SIZE", 64)
+
+
+@lru_cache(maxsize=None)
+def get_calendar(region: str):
+    """The workalendar instance for ``region``, or for the TARGET2 calendar."""
+    if region == TARGET2:
+        return EuropeanCentralBank()
+    calendar_class = registry.get(region)
+    if calendar_class is None:
+        raise LookupError("No calendar for region {!r}".format(region))
+    return calendar_class()
+
+
+class CalendarService:
+    """Answers working day questions from cached per-region, per-year sets.
+
+    The non-working days (weekends and holidays) of a region and year are
+    computed once and kept in an LRU cache of ``DIRECTDEBIT_CALENDAR_CACHE_SIZE``
+    entries."""
+
+    def __init__(self, maxsize: Optional[int] = None):
+        self.maxsize = maxsize
+        self._closed_days = OrderedDict()
+        self._lock = threading.Lock()
+
+    def closed_days(self, region: str, year: int) -> FrozenSet[datetime.date]:
+        key = (region, year)
+        with self._lock:
+            if key in self._closed_days:
+                self._closed_days.move_to_end(key)
+                return self._closed_days[key]
+
+        calendar = get_calendar(region)
+        weekend = set(calendar.get_weekend_days())
+        day = datetime.date(year, 1, 1)
+        days = set(calendar.holidays_set(year))
+        while day.year == year:
+            if day.weekday() in weekend:
+                days.add(day)
+            day += datetime.timedelta(days=1)
+        days = frozenset(days)
+
+        with self._lock:
+            self._closed_days[key] = days
+            maxsize = self.maxsize or cache_size()
+            while len(self._closed_days) > maxsize:
+                self._closed_days.popitem(last=False)
+        return days
+
+    def is_working_day(self, day: datetime.date, regions: Iterable[str]) -> bool:
+        """Whether ``day`` is a working day in all of ``regions``."""
+        day = _as_date(day)
+        return not any(day in self.closed_days(region, day.year) for region in regions)
+
+    def following_working_day(
+        self, day: datetime.date, regions: Iterable[str]
+    ) -> datetime.date:
+        """``day`` or the first working day in all of ``regions`` after it."""
+        regions = list(regions)
+        day = _as_date(day)
+        while not self.is_working_day(day, regions):
+            day += datetime.timedelta(days=1)
+        return day
+
+    def collection_dates(
+        self,
+        lead_days: Iterable[int],
+        regions: Iterable[str],
+        start_date: Optional[datetime.date] = None,
+        target2: bool = False,
+    ) -> Dict[Tuple[str, int], datetime.date]:
+        """The earliest collection date for every region and lead time.
+
+        Returns ``{(region, lead_days): date}``. With ``target2`` the dates
+        also have to be TARGET2 business days."""
+        start_date = _as_date(start_date or datetime.date.today())
+        lead_days = sorted(set(lead_days))
+        result = {}
+        for region in set(regions):
+            calendars = [region, TARGET2] if target2 else [region]
+            # The lead times are sorted, so each search can continue from
+            # the date found for the previous one.
+            found = None
+            for lead in lead_days:
+                day = start_date + datetime.timedelta(days=lead)
+                if found is None or day > found:
+                    found = self.following_working_day(day, calendars)
+                result[(region, lead)] = found
+        return result
+
+
+_service = CalendarService()
+
+
+def get_calendar_service() -> CalendarService:
+    return _service
+
+
+def _as_date(day) -> datetime.date:
+    if isinstance(day, datetime.datetime):
+        return day.date()
+    return day
@@ -0,0 +1,132 @@
+import uuid
+from typing import FrozenSet, Iterable, List, NamedTuple, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+from fints.client import FinTSOperations
+from schwifty import IBAN
+
+CACHE_KEY = "byro_directdebit:bank_capabilities:{}:{}"
+VERSION_KEY = "byro_directdebit:bank_capabilities:version"
+
+
+def cache_timeout() -> int:
+    return getattr(settings, "DIRECTDEBIT_CAPABILITY_CACHE_TIMEOUT", 3600)
+
+
+class LoginCapabilities(NamedTuple):
+    """What a bank login of byro_fints offers for direct debits."""
+
+    user_login_pk: int
+    accounts: Tuple[str, ...]  # IBANs of all accounts
+    debit_accounts: Tuple[str, ...]  # IBANs of the accounts that can debit
+    formats_known: bool  # whether the bank reported any supported formats
+    core_formats: FrozenSet[str]  # pain formats for CORE debits, e.g. pain.008.001.02
+    cor1_formats: FrozenSet[str]  # pain formats for COR1 debits
+
+
+class Selection(NamedTuple):
+    account: Optional[IBAN] = None
+    user_login_pk: Optional[int] = None
+    pain_formats: Optional[FrozenSet[str]] = None
+    cor1: bool = False
+    debit_capable: bool = False  # False if ``account`` is only a fallback
+
+
+def _normalize_formats(formats) -> FrozenSet[str]:
+    """``urn:iso:std:iso:20022:tech:xsd:pain.008.001.02.xsd`` → ``pain.008.001.02``."""
+    return frozenset(
+        (e[:-4] if e.lower().endswith(".xsd") else e).rsplit(":", 1)[-1]
+        for e in formats or ()
+    )
+
+
+def discover(user_login_pk, connection: dict) -> LoginCapabilities:
+    """Parse one entry of ``FinTSPluginInterface.get_bank_connections()``."""
+    accounts, debit_accounts = [], []
+    for account in connection.get("accounts", []):
+        if "iban" in account and account["iban"]:
+            iban = str(IBAN(account["iban"]))
+            accounts.append(iban)
+            operations = account["supported_operations"]
+            if (
+                operations[FinTSOperations.SEPA_DEBIT_MULTIPLE]
+                or operations[FinTSOperations.SEPA_DEBIT_MULTIPLE_COR1]
+            ):
+                debit_accounts.append(iban)
+
+    supported_formats = connection.get("bank", {}).get("supported_formats", {})
+    return LoginCapabilities(
+        user_login_pk,
+        tuple(accounts),
+        tuple(debit_accounts),
+        bool(supported_formats),
+        _normalize_formats(
+            supported_formats.get(FinTSOperations.SEPA_DEBIT_MULTIPLE)
+            if supported_formats
+            else None
+        ),
+        _normalize_formats(
+            supported_formats.get(FinTSOperations.SEPA_DEBIT_MULTIPLE_COR1)
+            if supported_formats
+            else None
+        ),
+    )
+
+
+def select(logins: Iterable[LoginCapabilities]) -> Selection:
+    """Pick the first account that can debit in a pain format the bank supports.
+
+    CORE is preferred over COR1. Without such an account, the first
+    account at all is returned as a fallback."""
+    fallback = None
+    for login in logins:
+        if login.accounts and not fallback:
+            fallback = Selection(IBAN(login.accounts[0]), login.user_login_pk)
+        if not login.debit_accounts:
+            continue
+        if not login.formats_known:
+            return Selection(
+                IBAN(login.debit_accounts[0]), login.user_login_pk, debit_capable=True
+            )
+        if login.core_formats:
+            return Selection(
+                IBAN(login.debit_accounts[0]),
+                login.user_login_pk,
+                login.core_formats,
+                debit_capable=True,
+            )
+        if login.cor1_formats:
+            return Selection(
+                IBAN(login.debit_accounts[0]),
+                login.user_login_pk,
+                login.cor1_formats,
+                cor1=True,
+                debit_capable=True,
+            )
+    return fallback or Selection()
+
+
+def _version() -> str:
+    return cache.get_or_set(VERSION_KEY, lambda: uuid.uuid4().hex, None)
+
+
+def get_capabilities(fints_interface, user) -> List[LoginCapabilities]:
+    """The capabilities of the bank logins of ``user``, cached.
+
+    Cached per user for ``DIRECTDEBIT_CAPABILITY_CACHE_TIMEOUT`` seconds or
+    until ``invalidate()`` is called, which happens whenever a byro_fints
+    object is saved or deleted."""
+    key = CACHE_KEY.format(_version(), user.pk)
+    logins = cache.get(key)
+    if logins is None:
+        logins = [
+            discover(user_login_pk, connection)
+            for user_login_pk, connection in fints_interface.get_bank_connections().items()
+        ]
+        cache.set(key, logins, cache_timeout())
+    return logins
+
+
+def invalidate():
+    cache.set(VERSION_KEY, uuid.uuid4().hex, None)
@@ -0,0 +1,287 @@
+import datetime
+import weakref
+from collections import Counter
+from typing import Dict, Iterable, Optional
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Max, Min, Q
+from django.utils.timezone import now
+
+from byro.bookkeeping.models import Booking
+from byro.bookkeeping.special_accounts import SpecialAccounts
+from byro.plugins.sepa.models import SepaDirectDebitState
+
+from byro_directdebit import selection
+from byro_directdebit.bulk import bulk_batch_size
+from byro_directdebit.models import (
+    DirectDebitConfiguration,
+    DirectDebitCounter,
+    MemberDirectDebitStatus,
+)
+
+STATE_COUNTERS = {
+    SepaDirectDebitState.NO_IBAN: "no_iban",
+    SepaDirectDebitState.INVALID_IBAN: "invalid_iban",
+    SepaDirectDebitState.NO_BIC: "no_bic",
+    SepaDirectDebitState.INVALID_BIC: "invalid_bic",
+    SepaDirectDebitState.RESCINDED: "rescinded",
+    SepaDirectDebitState.BOUNCED: "bounced",
+    SepaDirectDebitState.NO_MANDATE_REFERENCE: "no_mandate_reference",
+}
+DUE_STATE_COUNTERS = {
+    SepaDirectDebitState.INACTIVE: "deactivated_sepa",
+    SepaDirectDebitState.OK: "eligible",
+}
+STATUS_FIELDS = ["sepa_state", "due", "iban_country", "bic"]
+COUNTER_NAMES = (
+    ["all_members", "with_due_balance"]
+    + list(DUE_STATE_COUNTERS.values())
+    + list(STATE_COUNTERS.values())
+)
+
+
+def rebuild_interval() -> datetime.timedelta:
+    return getattr(
+        settings, "DIRECTDEBIT_COUNTERS_REBUILD_INTERVAL", datetime.timedelta(days=1)
+    )
+
+
+def _counter_names(state: str, due: bool):
+    state = SepaDirectDebitState[state]
+    names = ["all_members"]
+    if state in STATE_COUNTERS:
+        names.append(STATE_COUNTERS[state])
+    if due:
+        names.append("with_due_balance")
+        if state in DUE_STATE_COUNTERS:
+            names.append(DUE_STATE_COUNTERS[state])
+    return names
+
+
+def _status(member: selection.MemberState) -> MemberDirectDebitStatus:
+    return MemberDirectDebitStatus(
+        member_id=member.pk,
+        sepa_state=member.state.name,
+        due=member.due,
+        iban_country=member.check.iban_country,
+        bic=member.check.bic,
+    )
+
+
+def _lock():
+    """Serialize all changes of the stored states until the transaction ends.
+
+    The configuration row is locked because it always exists, unlike the
+    counters before the first ``rebuild()``."""
+    config = DirectDebitConfiguration.get_solo()
+    DirectDebitConfiguration.objects.select_for_update().get(pk=config.pk)
+
+
+def rebuild():
+    """Recompute all member states and counters from scratch."""
+    with transaction.atomic():
+        _lock()
+        now_ = now()
+        statuses = [_status(member) for member in selection.member_sepa_states()]
+        values = Counter(
+            name
+            for status in statuses
+            for name in _counter_names(status.sepa_state, status.due)
+        )
+
+        MemberDirectDebitStatus.objects.all().delete()
+        MemberDirectDebitStatus.objects.bulk_create(
+            statuses, batch_size=bulk_batch_size()
+        )
+        DirectDebitCounter.objects.all().delete()
+        DirectDebitCounter.objects.bulk_create(
+            [
+                DirectDebitCounter(
+                    name=name,
+                    value=values[name],
+                    rebuilt=now_,
+                    refreshed=now_,
+                    modified=now_,
+                )
+                for name in COUNTER_NAMES
+            ]
+        )
+
+
+def update_members(member_ids: Iterable[int]):
+    """Bring the counters up to date after changes to the given members."""
+    member_ids = set(member_ids)
+    if not member_ids:
+        return
+
+    with transaction.atomic():
+        # The states are computed under the lock, so that they cannot be
+        # overwritten by a rebuild() that read the members before the change
+        _lock()
+        if not is_built():
+            return
+
+        current = {
+            member.pk: _status(member)
+            for member in selection.member_sepa_states(
+                selection.fee_members().filter(pk__in=member_ids)
+            )
+        }
+        stored = {
+            status.member_id: status
+            for status in MemberDirectDebitStatus.objects.filter(
+                member_id__in=member_ids
+            )
+        }
+
+        delta = Counter()
+        create, update, delete = [], [], []
+        for pk in member_ids:
+            old, new = stored.get(pk), current.get(pk)
+            if (
+                old
+                and new
+                and all(
+                    getattr(old, field) == getattr(new, field)
+                    for field in STATUS_FIELDS
+                )
+            ):
+                continue
+            if old:
+                delta.subtract(_counter_names(old.sepa_state, old.due))
+            if new:
+                delta.update(_counter_names(new.sepa_state, new.due))
+
+            if old and new:
+                for field in STATUS_FIELDS:
+                    setattr(old, field, getattr(new, field))
+                update.append(old)
+            elif new:
+                create.append(new)
+            else:
+                delete.append(pk)
+
+        MemberDirectDebitStatus.objects.bulk_create(create)
+        MemberDirectDebitStatus.objects.bulk_update(update, STATUS_FIELDS)
+        MemberDirectDebitStatus.objects.filter(member_id__in=delete).delete()
+        _apply(delta)
+
+
+def refresh():
+    """Keep the stored states current, for the periodic task.
+
+    Bookings only count from the value date of their transaction on, so the
+    due flags change with time alone. Only the members with a fee booking
+    whose value date passed since the last refresh are updated. Once a day,
+    see ``DIRECTDEBIT_COUNTERS_REBUILD_INTERVAL``, and the first time
+    everything is rebuilt to pick up changes that did not send signals."""
+    counters = DirectDebitCounter.objects.aggregate(
+        rebuilt=Min("rebuilt"), refreshed=Min("refreshed")
+    )
+    now_ = now()
+    if counters["rebuilt"] is None or now_ - counters["rebuilt"] >= rebuild_interval():
+        rebuild()
+        return
+
+    fees_receivable = SpecialAccounts.fees_receivable
+    update_members(
+        Booking.objects.filter(
+            Q(credit_account=fees_receivable) | Q(debit_account=fees_receivable),
+            member__isnull=False,
+            transaction__value_datetime__gt=counters["refreshed"],
+            transaction__value_datetime__lte=now_,
+        )
+        .order_by()
+        .values_list("member_id", flat=True)
+        .distinct()
+    )
+    DirectDebitCounter.objects.update(refreshed=now_)
+
+
+def forget_member(member_id: int):
+    """Remove a member that is about to be deleted from the counters."""
+    with transaction.atomic():
+        _lock()
+        status = MemberDirectDebitStatus.objects.filter(member_id=member_id).first()
+        if status:
+            delta = Counter()
+            delta.subtract(_counter_names(status.sepa_state, status.due))
+            _apply(delta)
+            status.delete()
+
+
+def _apply(delta: Counter):
+    now_ = now()
+    for name, difference in delta.items():
+        if difference:
+            DirectDebitCounter.objects.filter(name=name).update(
+                value=F("value") + difference, modified=now_
+            )
+
+
+class _PendingUpdate:
+    """The members changed in a transaction, updated together on commit."""
+
+    def __init__(self, member_id):
+        self.member_ids = {member_id}
+        self.done = False
+
+    def __call__(self):
+        self.done = True
+        update_members(self.member_ids)
+
+
+# The update waiting for the transaction of each connection. Only the
+# on_commit() callback holds on to it, so when the transaction or the
+# savepoint it was registered in is rolled back, it is dropped from here too.
+_pending = weakref.WeakValueDictionary()
+
+
+def schedule_update(member_id):
+    """Update the counters for a member once the current transaction commits.
+
+    All members changed in one transaction are collected and updated at once."""
+    if member_id is None:
+        return
+    connection = transaction.get_connection()
+    pending = _pending.get(connection)
+    if pending is not None and not pending.done:
+        pending.member_ids.add(member_id)
+        return
+    pending = _pending[connection] = _PendingUpdate(member_id)
+    # Outside of a transaction this runs at once
+    transaction.on_commit(pending)
+
+
+def is_built() -> bool:
+    """Whether the member states were computed, see ``rebuild()``."""
+    return DirectDebitCounter.objects.exists()
+
+
+def last_rebuilt() -> Optional[datetime.datetime]:
+    return DirectDebitCounter.objects.aggregate(rebuilt=Min("rebuilt"))["rebuilt"]
+
+
+def is_stale(rebuilt: Optional[datetime.datetime]) -> bool:
+    """Whether the states were never computed or their rebuild is overdue."""
+    return rebuilt is None or now() - rebuilt >= rebuild_interval()
+
+
+def get_counters() -> Dict:
+    """Read all counters as they are stored.
+
+    They are not computed here, that is left to the periodic task and the
+    ``rebuild_directdebit_counters`` command; ``counters_stale`` tells
+    whether they are missing or out of date."""
+    counters = DirectDebitCounter.objects.all()
+
+    result = {name: 0 for name in COUNTER_NAMES}
+    result.update(counters.values_list("name", "value"))
+    result.update(
+        counters.aggregate(
+            counters_rebuilt=Min("rebuilt"), counters_updated=Max("modified")
+        )
+    )
+    result["counters_stale"] = is_stale(result["counters_rebuilt"])
+    return result
@@ -0,0 +1,89 @@
+"""Streaming export of the member list as CSV or NDJSON."""
+
+import csv
+import json
+import re
+from typing import Iterable, Iterator, List
+
+from byro.plugins.sepa.models import SepaDirectDebitState
+
+from byro_directdebit import selection
+
+COLUMNS = (
+    "id",
+    "number",
+    "name",
+    "sepa_state",
+    "balance",
+    "iban",
+    "bic",
+    "mandate_reference",
+)
+
+# Cells starting with these are evaluated as formulas by spreadsheets
+FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+_NUMBER = re.compile(r"^-?[0-9]+(\.[0-9]+)?$")
+
+
+def member_chunks(
+    states: Iterable[SepaDirectDebitState] = (), due=False, fees_receivable=None
+) -> Iterator[List[dict]]:
+    """Yield the members as rows of ``COLUMNS``, newest first.
+
+    Only members in one of ``states`` (all without) and, with ``due``, with a
+    due balance are exported. The states and balances are evaluated one
+    keyset chunk of ``DIRECTDEBIT_BULK_BATCH_SIZE`` members at a time, see
+    ``selection.member_state_chunks()``, so that the memory use does not grow
+    with the number of members and the first rows are ready after the first
+    chunk."""
+    for chunk in selection.member_state_chunks(
+        states=states, fees_receivable=fees_receivable, fields=("number", "name")
+    ):
+        rows = [
+            {
+                "id": member.pk,
+                "number": member.values[0],
+                "name": member.values[1],
+                "sepa_state": member.state.name,
+                "balance": "%.2f" % member.balance,
+                "iban": member.iban,
+                "bic": member.check.bic,
+                "mandate_reference": member.mandate_reference,
+            }
+            for member in chunk
+            if member.due or not due
+        ]
+        if rows:
+            yield rows
+
+
+def csv_cell(value):
+    """Prefix text that a spreadsheet would take for a formula with ``'``."""
+    if (
+        isinstance(value, str)
+        and value.startswith(FORMULA_PREFIXES)
+        and not _NUMBER.match(value)
+    ):
+        return "'" + value
+    return value
+
+
+class _Echo:
+    """A file-like object for ``csv.writer`` that returns what it is given."""
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(chunks: Iterator[List[dict]]) -> Iterator[str]:
+    writer = csv.writer(_Echo())
+    yield writer.writerow(COLUMNS)
+    for rows in chunks:
+        yield "".join(
+            writer.writerow([csv_cell(row[e]) for e in COLUMNS]) for row in rows
+        )
+
+
+def ndjson_lines(chunks: Iterator[List[dict]]) -> Iterator[str]:
+    for rows in chunks:
+        yield "".join(json.dumps(row) + "\n" for row in rows)
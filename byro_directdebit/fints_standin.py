@@ -0,0 +1,140 @@
+"""A local stand-in for the bank, to try out transmissions without one.
+
+``StandInSepaDDHelper`` has the interface of byro_fints' ``SepaDDFinTSHelper``
+that the transmission views use. It is used instead of the real helper when
+``DEBUG`` is on and ``DIRECTDEBIT_FINTS_STANDIN`` is set, either to ``True``
+or to a dict of options:
+
+``tan``
+    ``"every"`` (the default) to ask for a TAN for every order, ``"first"``
+    for only the first order of a dialog and ``"never"`` to never ask.
+``reject``
+    ``"control_sum"`` (the default) to reject orders whose control sum does
+    not match the one in the pain message, ``None`` to accept everything.
+
+The number of dialogs opened and orders received are counted in ``STATS``."""
+
+import uuid
+from collections import Counter, namedtuple
+from decimal import Decimal
+
+from django import forms
+from django.conf import settings
+from fints.client import ResponseStatus, TransactionResponse
+from lxml import etree
+
+SESSION_KEY = "byro_directdebit_standin_{}"
+
+STATS = Counter()
+
+_Line = namedtuple("_Line", ["code", "text"])
+
+
+class StandInResponse(TransactionResponse):
+    def __init__(self, status: ResponseStatus, code: str, text: str):
+        self.status = status
+        self.responses = [_Line(code, text)]
+        self.data = {}
+
+
+def options() -> dict:
+    configured = getattr(settings, "DIRECTDEBIT_FINTS_STANDIN", True)
+    return dict(
+        {"tan": "every", "reject": "control_sum"},
+        **(configured if isinstance(configured, dict) else {})
+    )
+
+
+def _control_sum(pain_message: str) -> Decimal:
+    root = etree.fromstring(pain_message.encode("utf-8"))
+    values = root.xpath("//*[local-name()='GrpHdr']/*[local-name()='CtrlSum']/text()")
+    return Decimal(values[0]) if values else None
+
+
+class StandInSepaDDHelper:
+    def __init__(self, request, dialog_id=None, tans=0, pending_order=None):
+        self.request = request
+        self.options = options()
+        self.dialog_id = dialog_id
+        self.tans = tans  # TANs asked for in this dialog
+        self.pending_order = pending_order
+        self.resume_id = None
+        self.tan_request = None
+
+    @classmethod
+    def restore_from_session(cls, request, resume_id):
+        helper = cls(request, **request.session[SESSION_KEY.format(resume_id)])
+        helper.resume_id = resume_id
+        helper.tan_request = "Stand-in TAN request"
+        return helper
+
+    def save_in_session(self):
+        self.resume_id = uuid.uuid4().hex
+        self.request.session[SESSION_KEY.format(self.resume_id)] = {
+            "dialog_id": self.dialog_id,
+            "tans": self.tans,
+            "pending_order": self.pending_order,
+        }
+        return self.resume_id
+
+    def delete_from_session(self):
+        self.request.session.pop(SESSION_KEY.format(self.resume_id), None)
+
+    def augment_form_pin_fields(self, form):
+        form.fields["pin"] = forms.CharField(
+            label="PIN (stand-in)", required=False, widget=forms.PasswordInput
+        )
+
+    def augment_form_tan_fields(self, form):
+        form.fields["tan"] = forms.CharField(label="TAN (stand-in)")
+
+    def get_tan_context_data(self, tan_request):
+        return {"tan_request": tan_request}
+
+    def load_from_form(self, form):
+        pass
+
+    def open(self):
+        if self.dialog_id is None:
+            self.dialog_id = uuid.uuid4().hex
+            STATS["dialogs"] += 1
+
+    def close(self):
+        self.dialog_id = None
+
+    def sepa_dd(
+        self,
+        account_iban,
+        pain_message,
+        multiple,
+        cor1,
+        control_sum,
+        currency,
+        pain_descriptor,
+    ):
+        assert self.dialog_id, "No open dialog"
+        STATS["orders"] += 1
+        if self.options["reject"] == "control_sum" and _control_sum(
+            pain_message
+        ) != Decimal(control_sum):
+            return StandInResponse(
+                ResponseStatus.ERROR, "9210", "Control sum does not match"
+            )
+
+        if self.options["tan"] == "every" or (
+            self.options["tan"] == "first" and not self.tans
+        ):
+            self.tans += 1
+            self.pending_order = account_iban
+            self.tan_request = "Stand-in TAN request"
+            return False
+        return StandInResponse(ResponseStatus.SUCCESS, "0020", "Order accepted")
+
+    def send_tan(self, tan):
+        assert self.dialog_id, "No open dialog"
+        if not self.pending_order:
+            return StandInResponse(ResponseStatus.ERROR, "9120", "No order waits")
+        self.pending_order = None
+        if not tan:
+            return StandInResponse(ResponseStatus.ERROR, "9941", "TAN invalid")
+        return StandInResponse(ResponseStatus.SUCCESS, "0020", "Order accepted")
@@ -0,0 +1,172 @@
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import timedelta
+from tempfile import TemporaryFile
+from typing import Optional
+from uuid import uuid4
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils.timezone import now
+
+from byro_directdebit.models import DirectDebitJob, DirectDebitJobState
+from byro_directdebit.prepare import DirectDebitPreparation
+
+logger = logging.getLogger(__name__)
+
+JOB_KIND_PREPARE = "prepare"
+
+# A running job whose heartbeat is older than this is assumed to be dead and
+# is picked up again, continuing after the last committed chunk. The worker
+# that claims it gets a new owner token, see _fenced().
+STALE_AFTER = timedelta(minutes=10)
+
+
+def chunk_size() -> int:
+    return getattr(settings, "DIRECTDEBIT_CHUNK_SIZE", 500)
+
+
+def enqueue_prepare(parameters: dict) -> DirectDebitJob:
+    job = DirectDebitJob.objects.create(kind=JOB_KIND_PREPARE, parameters=parameters)
+    kick()
+    return job
+
+
+class JobLost(Exception):
+    """The job was claimed by another worker after it was considered stale."""
+
+
+def claim_next_job() -> Optional[DirectDebitJob]:
+    with transaction.atomic():
+        job = (
+            DirectDebitJob.objects.select_for_update(skip_locked=True)
+            .filter(
+                Q(state=DirectDebitJobState.QUEUED.value)
+                | Q(
+                    state=DirectDebitJobState.RUNNING.value,
+                    heartbeat__lt=now() - STALE_AFTER,
+                )
+            )
+            .order_by("created")
+            .first()
+        )
+        if job:
+            job.state = DirectDebitJobState.RUNNING.value
+            job.heartbeat = now()
+            job.owner = uuid4()
+            job.save(update_fields=["state", "heartbeat", "owner"])
+    return job
+
+
+def heartbeat(job: DirectDebitJob):
+    """Show that ``job`` is alive, raise ``JobLost`` if it was taken over."""
+    if not DirectDebitJob.objects.filter(pk=job.pk, owner=job.owner).update(
+        heartbeat=now()
+    ):
+        raise JobLost()
+
+
+@contextmanager
+def _fenced(job: DirectDebitJob, *fields):
+    """A transaction that only commits while ``job`` belongs to this worker.
+
+    The job row stays locked until the end, so a worker that took over the
+    job cannot commit work of it at the same time, and the work is only
+    done if the stored checkpoint is still the one it continues from.
+    ``fields`` of the job are saved at the end, along with the heartbeat."""
+    with transaction.atomic():
+        stored = (
+            DirectDebitJob.objects.select_for_update()
+            .only("owner", "processed")
+            .get(pk=job.pk)
+        )
+        if stored.owner != job.owner or stored.processed != job.processed:
+            raise JobLost()
+        yield
+        job.heartbeat = now()
+        job.save(update_fields=[*fields, "heartbeat"])
+
+
+def run_job(job: DirectDebitJob, xml_workers: int = 1):
+    try:
+        preparation = DirectDebitPreparation(
+            job.parameters, progress=lambda: heartbeat(job), xml_workers=xml_workers
+        )
+
+        if not job.direct_debit:
+            member_ids = preparation.select_member_ids()
+            with _fenced(job, "direct_debit", "member_ids", "total"):
+                job.direct_debit = preparation.create_debit()
+                job.member_ids = member_ids
+                job.total = len(member_ids)
+                preparation.save_checkpoint(job.direct_debit, 0)
+        else:
+            preparation.attach(job.direct_debit)
+        debit = job.direct_debit
+
+        processed = preparation.get_checkpoint(debit)
+        while processed < job.total:
+            member_ids = job.member_ids[processed : processed + chunk_size()]
+            with _fenced(job, "processed"):
+                preparation.process_members(debit, member_ids)
+                processed += len(member_ids)
+                preparation.save_checkpoint(debit, processed)
+                job.processed = processed
+
+        with TemporaryFile() as sepa_xml:
+            preparation.write_xml(debit, sepa_xml)
+            with _fenced(job, "state"):
+                preparation.store_xml(debit, sepa_xml)
+                job.state = DirectDebitJobState.DONE.value
+
+    except JobLost:
+        logger.warning("Direct debit job %s was taken over by another worker", job.pk)
+
+    except Exception as e:
+        logger.exception("Direct debit job %s failed", job.pk)
+        DirectDebitJob.objects.filter(pk=job.pk, owner=job.owner).update(
+            state=DirectDebitJobState.FAILED.value, error=str(e)
+        )
+
+
+def resume_job(job: DirectDebitJob):
+    """Queue a failed job again, it continues after the last checkpoint."""
+    if job.state != DirectDebitJobState.FAILED.value:
+        return
+    job.state = DirectDebitJobState.QUEUED.value
+    job.error = None
+    job.save(update_fields=["state", "error"])
+    kick()
+
+
+def run_pending_jobs(xml_workers: int = 1):
+    """Work on queued jobs until there are none left.
+
+    Only the ``run_directdebit_jobs`` worker passes ``xml_workers``, see
+    ``DirectDebitPreparation``."""
+    job = claim_next_job()
+    while job:
+        run_job(job, xml_workers=xml_workers)
+        job = claim_next_job()
+
+
+def _run_in_thread():
+    try:
+        run_pending_jobs()
+    finally:
+        connection.close()
+
+
+def kick():
+    """Start working on queued jobs in a thread of the current process, if enabled.
+
+    By default the jobs are left to the ``manage.py run_directdebit_jobs``
+    worker and byro's periodic task. ``DIRECTDEBIT_JOBS_IN_PROCESS = True``
+    runs them in a thread of the web server process instead, e.g. during
+    development."""
+    if getattr(settings, "DIRECTDEBIT_JOBS_IN_PROCESS", False):
+        transaction.on_commit(
+            lambda: threading.Thread(target=_run_in_thread, daemon=True).start()
+        )
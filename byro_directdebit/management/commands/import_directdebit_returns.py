@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from byro_directdebit import returns
+
+
+class Command(BaseCommand):
+    help = "Set direct debit payment states from pain.002 or camt.054 files"
+
+    def add_arguments(self, parser):
+        parser.add_argument("files", nargs="+", help="Status report files")
+
+    def handle(self, *args, **options):
+        for name in options["files"]:
+            try:
+                with open(name, "rb") as fileobj:
+                    result = returns.import_status_report(fileobj)
+            except (OSError, ValueError) as e:
+                raise CommandError("{}: {}".format(name, e))
+
+            self.stdout.write(
+                "{}: {} entries, {} payments executed, {} bounced, {} unmatched".format(
+                    name,
+                    result.entries,
+                    result.updated[returns.EXECUTED],
+                    result.updated[returns.BOUNCED],
+                    len(result.unmatched),
+                )
+            )
+            for debit_id, state in result.debit_states.items():
+                self.stdout.write("Direct debit {} is now {}".format(debit_id, state))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from byro_directdebit import counters
+
+
+class Command(BaseCommand):
+    help = "Recompute the direct debit dashboard counters from scratch"
+
+    def handle(self, *args, **options):
+        counters.rebuild()
+        self.stdout.write(self.style.SUCCESS("Direct debit counters rebuilt."))
@@ -0,0 +1,37 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from byro_directdebit import jobs
+from byro_directdebit.prepare import xml_workers
+
+
+class Command(BaseCommand):
+    help = "Work on queued direct debit jobs"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Keep polling for new jobs instead of exiting when the queue is empty",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=2.0,
+            help="Seconds to wait between polls in --loop mode",
+        )
+        parser.add_argument(
+            "--xml-workers",
+            type=int,
+            default=None,
+            help="Processes for serializing large SEPA-XML files, "
+            "defaults to DIRECTDEBIT_XML_WORKERS",
+        )
+
+    def handle(self, *args, **options):
+        workers = options["xml_workers"] or xml_workers()
+        jobs.run_pending_jobs(xml_workers=workers)
+        while options["loop"]:
+            time.sleep(options["interval"])
+            jobs.run_pending_jobs(xml_workers=workers)
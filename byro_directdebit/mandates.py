@@ -0,0 +1,78 @@
+import string
+import sys
+from typing import Optional, Set
+
+from django.db import transaction
+from django.utils.crypto import get_random_string
+from django.utils.timezone import now
+
+from byro.plugins.sepa.models import MemberSepa
+
+from byro_directdebit.models import DirectDebitConfiguration
+
+ALLOWED_CHARS = [x for x in string.ascii_uppercase if x not in "XBGIOQSZ"]
+FORMAT_STRING = "{}{:04d}{}{}"
+
+
+class MandateReferenceAllocator:
+    """Generates unused mandate references for many members.
+
+    Use it as a context manager: it opens a transaction and locks the
+    configuration row until the block ends, so that a concurrent
+    allocation waits instead of handing out the same references. The
+    assigned references must be saved within the block.
+
+    The references in use are loaded once, references handed out by
+    ``allocate()`` are added to that set, so no query is needed per
+    member."""
+
+    def __init__(self, prefix, length, now_=None):
+        self.prefix = prefix
+        self.length = length
+        self.now = now_ or now()
+        self.used: Set[str] = set()
+        self._atomic = None
+
+    def __enter__(self):
+        self._atomic = transaction.atomic()
+        self._atomic.__enter__()
+        try:
+            DirectDebitConfiguration.objects.select_for_update().filter(
+                pk=DirectDebitConfiguration.get_solo().pk
+            ).first()
+            self.used = set(
+                MemberSepa.objects.exclude(mandate_reference__isnull=True)
+                .exclude(mandate_reference="")
+                .values_list("mandate_reference", flat=True)
+            )
+        except BaseException:
+            self._atomic.__exit__(*sys.exc_info())
+            raise
+        return self
+
+    def __exit__(self, *exc_info):
+        atomic, self._atomic = self._atomic, None
+        return atomic.__exit__(*exc_info)
+
+    def allocate(self, member) -> Optional[str]:
+        member_number = member.number or "0"
+        formatted_number = (
+            "{:06d}".format(int(member_number))
+            if member_number.isdigit()
+            else "X{}".format(member_number)
+        )
+
+        format_params = [self.prefix, self.now.year, "", formatted_number]
+        empty_len = len(FORMAT_STRING.format(*format_params))
+
+        for i in range(3):
+            format_params[2] = get_random_string(
+                length=self.length - empty_len, allowed_chars=ALLOWED_CHARS
+            )
+            mandate_reference = FORMAT_STRING.format(*format_params).upper()
+
+            if mandate_reference not in self.used:
+                self.used.add(mandate_reference)
+                return mandate_reference
+
+        return None
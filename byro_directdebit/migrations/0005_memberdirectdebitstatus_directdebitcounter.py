@@ -0,0 +1,56 @@
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("members", "0010_memberbalance"),
+        ("byro_directdebit", "0004_alter_directdebit_additional_data"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="MemberDirectDebitStatus",
+            fields=[
+                (
+                    "member",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="direct_debit_status",
+                        serialize=False,
+                        to="members.member",
+                    ),
+                ),
+                ("sepa_state", models.CharField(db_index=True, max_length=20)),
+                ("due", models.BooleanField(db_index=True, default=False)),
+                ("modified", models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="DirectDebitCounter",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=40, unique=True)),
+                ("value", models.IntegerField(default=0)),
+                (
+                    "rebuilt",
+                    models.DateTimeField(default=django.utils.timezone.now),
+                ),
+                (
+                    "modified",
+                    models.DateTimeField(default=django.utils.timezone.now),
+                ),
+            ],
+        ),
+    ]
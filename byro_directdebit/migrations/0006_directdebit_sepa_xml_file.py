@@ -0,0 +1,23 @@
+# Generated by Django 3.2.25 on 2026-10-18 15:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("byro_directdebit", "0005_memberdirectdebitstatus_directdebitcounter"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="directdebit",
+            name="sepa_xml_file",
+            field=models.FileField(
+                blank=True,
+                null=True,
+                upload_to="byro_directdebit/sepa_xml/",
+                verbose_name="SEPA-XML file",
+            ),
+        ),
+    ]
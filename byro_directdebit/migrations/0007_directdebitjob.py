@@ -0,0 +1,81 @@
+# Generated by Django 3.2.25 on 2026-10-18 15:20
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("byro_directdebit", "0006_directdebit_sepa_xml_file"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="directdebit",
+            name="state",
+            field=models.CharField(
+                choices=[
+                    ("preparing", "Preparing"),
+                    ("unknown", "Unknown"),
+                    ("failed", "Failed"),
+                    ("transmitted", "Transmitted"),
+                    ("executed", "Executed"),
+                ],
+                default="unknown",
+                max_length=11,
+            ),
+        ),
+        migrations.CreateModel(
+            name="DirectDebitJob",
+            fields=[
+                (
+                    "id",
+                    models.UUIDField(
+                        default=uuid.uuid4,
+                        editable=False,
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+                (
+                    "created",
+                    models.DateTimeField(
+                        db_index=True, default=django.utils.timezone.now
+                    ),
+                ),
+                ("heartbeat", models.DateTimeField(null=True)),
+                ("kind", models.CharField(max_length=20)),
+                (
+                    "state",
+                    models.CharField(
+                        choices=[
+                            ("queued", "Queued"),
+                            ("running", "Running"),
+                            ("done", "Done"),
+                            ("failed", "Failed"),
+                        ],
+                        db_index=True,
+                        default="queued",
+                        max_length=7,
+                    ),
+                ),
+                ("parameters", models.JSONField(default=dict)),
+                ("member_ids", models.JSONField(default=list)),
+                ("processed", models.IntegerField(default=0)),
+                ("total", models.IntegerField(default=0)),
+                ("error", models.TextField(blank=True, null=True)),
+                (
+                    "direct_debit",
+                    models.ForeignKey(
+                        null=True,
+                        on_delete=django.db.models.deletion.PROTECT,
+                        related_name="jobs",
+                        to="byro_directdebit.directdebit",
+                    ),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 3.2.25 on 2026-10-18 15:45
+
+from django.db import migrations, models
+
+
+def reset_counters(apps, schema_editor):
+    # The new columns are filled by the next rebuild
+    apps.get_model("byro_directdebit", "DirectDebitCounter").objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("byro_directdebit", "0007_directdebitjob"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="memberdirectdebitstatus",
+            name="bic",
+            field=models.CharField(blank=True, max_length=11, null=True),
+        ),
+        migrations.AddField(
+            model_name="memberdirectdebitstatus",
+            name="iban_country",
+            field=models.CharField(blank=True, db_index=True, max_length=2),
+        ),
+        migrations.RunPython(reset_counters, migrations.RunPython.noop),
+    ]
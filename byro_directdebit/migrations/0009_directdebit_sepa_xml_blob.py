@@ -0,0 +1,57 @@
+# Generated by Django 3.2.25 on 2026-10-18 15:46
+
+from io import BytesIO
+
+from django.db import migrations, models
+from django.db.models import Q
+
+from byro_directdebit import blobs
+
+
+def move_sepa_xml_to_blobs(apps, schema_editor):
+    DirectDebit = apps.get_model("byro_directdebit", "DirectDebit")
+    debits = DirectDebit.objects.filter(
+        (Q(sepa_xml__isnull=False) & ~Q(sepa_xml=""))
+        | (~Q(sepa_xml_file="") & ~Q(sepa_xml_file__endswith=".gz"))
+    )
+    for debit in debits.iterator(chunk_size=100):
+        if debit.sepa_xml_file and not debit.sepa_xml_file.name.endswith(".gz"):
+            old_file = debit.sepa_xml_file.name
+            with debit.sepa_xml_file.open("rb") as xml:
+                debit.sepa_xml_sha256 = blobs.store(debit.sepa_xml_file, xml)
+            debit.sepa_xml_file.storage.delete(old_file)
+        else:
+            debit.sepa_xml_sha256 = blobs.store(
+                debit.sepa_xml_file, BytesIO(debit.sepa_xml.encode("utf-8"))
+            )
+        debit.save(update_fields=["sepa_xml_file", "sepa_xml_sha256"])
+
+
+def move_sepa_xml_to_column(apps, schema_editor):
+    DirectDebit = apps.get_model("byro_directdebit", "DirectDebit")
+    for debit in DirectDebit.objects.exclude(sepa_xml_file="").exclude(
+        sepa_xml_file__isnull=True
+    ):
+        with blobs.open_blob(debit.sepa_xml_file) as xml:
+            debit.sepa_xml = xml.read().decode("utf-8")
+        debit.save(update_fields=["sepa_xml"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("byro_directdebit", "0008_memberdirectdebitstatus_validation"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="directdebit",
+            name="sepa_xml_sha256",
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.RunPython(move_sepa_xml_to_blobs, move_sepa_xml_to_column),
+        migrations.RemoveField(
+            model_name="directdebit",
+            name="sepa_xml",
+        ),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 3.2.25 on 2026-10-18 15:48
+
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def compute_totals(apps, schema_editor):
+    DirectDebit = apps.get_model("byro_directdebit", "DirectDebit")
+    DirectDebitPayment = apps.get_model("byro_directdebit", "DirectDebitPayment")
+
+    totals = defaultdict(dict)
+    for debit_id, sequence_type, count, amount in (
+        DirectDebitPayment.objects.order_by()
+        .values("direct_debit", "type")
+        .annotate(count=Count("pk"), amount=Sum("amount"))
+        .values_list("direct_debit", "type", "count", "amount")
+    ):
+        totals[debit_id][sequence_type] = {
+            "count": count,
+            "amount": "{:.2f}".format(amount),
+        }
+
+    for debit in DirectDebit.objects.exclude(state="preparing"):
+        debit.sequence_type_totals = totals.get(debit.pk, {})
+        debit.payment_count = sum(
+            values["count"] for values in debit.sequence_type_totals.values()
+        )
+        debit.control_sum = sum(
+            (
+                Decimal(values["amount"])
+                for values in debit.sequence_type_totals.values()
+            ),
+            Decimal("0.00"),
+        )
+        debit.save(
+            update_fields=["sequence_type_totals", "payment_count", "control_sum"]
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("byro_directdebit", "0009_directdebit_sepa_xml_blob"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="directdebit",
+            name="control_sum",
+            field=models.DecimalField(
+                blank=True, decimal_places=2, max_digits=12, null=True
+            ),
+        ),
+        migrations.AddField(
+            model_name="directdebit",
+            name="payment_count",
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="directdebit",
+            name="sequence_type_totals",
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.RunPython(compute_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 3.2.25 on 2026-10-18 15:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("byro_directdebit", "0010_directdebit_totals"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="directdebit",
+            index=models.Index(
+                fields=["state", "datetime"], name="byro_direct_state_11ac45_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="directdebitpayment",
+            index=models.Index(
+                fields=["member", "collection_date"],
+                name="byro_direct_member__fec261_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="directdebitpayment",
+            index=models.Index(
+                fields=["direct_debit", "state"], name="byro_direct_direct__94b25a_idx"
+            ),
+        ),
+    ]
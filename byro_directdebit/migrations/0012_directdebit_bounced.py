@@ -0,0 +1,29 @@
+# Generated by Django 3.2.25 on 2026-10-18 15:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("byro_directdebit", "0011_history_indexes"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="directdebit",
+            name="state",
+            field=models.CharField(
+                choices=[
+                    ("preparing", "Preparing"),
+                    ("unknown", "Unknown"),
+                    ("failed", "Failed"),
+                    ("transmitted", "Transmitted"),
+                    ("executed", "Executed"),
+                    ("bounced", "Bounced"),
+                ],
+                default="unknown",
+                max_length=11,
+            ),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 3.2.25 on 2026-10-18 15:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("byro_directdebit", "0012_directdebit_bounced"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="directdebitpayment",
+            index=models.Index(
+                fields=["mandate_reference", "state"],
+                name="byro_direct_mandate_ae6a0d_idx",
+            ),
+        ),
+    ]
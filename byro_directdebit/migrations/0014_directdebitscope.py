@@ -0,0 +1,90 @@
+# Generated by Django 3.2.25 on 2026-10-18 16:19
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("byro_directdebit", "0013_directdebitpayment_mandate_reference_index"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DirectDebitScope",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "name",
+                    models.CharField(max_length=100, unique=True, verbose_name="Name"),
+                ),
+                (
+                    "member_numbers",
+                    models.CharField(
+                        blank=True,
+                        help_text="Only members with these numbers, empty for all. Example: 1-5000,7000-",
+                        max_length=1000,
+                        verbose_name="Member numbers",
+                    ),
+                ),
+                (
+                    "exclude_member_numbers",
+                    models.CharField(
+                        blank=True,
+                        help_text="Members with these numbers are left out. Members whose number is not a number are never left out.",
+                        max_length=1000,
+                        verbose_name="Except member numbers",
+                    ),
+                ),
+                (
+                    "countries",
+                    models.CharField(
+                        blank=True,
+                        help_text="Only members with an IBAN of these countries, empty for all. Example: DE,AT",
+                        max_length=200,
+                        verbose_name="Bank countries",
+                    ),
+                ),
+                (
+                    "exclude_countries",
+                    models.CharField(
+                        blank=True, max_length=200, verbose_name="Except bank countries"
+                    ),
+                ),
+                (
+                    "fee_intervals",
+                    models.JSONField(
+                        blank=True,
+                        default=list,
+                        help_text="Only members with a membership with one of these fee intervals on the debit date, none for all.",
+                        verbose_name="Fee intervals",
+                    ),
+                ),
+                (
+                    "debit_day",
+                    models.PositiveSmallIntegerField(
+                        blank=True,
+                        help_text="Day of the month to suggest as debit date, the next bank day is used if it is none.",
+                        null=True,
+                        validators=[
+                            django.core.validators.MinValueValidator(1),
+                            django.core.validators.MaxValueValidator(31),
+                        ],
+                        verbose_name="Debit day",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["name"],
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 3.2.25 on 2026-10-18 16:46
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("byro_directdebit", "0014_directdebitscope"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="directdebitcounter",
+            name="refreshed",
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
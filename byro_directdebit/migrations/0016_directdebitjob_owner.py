@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-18 16:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("byro_directdebit", "0015_directdebitcounter_refreshed"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="directdebitjob",
+            name="owner",
+            field=models.UUIDField(editable=False, null=True),
+        ),
+    ]
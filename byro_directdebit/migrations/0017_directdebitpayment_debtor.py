@@ -0,0 +1,59 @@
+# Generated by Django 3.2.25 on 2026-10-18 16:51
+
+from django.db import migrations, models
+from django.utils.timezone import now
+
+
+def copy_debtors(apps, schema_editor):
+    """Fill in the debtors of runs that are still being prepared, whose
+    SEPA-XML is yet to be written."""
+    from byro_directdebit.validation import profile_bic
+
+    DirectDebitPayment = apps.get_model("byro_directdebit", "DirectDebitPayment")
+    MemberSepa = apps.get_model("sepa", "MemberSepa")
+
+    today = now().date()
+    payments = DirectDebitPayment.objects.filter(
+        direct_debit__state="preparing", member__isnull=False
+    ).select_related("member")
+    for payment in payments.iterator():
+        profile = MemberSepa.objects.filter(member=payment.member).first()
+        payment.sepa_name = payment.member.name
+        payment.sepa_iban = profile.iban if profile else None
+        payment.sepa_bic = profile_bic(profile) if profile else None
+        payment.mandate_date = (profile.issue_date if profile else None) or today
+        payment.save(
+            update_fields=["sepa_name", "sepa_iban", "sepa_bic", "mandate_date"]
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("byro_directdebit", "0016_directdebitjob_owner"),
+        ("sepa", "0003_membersepa_mandate_state"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="directdebitpayment",
+            name="mandate_date",
+            field=models.DateField(null=True),
+        ),
+        migrations.AddField(
+            model_name="directdebitpayment",
+            name="sepa_bic",
+            field=models.CharField(blank=True, max_length=11, null=True),
+        ),
+        migrations.AddField(
+            model_name="directdebitpayment",
+            name="sepa_iban",
+            field=models.CharField(max_length=34, null=True),
+        ),
+        migrations.AddField(
+            model_name="directdebitpayment",
+            name="sepa_name",
+            field=models.CharField(max_length=200, null=True),
+        ),
+        migrations.RunPython(copy_debtors, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 3.2.25 on 2026-10-18 17:00
+
+import byro_directdebit.blobs
+from django.core.files.storage import default_storage
+from django.db import migrations, models
+
+
+def _move_files(apps, source, target):
+    DirectDebit = apps.get_model("byro_directdebit", "DirectDebit")
+    names = (
+        DirectDebit.objects.exclude(sepa_xml_file__isnull=True)
+        .exclude(sepa_xml_file="")
+        .values_list("sepa_xml_file", flat=True)
+        .distinct()
+    )
+    for name in names.iterator():
+        if not source.exists(name):
+            continue
+        if not target.exists(name):
+            with source.open(name, "rb") as stored:
+                target.save(name, stored)
+        source.delete(name)
+
+
+def to_private_storage(apps, schema_editor):
+    """Move the SEPA-XML files out of the public media files."""
+    _move_files(apps, default_storage, byro_directdebit.blobs.private_storage)
+
+
+def to_media_storage(apps, schema_editor):
+    _move_files(apps, byro_directdebit.blobs.private_storage, default_storage)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("byro_directdebit", "0017_directdebitpayment_debtor"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="directdebit",
+            name="sepa_xml_file",
+            field=models.FileField(
+                blank=True,
+                null=True,
+                storage=byro_directdebit.blobs.PrivateStorage(),
+                upload_to="byro_directdebit/sepa_xml/",
+                verbose_name="SEPA-XML file",
+            ),
+        ),
+        migrations.RunPython(to_private_storage, to_media_storage),
+    ]
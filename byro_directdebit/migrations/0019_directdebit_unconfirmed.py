@@ -0,0 +1,30 @@
+# Generated by Django 3.2.25 on 2026-10-18 17:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("byro_directdebit", "0018_sepa_xml_private_storage"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="directdebit",
+            name="state",
+            field=models.CharField(
+                choices=[
+                    ("preparing", "Preparing"),
+                    ("unknown", "Unknown"),
+                    ("failed", "Failed"),
+                    ("unconfirmed", "Unconfirmed"),
+                    ("transmitted", "Transmitted"),
+                    ("executed", "Executed"),
+                    ("bounced", "Bounced"),
+                ],
+                default="unknown",
+                max_length=11,
+            ),
+        ),
+    ]
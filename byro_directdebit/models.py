@@ -1,12 +1,18 @@
 import uuid
 from enum import Enum
+from decimal import Decimal
+from typing import BinaryIO, Iterable, Optional, Tuple
 
+from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
 from django.utils.translation import ugettext_lazy as _
 from django.utils.timezone import now
 
 from byro.common.models.configuration import ByroConfiguration
 from byro.common.models import LogTargetMixin
+from byro.members.models import FeeIntervals
+
+from byro_directdebit import blobs
 
 
 class DirectDebitConfiguration(ByroConfiguration):
@@ -47,8 +53,11 @@ class DirectDebitConfiguration(ByroConfiguration):
 
 
 class DirectDebitState(Enum):
+    PREPARING = "preparing"
     UNKNOWN = "unknown"
     FAILED = "failed"
+    # Sent, but the bank's response neither confirmed nor rejected it
+    UNCONFIRMED = "unconfirmed"
     TRANSMITTED = "transmitted"
     EXECUTED = "executed"
     BOUNCED = "bounced"
@@ -63,17 +72,33 @@ class DirectDebit(models.Model, LogTargetMixin):
     multiple = models.BooleanField(default=True)
     cor1 = models.BooleanField(default=False)
 
-    sepa_xml = models.TextField(
-        max_length=1024 * 1024, verbose_name=_("SEPA-XML file"), null=True, blank=True
+    # gzip-compressed and named after the SHA-256 of the uncompressed XML
+    sepa_xml_file = models.FileField(
+        upload_to="byro_directdebit/sepa_xml/",
+        storage=blobs.private_storage,
+        verbose_name=_("SEPA-XML file"),
+        null=True,
+        blank=True,
+    )
+    sepa_xml_sha256 = models.CharField(max_length=64, null=True, blank=True)
+
+    # Totals of the payments, set when the SEPA-XML is written
+    payment_count = models.IntegerField(null=True, blank=True)
+    control_sum = models.DecimalField(
+        max_digits=12, decimal_places=2, null=True, blank=True
     )
+    sequence_type_totals = models.JSONField(default=dict, blank=True)
     pain_descriptor = models.CharField(max_length=1024, null=False, blank=False)
 
     state = models.CharField(
         choices=[
+            (DirectDebitState.PREPARING.value, _("Preparing")),
             (DirectDebitState.UNKNOWN.value, _("Unknown")),
             (DirectDebitState.FAILED.value, _("Failed")),
+            (DirectDebitState.UNCONFIRMED.value, _("Unconfirmed")),
             (DirectDebitState.TRANSMITTED.value, _("Transmitted")),
             (DirectDebitState.EXECUTED.value, _("Executed")),
+            (DirectDebitState.BOUNCED.value, _("Bounced")),
         ],
         default=DirectDebitState.UNKNOWN.value,
         max_length=11,
@@ -83,6 +108,51 @@ class DirectDebit(models.Model, LogTargetMixin):
 
     additional_data = models.JSONField(default=dict)
 
+    class Meta:
+        indexes = [models.Index(fields=["state", "datetime"])]
+
+    def set_totals(self, totals: Iterable[Tuple[str, int, Decimal]]):
+        """Set the totals from ``(sequence type, count, amount)`` rows."""
+        self.sequence_type_totals = {
+            sequence_type: {"count": count, "amount": "{:.2f}".format(amount)}
+            for sequence_type, count, amount in totals
+        }
+        self.payment_count = sum(
+            values["count"] for values in self.sequence_type_totals.values()
+        )
+        self.control_sum = sum(
+            (
+                Decimal(values["amount"])
+                for values in self.sequence_type_totals.values()
+            ),
+            Decimal("0.00"),
+        )
+
+    def check_totals(self, payment_count: int, control_sum: Decimal):
+        """Raise ``ValueError`` unless the totals match those of the SEPA-XML."""
+        if (payment_count, control_sum) != (self.payment_count, self.control_sum):
+            raise ValueError(
+                "The SEPA-XML has {} payments over {}, but the direct debit {} over {}".format(
+                    payment_count, control_sum, self.payment_count, self.control_sum
+                )
+            )
+
+    def store_sepa_xml(self, fileobj: BinaryIO):
+        """Store the SEPA-XML read from ``fileobj``, without saving the debit."""
+        self.sepa_xml_sha256 = blobs.store(self.sepa_xml_file, fileobj)
+
+    def open_sepa_xml(self) -> Optional[BinaryIO]:
+        if not self.sepa_xml_file:
+            return None
+        return blobs.open_blob(self.sepa_xml_file)
+
+    def get_sepa_xml(self) -> Optional[str]:
+        xml = self.open_sepa_xml()
+        if xml is None:
+            return None
+        with xml:
+            return xml.read().decode("utf-8")
+
 
 class DirectDebitPayment(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -100,6 +170,13 @@ class DirectDebitPayment(models.Model):
     collection_date = models.DateTimeField(null=False)
     amount = models.DecimalField(max_digits=10, decimal_places=2)
 
+    # The debtor as of the preparation, the SEPA-XML is written from these
+    # and not from the member's current profile
+    sepa_name = models.CharField(max_length=200, null=True)
+    sepa_iban = models.CharField(max_length=34, null=True)
+    sepa_bic = models.CharField(max_length=11, null=True, blank=True)
+    mandate_date = models.DateField(null=True)
+
     direct_debit = models.ForeignKey(
         to=DirectDebit,
         null=False,
@@ -125,3 +202,139 @@ class DirectDebitPayment(models.Model):
         blank=False,
         null=False,
     )
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["member", "collection_date"]),
+            models.Index(fields=["direct_debit", "state"]),
+            models.Index(fields=["mandate_reference", "state"]),
+        ]
+
+
+class MemberDirectDebitStatus(models.Model):
+    member = models.OneToOneField(
+        to="members.Member",
+        primary_key=True,
+        on_delete=models.CASCADE,
+        related_name="direct_debit_status",
+    )
+    sepa_state = models.CharField(max_length=20, db_index=True)
+    due = models.BooleanField(default=False, db_index=True)
+    # Result of validating the IBAN and BIC, see validation.check_profile()
+    iban_country = models.CharField(max_length=2, blank=True, db_index=True)
+    bic = models.CharField(max_length=11, null=True, blank=True)
+    modified = models.DateTimeField(auto_now=True)
+
+
+class DirectDebitCounter(models.Model):
+    name = models.CharField(max_length=40, unique=True)
+    value = models.IntegerField(default=0)
+    rebuilt = models.DateTimeField(default=now)
+    refreshed = models.DateTimeField(default=now)  # see counters.refresh()
+    modified = models.DateTimeField(default=now)
+
+
+class DirectDebitScope(models.Model):
+    """A saved selection of members for recurring partial runs."""
+
+    name = models.CharField(max_length=100, unique=True, verbose_name=_("Name"))
+    member_numbers = models.CharField(
+        max_length=1000,
+        blank=True,
+        verbose_name=_("Member numbers"),
+        help_text=_(
+            "Only members with these numbers, empty for all. " "Example: 1-5000,7000-"
+        ),
+    )
+    exclude_member_numbers = models.CharField(
+        max_length=1000,
+        blank=True,
+        verbose_name=_("Except member numbers"),
+        help_text=_(
+            "Members with these numbers are left out. Members whose number "
+            "is not a number are never left out."
+        ),
+    )
+    countries = models.CharField(
+        max_length=200,
+        blank=True,
+        verbose_name=_("Bank countries"),
+        help_text=_(
+            "Only members with an IBAN of these countries, empty for all. "
+            "Example: DE,AT"
+        ),
+    )
+    exclude_countries = models.CharField(
+        max_length=200,
+        blank=True,
+        verbose_name=_("Except bank countries"),
+    )
+    fee_intervals = models.JSONField(
+        default=list,
+        blank=True,
+        verbose_name=_("Fee intervals"),
+        help_text=_(
+            "Only members with a membership with one of these fee intervals "
+            "on the debit date, none for all."
+        ),
+    )
+    debit_day = models.PositiveSmallIntegerField(
+        null=True,
+        blank=True,
+        validators=[MinValueValidator(1), MaxValueValidator(31)],
+        verbose_name=_("Debit day"),
+        help_text=_(
+            "Day of the month to suggest as debit date, the next bank day is "
+            "used if it is none."
+        ),
+    )
+
+    class Meta:
+        ordering = ["name"]
+
+    def __str__(self):
+        return self.name
+
+    def get_fee_intervals_display(self) -> str:
+        names = dict(FeeIntervals.choices)
+        return ", ".join(str(names.get(e, e)) for e in self.fee_intervals)
+
+
+class DirectDebitJobState(Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+
+class DirectDebitJob(models.Model):
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    created = models.DateTimeField(default=now, db_index=True)
+    heartbeat = models.DateTimeField(null=True)
+    owner = models.UUIDField(null=True, editable=False)  # see jobs._fenced()
+
+    kind = models.CharField(max_length=20)
+    state = models.CharField(
+        choices=[
+            (DirectDebitJobState.QUEUED.value, _("Queued")),
+            (DirectDebitJobState.RUNNING.value, _("Running")),
+            (DirectDebitJobState.DONE.value, _("Done")),
+            (DirectDebitJobState.FAILED.value, _("Failed")),
+        ],
+        default=DirectDebitJobState.QUEUED.value,
+        max_length=7,
+        db_index=True,
+    )
+
+    parameters = models.JSONField(default=dict)
+    member_ids = models.JSONField(default=list)
+    processed = models.IntegerField(default=0)
+    total = models.IntegerField(default=0)
+    error = models.TextField(null=True, blank=True)
+
+    direct_debit = models.ForeignKey(
+        to=DirectDebit,
+        null=True,
+        on_delete=models.PROTECT,
+        related_name="jobs",
+    )
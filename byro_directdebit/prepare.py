@@ -0,0 +1,385 @@
+import datetime
+from decimal import Decimal
+from tempfile import TemporaryFile
+from typing import BinaryIO, Callable, Iterator, List
+from uuid import uuid4
+
+from django.conf import settings
+from django.db.models import Count, Sum
+from django.utils.timezone import localtime, now
+
+from byro.common.models import Configuration
+from byro.members.models import Member
+
+from byro_directdebit import scopes, selection, sequence, validation
+from byro_directdebit.bulk import bulk_batch_size, save_mails
+from byro_directdebit.models import (
+    DirectDebit,
+    DirectDebitConfiguration,
+    DirectDebitPayment,
+    DirectDebitState,
+)
+from byro_directdebit.rendering import MailRenderer
+from byro_directdebit.sepa_xml import StreamingSepaDD, validate_file
+from byro_directdebit.timing import StageTimer
+
+# Placeholders of the notification mail, the constants are the same for
+# all members of a run
+NOTIFICATION_CONSTANTS = (
+    "creditor_id",
+    "contact",
+    "association_name",
+    "additional_information",
+    "debit_date",
+)
+NOTIFICATION_FIELDS = ("sepa_mandate_reference", "sepa_iban", "sepa_bic", "amount")
+
+CHECKPOINT_KEY = "prepare_checkpoint"
+
+
+def xml_workers() -> int:
+    """Processes for serializing large SEPA-XML files in the job worker."""
+    return getattr(settings, "DIRECTDEBIT_XML_WORKERS", 1)
+
+
+def xml_piece_size() -> int:
+    return getattr(settings, "DIRECTDEBIT_XML_PIECE_SIZE", 2000)
+
+
+class DirectDebitPreparation:
+    """Builds a direct debit from the parameters of the prepare form.
+
+    The work is split so that it can be spread over several transactions:
+    ``create_debit()`` once, ``process_members()`` for each chunk of the
+    member ids from ``select_member_ids()`` and ``finish()`` to assemble the
+    SEPA-XML from the saved payments. The position after the last processed
+    chunk is kept as a checkpoint on the debit, so that a failed run can
+    continue from there.
+
+    ``progress`` is called regularly during the long stages that run
+    outside of a transaction, jobs use it as their heartbeat. With
+    ``xml_workers`` above 1 large SEPA-XML files are serialized in a process
+    pool, which must not be started from a process that serves requests."""
+
+    def __init__(
+        self,
+        parameters: dict,
+        progress: Callable[[], None] = None,
+        xml_workers: int = 1,
+    ):
+        self.parameters = parameters
+        self.progress = progress or (lambda: None)
+        self.xml_workers = xml_workers
+        self.timer = StageTimer("prepare")
+        self.config = DirectDebitConfiguration.get_solo()
+        self.global_config = Configuration.get_solo()
+        self.debit_date = datetime.date.fromisoformat(parameters["debit_date"])
+        self.scopes = [
+            scopes.Scope.from_gates(
+                parameters["exp_bank_types"], parameters["exp_member_numbers"]
+            )
+        ]
+        if parameters.get("scope"):
+            self.scopes.append(scopes.Scope.from_parameters(parameters["scope"]))
+        self.renderer = MailRenderer(
+            self.config.debit_notification_template,
+            {
+                "creditor_id": self.config.creditor_id,
+                "contact": self.global_config.mail_from,
+                "association_name": self.global_config.name,
+                "additional_information": "",
+                "debit_date": self.debit_date,
+            },
+            NOTIFICATION_FIELDS,
+            subject=parameters["subject"],
+            text=parameters["text"],
+            locale=self.global_config.language,
+        )
+
+    @staticmethod
+    def parameters_from_form(cleaned_data, user_login_pk) -> dict:
+        return {
+            "debit_date": cleaned_data["debit_date"].isoformat(),
+            "debit_text": cleaned_data["debit_text"],
+            "own_name": cleaned_data["own_name"],
+            "own_iban": str(cleaned_data["own_iban"]),
+            "own_bic": str(cleaned_data["own_bic"]),
+            "sepa_format": cleaned_data["sepa_format"],
+            "cor1": cleaned_data["cor1"],
+            "exp_bank_types": cleaned_data["exp_bank_types"],
+            "exp_member_numbers": cleaned_data["exp_member_numbers"],
+            "scope": (
+                scopes.Scope.from_saved(cleaned_data["scope"]).as_parameters()
+                if cleaned_data.get("scope")
+                else None
+            ),
+            "subject": cleaned_data["subject"],
+            "text": cleaned_data["text"],
+            "user_login_pk": user_login_pk,
+        }
+
+    def select_member_ids(self) -> List[int]:
+        with self.timer.stage("select") as stage:
+            member_ids = []
+            for chunk in selection.eligible_members(
+                self._scoped(selection.fee_members())
+            ):
+                member_ids.extend(member.pk for member in chunk)
+                self.progress()
+            stage.count = len(member_ids)
+        return member_ids
+
+    def create_debit(self) -> DirectDebit:
+        debit = DirectDebit(
+            datetime=now(),
+            multiple=True,
+            cor1=self.parameters["cor1"],
+            pain_descriptor="urn:iso:std:iso:20022:tech:xsd:"
+            + self.parameters["sepa_format"],
+            state=DirectDebitState.PREPARING.value,
+            additional_data={
+                "user_login_pk": self.parameters["user_login_pk"],
+                "account_iban": self.parameters["own_iban"],
+                "account_bic": self.parameters["own_bic"],
+            },
+        )
+        debit.save()
+        return debit
+
+    def attach(self, debit: DirectDebit):
+        """Continue the timings of an earlier run on ``debit``."""
+        self.timer = StageTimer.for_debit(debit, "prepare")
+
+    def _scoped(self, queryset):
+        return scopes.scoped(queryset, self.scopes, self.debit_date)
+
+    def preview(self, sample_size: int = 20) -> dict:
+        """What a run with these parameters would collect, without writing anything.
+
+        The selection and scopes are the same as in a run, the members are
+        evaluated in keyset chunks like in ``select_member_ids()``."""
+        rows = [
+            (member.pk, *member.values, -member.balance)
+            for chunk in selection.eligible_members(
+                self._scoped(selection.fee_members()).annotate(
+                    memberships_ended=sequence.memberships_ended(self.debit_date)
+                ),
+                fields=(
+                    "number",
+                    "name",
+                    "profile_sepa__iban",
+                    "profile_sepa__mandate_reference",
+                    "memberships_ended",
+                ),
+            )
+            for member in chunk
+        ]
+        resolver = sequence.SequenceTypeResolver(row[4] for row in rows)
+
+        totals = {"by_country": {}, "by_sequence_type": {}}
+        sample = []
+        for pk, number, name, iban, mandate_reference, final, amount in rows:
+            country = iban[:2].upper()
+            sequence_type = resolver.resolve(mandate_reference, final=final)
+            for group, key in (
+                ("by_country", country),
+                ("by_sequence_type", sequence_type),
+            ):
+                total = totals[group].setdefault(key, [0, Decimal("0.00")])
+                total[0] += 1
+                total[1] += amount
+            if len(sample) < sample_size:
+                sample.append(
+                    {
+                        "member": pk,
+                        "number": number,
+                        "name": name,
+                        "country": country,
+                        "sequence_type": sequence_type,
+                        "amount": "%.2f" % amount,
+                    }
+                )
+
+        result = {
+            "count": len(rows),
+            "amount": "%.2f" % sum((row[6] for row in rows), Decimal("0.00")),
+            "currency": self.global_config.currency,
+            "sample": sample,
+        }
+        for group, groups in totals.items():
+            result[group] = {
+                key: {"count": count, "amount": "%.2f" % amount}
+                for key, (count, amount) in sorted(groups.items())
+            }
+        return result
+
+    @staticmethod
+    def get_checkpoint(debit: DirectDebit) -> int:
+        """Number of selected members that were completely processed."""
+        return debit.additional_data.get(CHECKPOINT_KEY, 0)
+
+    def save_checkpoint(self, debit: DirectDebit, processed: int):
+        debit.additional_data[CHECKPOINT_KEY] = processed
+        self.timer.store(debit)
+        debit.save(update_fields=["additional_data"])
+
+    def process_members(self, debit: DirectDebit, member_ids: List[int]) -> int:
+        """Create the payments and notification mails for some members.
+
+        The members are checked again, as they may have changed since they
+        were selected, e.g. when a job is resumed. Those that are no longer
+        eligible are skipped."""
+        with self.timer.stage("load_members") as stage:
+            balances = {
+                member.pk: member.balance
+                for chunk in selection.eligible_members(
+                    self._scoped(selection.fee_members().filter(pk__in=member_ids))
+                )
+                for member in chunk
+            }
+            members = list(
+                Member.objects.filter(pk__in=list(balances))
+                .annotate(memberships_ended=sequence.memberships_ended(self.debit_date))
+                .select_related("profile_sepa")
+                .order_by("-id")
+            )
+            stage.count = len(members)
+        for member in members:
+            member.fee_balance = balances[member.pk]
+
+        with self.timer.stage("sequence_types") as stage:
+            resolver = sequence.SequenceTypeResolver(
+                member.profile_sepa.mandate_reference for member in members
+            )
+            stage.count = len(members)
+
+        payments, mails, mail_members = [], [], []
+        today = now().date()
+        for member in members:
+            with self.timer.stage("bank_lookup") as stage:
+                bic = validation.profile_bic(member.profile_sepa)
+                stage.count = 1
+
+            debit_payment = DirectDebitPayment(
+                id=uuid4(),
+                type=resolver.resolve(
+                    member.profile_sepa.mandate_reference,
+                    final=member.memberships_ended,
+                ),
+                mandate_reference=member.profile_sepa.mandate_reference,
+                collection_date=self.debit_date,
+                amount=-member.fee_balance,
+                direct_debit=debit,
+                member=member,
+                sepa_name=member.name,
+                sepa_iban=member.profile_sepa.iban,
+                sepa_bic=bic,
+                mandate_date=member.profile_sepa.issue_date or today,
+            )
+            payments.append(debit_payment)
+
+            with self.timer.stage("render_mails") as stage:
+                mail = self.renderer.to_mail(
+                    member.email,
+                    sepa_mandate_reference=debit_payment.mandate_reference,
+                    sepa_iban=debit_payment.sepa_iban,
+                    sepa_bic=bic,
+                    amount="%.2f %s"
+                    % (debit_payment.amount, self.global_config.currency),
+                )
+                stage.count = 1
+            mails.append(mail)
+            mail_members.append(member)
+
+        with self.timer.stage("write") as stage:
+            DirectDebitPayment.objects.bulk_create(
+                payments, batch_size=bulk_batch_size()
+            )
+            save_mails(mails, mail_members)
+            stage.count = len(payments)
+
+        return len(payments)
+
+    def _sepa_payment(self, debit_payment: DirectDebitPayment) -> dict:
+        return {
+            "name": debit_payment.sepa_name,
+            "IBAN": debit_payment.sepa_iban,
+            "BIC": debit_payment.sepa_bic,
+            "collection_date": localtime(debit_payment.collection_date).date(),
+            "amount": int(debit_payment.amount * 100),  # in cents
+            "type": debit_payment.type,
+            "mandate_id": debit_payment.mandate_reference,
+            "mandate_date": debit_payment.mandate_date,
+            "description": self.parameters["debit_text"],
+            "endtoend_id": debit_payment.id.hex,
+            # Separate payment information blocks per debtor country
+            "group": debit_payment.sepa_iban[:2].upper(),
+        }
+
+    def _sepa_payments(self, debit: DirectDebit) -> Iterator[dict]:
+        payments = debit.payments.order_by("-member_id").iterator(
+            chunk_size=bulk_batch_size()
+        )
+        for i, debit_payment in enumerate(payments):
+            if i % bulk_batch_size() == 0:
+                self.progress()
+            yield self._sepa_payment(debit_payment)
+
+    def write_xml(self, debit: DirectDebit, sepa_xml: BinaryIO):
+        """Write and validate the SEPA-XML for all saved payments of ``debit``."""
+        dd_config = {
+            "name": self.parameters["own_name"],
+            "IBAN": self.parameters["own_iban"],
+            "BIC": self.parameters["own_bic"],
+            "batch": True,
+            "creditor_id": self.config.creditor_id,
+            "currency": self.global_config.currency,
+            "instrument": "COR1" if self.parameters["cor1"] else "CORE",
+        }
+        sepa = StreamingSepaDD(
+            dd_config, schema=self.parameters["sepa_format"], clean=True
+        )
+
+        debit.set_totals(
+            debit.payments.order_by("type")
+            .values("type")
+            .annotate(count=Count("pk"), amount=Sum("amount"))
+            .values_list("type", "count", "amount")
+        )
+        workers = self.xml_workers if debit.payment_count >= 2 * xml_piece_size() else 1
+        with self.timer.stage("build_xml") as stage:
+            sepa.add_payments(
+                self._sepa_payments(debit),
+                workers=workers,
+                piece_size=xml_piece_size(),
+            )
+            stage.count = sepa.count
+
+        with self.timer.stage("export_xml") as stage:
+            sepa.export(sepa_xml, validate=False)
+            sepa.close()
+            stage.count = sepa.count
+        with self.timer.stage("validate_xml") as stage:
+            sepa_xml.seek(0)
+            group_header = validate_file(sepa_xml, self.parameters["sepa_format"])
+            debit.check_totals(
+                int(group_header["NbOfTxs"]), Decimal(group_header["CtrlSum"])
+            )
+            stage.count = sepa.count
+
+    def store_xml(self, debit: DirectDebit, sepa_xml: BinaryIO):
+        """Store the SEPA-XML from ``write_xml()`` and complete ``debit``."""
+        with self.timer.stage("store_xml") as stage:
+            sepa_xml.seek(0)
+            debit.store_sepa_xml(sepa_xml)
+            stage.count = 1
+        debit.state = DirectDebitState.UNKNOWN.value
+        self.timer.store(debit)
+        debit.save()
+        self.timer.log(debit)
+
+    def finish(self, debit: DirectDebit):
+        """Write and store the SEPA-XML for all saved payments of ``debit``."""
+        with TemporaryFile() as sepa_xml:
+            self.write_xml(debit, sepa_xml)
+            self.store_xml(debit, sepa_xml)
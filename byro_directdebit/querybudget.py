@@ -0,0 +1,94 @@
+import logging
+import re
+from collections import Counter
+from typing import List, Optional
+
+from django.conf import settings
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+logger = logging.getLogger(__name__)
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PARAMETER_LIST = re.compile(r"\((?:\s*(?:\?|%s)\s*,)+\s*(?:\?|%s)\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+# byro's log chain can only be appended one entry at a time (see
+# bulk.log_many), so its inserts grow with the number of objects written and
+# are not counted against the budgets.
+_UNBUDGETED = re.compile(r'^\s*INSERT INTO "common_logentry"', re.IGNORECASE)
+# The same holds for mails on databases that do not report the primary keys
+# of a bulk insert (see bulk.save_mails).
+_UNBUDGETED_MAILS = re.compile(r'^\s*INSERT INTO "mails_email"', re.IGNORECASE)
+
+
+def sql_shape(sql: str) -> str:
+    """The SQL with all literal values replaced, to spot repeated queries."""
+    sql = _STRING_LITERAL.sub("?", sql)
+    sql = _NUMBER.sub("?", sql)
+    sql = _PARAMETER_LIST.sub("(...)", sql)
+    return _WHITESPACE.sub(" ", sql).strip()
+
+
+def repeated_shapes(queries: List[dict], minimum=2):
+    """``(count, shape)`` of the query shapes that ran at least ``minimum`` times."""
+    shapes = Counter(sql_shape(query["sql"]) for query in queries)
+    return [(count, shape) for shape, count in shapes.most_common() if count >= minimum]
+
+
+def budgeted(queries: List[dict]) -> List[dict]:
+    """The queries that count against a ``query_budget``."""
+    unbudgeted = [_UNBUDGETED]
+    if not connection.features.can_return_rows_from_bulk_insert:
+        unbudgeted.append(_UNBUDGETED_MAILS)
+    return [
+        query
+        for query in queries
+        if not any(pattern.match(query["sql"]) for pattern in unbudgeted)
+    ]
+
+
+def get_query_budget(view_func) -> Optional[int]:
+    view_class = getattr(view_func, "view_class", None)
+    if not view_class or not view_class.__module__.startswith("byro_directdebit."):
+        return None
+    return getattr(view_class, "query_budget", None)
+
+
+def budget_report(name, queries: List[dict], budget: int) -> str:
+    lines = ["{} ran {} queries, its budget is {}.".format(name, len(queries), budget)]
+    for count, shape in repeated_shapes(queries)[:5]:
+        lines.append("  {}x {}".format(count, shape[:300]))
+    return "\n".join(lines)
+
+
+class QueryBudgetMiddleware:
+    """Warn about plugin views that run more queries than their ``query_budget``.
+
+    Only active with ``DEBUG``. Add
+    ``"byro_directdebit.querybudget.QueryBudgetMiddleware"`` to ``MIDDLEWARE``
+    to use it."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.DEBUG:
+            return self.get_response(request)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.get_response(request)
+
+        match = getattr(request, "resolver_match", None)
+        budget = get_query_budget(match.func) if match else None
+        if budget is not None:
+            counted = budgeted(queries.captured_queries)
+            if len(counted) > budget:
+                logger.warning(
+                    budget_report(
+                        "{} {}".format(request.method, request.path), counted, budget
+                    )
+                )
+
+        return response
@@ -0,0 +1,123 @@
+import re
+from string import Formatter
+from typing import Dict, Iterable
+
+from django.utils.translation import override
+
+from byro.common.models import Configuration
+from byro.mails.models import EMail, MailTemplate
+
+_formatter = Formatter()
+_FIELD_ROOT = re.compile(r"[^.\[]*")
+
+
+class TemplateError(ValueError):
+    pass
+
+
+def _parse(format_string: str, names: Iterable[str]):
+    names = set(names)
+    try:
+        parsed = list(_formatter.parse(format_string))
+    except ValueError as e:
+        raise TemplateError(str(e)) from e
+
+    for literal, field_name, format_spec, conversion in parsed:
+        root = None
+        if field_name is not None:
+            root = _FIELD_ROOT.match(field_name).group(0)
+            if root not in names:
+                raise TemplateError(
+                    "Unknown placeholder {{{}}}".format(field_name)
+                    if root
+                    else "Placeholders need a name"
+                )
+        yield literal, field_name, format_spec, conversion, root
+
+
+def check_placeholders(format_string: str, names: Iterable[str]):
+    """Raise ``TemplateError`` if ``format_string`` uses an unknown placeholder."""
+    for _part in _parse(format_string, names):
+        pass
+
+
+class CompiledFormat:
+    """A ``str.format`` template with some of the placeholders filled in.
+
+    The placeholders in ``constants`` are rendered once, ``render()`` then
+    only has to fill in the remaining ``fields``."""
+
+    def __init__(self, format_string: str, constants: Dict, fields: Iterable[str]):
+        self.parts = []
+        literal = []
+        for text, field_name, format_spec, conversion, root in _parse(
+            format_string, set(constants) | set(fields)
+        ):
+            literal.append(text)
+            if field_name is None:
+                continue
+
+            fragment = "{{{}{}{}}}".format(
+                field_name,
+                "!" + conversion if conversion else "",
+                ":" + format_spec if format_spec else "",
+            )
+            if root in constants:
+                try:
+                    literal.append(fragment.format_map(constants))
+                except (ValueError, LookupError, AttributeError) as e:
+                    raise TemplateError(
+                        "Cannot render {}: {}".format(fragment, e)
+                    ) from e
+            else:
+                self.parts.append("".join(literal))
+                self.parts.append(fragment)
+                literal = []
+        self.parts.append("".join(literal))
+
+    def render(self, values: Dict) -> str:
+        # Literals and fragments alternate, starting with a literal
+        return "".join(
+            part.format_map(values) if i % 2 else part
+            for i, part in enumerate(self.parts)
+        )
+
+
+class MailRenderer:
+    """Builds unsaved mails like ``MailTemplate.to_mail()`` for many members.
+
+    Like there, the template is rendered in ``locale``, by default the
+    language of the byro configuration."""
+
+    def __init__(
+        self,
+        template: MailTemplate,
+        constants: Dict,
+        fields: Iterable[str],
+        subject: str = None,
+        text: str = None,
+        locale: str = None,
+    ):
+        fields = list(fields)
+        self.template = template
+        self.locale = locale or Configuration.get_solo().language
+        with override(self.locale):
+            self.subject = CompiledFormat(
+                str(template.subject) if subject is None else subject,
+                constants,
+                fields,
+            )
+            self.text = CompiledFormat(
+                str(template.text) if text is None else text, constants, fields
+            )
+
+    def to_mail(self, email, **values) -> EMail:
+        with override(self.locale):
+            return EMail(
+                to=email,
+                reply_to=self.template.reply_to,
+                bcc=self.template.bcc,
+                subject=self.subject.render(values),
+                text=self.text.render(values),
+                template=self.template,
+            )
@@ -0,0 +1,186 @@
+import logging
+import uuid
+from collections import Counter, defaultdict
+from itertools import islice
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Set, Tuple
+
+from django.db.models import Count
+from django.db.transaction import atomic
+from lxml import etree
+
+from byro_directdebit import bulk
+from byro_directdebit.models import DirectDebit, DirectDebitPayment, DirectDebitState
+
+EXECUTED = DirectDebitState.EXECUTED.value
+BOUNCED = DirectDebitState.BOUNCED.value
+
+logger = logging.getLogger(__name__)
+
+# pain.002 transaction statuses that are final. The others (ACCP, ACTC,
+# ACSP, PDNG, …) only say that the bank is still processing the payment.
+PAIN002_STATES = {
+    "ACCC": EXECUTED,
+    "ACSC": EXECUTED,
+    "RJCT": BOUNCED,
+    "CANC": BOUNCED,
+}
+
+
+def _local_name(element) -> str:
+    return etree.QName(element).localname
+
+
+def _child_text(element, *path: str) -> str:
+    for name in path:
+        element = next(
+            (
+                child
+                for child in element
+                if isinstance(child.tag, str) and _local_name(child) == name
+            ),
+            None,
+        )
+        if element is None:
+            return ""
+    return "".join(element.itertext()).strip()
+
+
+def parse_status_report(fileobj: BinaryIO) -> Iterator[Tuple[str, str]]:
+    """Yield ``(end to end id, payment state)`` from a pain.002 or camt.054 file.
+
+    The file is parsed incrementally and every transaction is dropped from
+    the tree once it has been read, so the memory use does not grow with
+    the size of the file. Only transaction level statuses are reported:
+    pain.002 statuses that are not final and camt.054 entries that are not
+    booked yet are skipped. Raises ``ValueError`` for malformed files."""
+    entry_reversal = entry_pending = False
+    try:
+        for _event, element in etree.iterparse(
+            fileobj, events=("end",), resolve_entities=False, no_network=True
+        ):
+            name = _local_name(element)
+            parent = element.getparent()
+            parent_name = _local_name(parent) if parent is not None else None
+
+            if name == "TxInfAndSts":  # pain.002
+                state = PAIN002_STATES.get(_child_text(element, "TxSts"))
+                endtoend_id = _child_text(element, "OrgnlEndToEndId")
+                if state and endtoend_id:
+                    yield endtoend_id, state
+            elif name == "RvslInd" and parent_name == "Ntry":  # camt.054
+                entry_reversal = (element.text or "").strip() == "true"
+            elif name == "Sts" and parent_name == "Ntry":
+                # <Sts>BOOK</Sts> up to camt.054.001.07, <Sts><Cd>BOOK</Cd></Sts> later
+                entry_pending = "".join(element.itertext()).strip() != "BOOK"
+            elif name == "TxDtls":
+                endtoend_id = _child_text(element, "Refs", "EndToEndId")
+                if endtoend_id and not entry_pending:
+                    returned = entry_reversal or _child_text(element, "RtrInf") != ""
+                    yield endtoend_id, BOUNCED if returned else EXECUTED
+            elif name == "Ntry":
+                entry_reversal = entry_pending = False
+
+            if name in ("TxInfAndSts", "TxDtls", "Ntry") and parent is not None:
+                parent.remove(element)
+    except etree.LxmlError as e:
+        raise ValueError("Not a valid pain.002 or camt.054 file: {}".format(e)) from e
+
+
+class ReturnsImport:
+    """The outcome of importing status reports."""
+
+    def __init__(self):
+        self.entries = 0
+        self.updated: Counter = Counter()  # payments per new state
+        self.unmatched: List[str] = []  # end to end ids without a payment
+        self.debit_states: Dict[str, str] = {}  # new state per debit id
+        self.debit_counts: Dict[uuid.UUID, Counter] = defaultdict(Counter)
+
+
+def _batches(iterable: Iterable, size: int) -> Iterator[list]:
+    iterator = iter(iterable)
+    return iter(lambda: list(islice(iterator, size)), [])
+
+
+def _update_payments(batch: List[Tuple[str, str]], result: ReturnsImport):
+    states = {}
+    for endtoend_id, state in batch:
+        # A return overrides an earlier settlement of the same payment
+        if states.get(endtoend_id) != BOUNCED:
+            states[endtoend_id] = state
+
+    payment_ids = {}
+    for endtoend_id in states:
+        try:
+            payment_ids[uuid.UUID(hex=endtoend_id)] = endtoend_id
+        except ValueError:
+            result.unmatched.append(endtoend_id)
+
+    changes = defaultdict(list)
+    found = set()
+    for pk, debit_id, current in DirectDebitPayment.objects.filter(
+        pk__in=payment_ids
+    ).values_list("pk", "direct_debit_id", "state"):
+        found.add(pk)
+        state = states[payment_ids[pk]]
+        if current in (state, BOUNCED):
+            continue
+        changes[state].append(pk)
+        result.debit_counts[debit_id][state] += 1
+
+    result.unmatched.extend(
+        endtoend_id for pk, endtoend_id in payment_ids.items() if pk not in found
+    )
+    for state, pks in changes.items():
+        DirectDebitPayment.objects.filter(pk__in=pks).update(state=state)
+        result.updated[state] += len(pks)
+
+
+def _update_debits(debit_ids: Set[uuid.UUID], result: ReturnsImport):
+    """Mark debits executed once all payments are settled, bounced if all bounced."""
+    states = defaultdict(set)
+    for row in (
+        DirectDebitPayment.objects.filter(direct_debit_id__in=debit_ids)
+        .values("direct_debit_id", "state")
+        .annotate(count=Count("pk"))
+        .order_by()
+    ):
+        states[row["direct_debit_id"]].add(row["state"])
+
+    changes = defaultdict(list)
+    for debit_id, payment_states in states.items():
+        if payment_states == {BOUNCED}:
+            changes[BOUNCED].append(debit_id)
+        elif payment_states <= {EXECUTED, BOUNCED}:
+            changes[EXECUTED].append(debit_id)
+
+    for state, pks in changes.items():
+        DirectDebit.objects.filter(pk__in=pks).update(state=state)
+        result.debit_states.update((str(pk), state) for pk in pks)
+
+
+def import_status_report(fileobj: BinaryIO) -> ReturnsImport:
+    """Set the payment states from a pain.002 or camt.054 file.
+
+    Payments are matched by their end to end id, the hex form of their
+    primary key, and updated in batches of ``DIRECTDEBIT_BULK_BATCH_SIZE``
+    entries with one select and one update per new state. Afterwards the
+    states of the affected direct debits are updated."""
+    result = ReturnsImport()
+    with atomic():
+        for batch in _batches(parse_status_report(fileobj), bulk.bulk_batch_size()):
+            result.entries += len(batch)
+            _update_payments(batch, result)
+
+        if result.debit_counts:
+            _update_debits(set(result.debit_counts), result)
+
+    for debit_id, counts in result.debit_counts.items():
+        logger.info(
+            "Direct debit %s: %s payments executed, %s bounced, state %s",
+            debit_id,
+            counts[EXECUTED],
+            counts[BOUNCED],
+            result.debit_states.get(str(debit_id), "unchanged"),
+        )
+    return result
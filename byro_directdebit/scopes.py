@@ -0,0 +1,220 @@
+"""Which members a direct debit run covers.
+
+A ``Scope`` combines member number ranges, debtor countries and membership
+fee intervals. It is compiled into a filter on ``Member``, so that a scoped
+run only loads the members it covers. Saved scopes (``DirectDebitScope``)
+allow recurring partial runs, e.g. members 1-5000 on the 1st and the rest
+on the 15th of a month."""
+
+import datetime
+import operator
+from functools import reduce
+from typing import FrozenSet, Iterable, NamedTuple, Optional, Tuple
+
+from django.db.models import (
+    BigIntegerField,
+    Case,
+    Exists,
+    OuterRef,
+    Q,
+    QuerySet,
+    When,
+)
+from django.db.models.functions import Cast, Trim
+
+from byro.members.models import Membership
+
+NUMBER_ANNOTATION = "number_value"
+
+# Member numbers that are compared as numbers, longer ones do not fit into
+# a 64 bit integer
+NUMERIC_NUMBER = r"^ *[0-9]{1,18} *$"
+
+Range = Tuple[Optional[int], Optional[int]]  # None for an open end
+
+
+def parse_member_numbers(text: str) -> Tuple[Range, ...]:
+    """``"1-9, 20-29,42,5000-"`` → sorted, disjoint ranges.
+
+    ``a-`` and ``-b`` are open ranges. Overlapping and adjacent ranges are
+    merged. Raises ``ValueError`` for anything else."""
+    ranges = []
+    for part in (text or "").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        lower, dash, upper = part.partition("-")
+        try:
+            lower = int(lower) if lower.strip() else None
+            upper = int(upper) if upper.strip() else None
+        except ValueError:
+            raise ValueError("Invalid member number range: {}".format(part))
+        if not dash:
+            upper = lower
+        if lower is None and upper is None:
+            raise ValueError("Invalid member number range: {}".format(part))
+        if lower is not None and upper is not None and lower > upper:
+            raise ValueError("Empty member number range: {}".format(part))
+        ranges.append((lower, upper))
+
+    merged = []
+    for lower, upper in sorted(ranges, key=lambda r: -1 if r[0] is None else r[0]):
+        if merged:
+            last_lower, last_upper = merged[-1]
+            if last_upper is None or lower is None or lower <= last_upper + 1:
+                if last_upper is not None and (upper is None or upper > last_upper):
+                    merged[-1] = (last_lower, upper)
+                continue
+        merged.append((lower, upper))
+    return tuple(merged)
+
+
+def format_member_numbers(ranges: Iterable[Range]) -> str:
+    return ",".join(
+        (
+            str(lower)
+            if lower == upper
+            else "{}-{}".format(
+                "" if lower is None else lower, "" if upper is None else upper
+            )
+        )
+        for lower, upper in ranges
+    )
+
+
+def parse_countries(text: str) -> FrozenSet[str]:
+    """``"de, AT"`` → ``{"DE", "AT"}``, raises ``ValueError`` for other entries."""
+    countries = frozenset(
+        part.strip().upper() for part in (text or "").split(",") if part.strip()
+    )
+    for country in countries:
+        if len(country) != 2 or not country.isalpha():
+            raise ValueError("Invalid country code: {}".format(country))
+    return countries
+
+
+def number_value() -> Case:
+    """The member number as an integer, NULL if it is not numeric.
+
+    The cast only happens for numeric numbers, so that databases that fail
+    on invalid casts do not see the others."""
+    return Case(
+        When(
+            number__regex=NUMERIC_NUMBER, then=Cast(Trim("number"), BigIntegerField())
+        ),
+        default=None,
+        output_field=BigIntegerField(),
+    )
+
+
+def _in_ranges(ranges: Iterable[Range]) -> Q:
+    return reduce(
+        operator.or_,
+        (
+            (
+                Q(**{NUMBER_ANNOTATION + "__lte": upper})
+                if lower is None
+                else (
+                    Q(**{NUMBER_ANNOTATION + "__gte": lower})
+                    if upper is None
+                    else Q(**{NUMBER_ANNOTATION + "__range": (lower, upper)})
+                )
+            )
+            for lower, upper in ranges
+        ),
+    )
+
+
+def _with_country(countries: Iterable[str]) -> Q:
+    return reduce(
+        operator.or_,
+        (Q(profile_sepa__iban__istartswith=country) for country in sorted(countries)),
+    )
+
+
+class Scope(NamedTuple):
+    member_numbers: Tuple[Range, ...] = ()  # empty for all
+    exclude_member_numbers: Tuple[Range, ...] = ()
+    countries: FrozenSet[str] = frozenset()  # debtor IBAN countries, empty for all
+    exclude_countries: FrozenSet[str] = frozenset()
+    fee_intervals: FrozenSet[int] = frozenset()  # of a current membership
+
+    @classmethod
+    def from_gates(cls, bank_types: str, member_numbers: str) -> "Scope":
+        """The experimental options of the prepare form."""
+        return cls(
+            member_numbers=parse_member_numbers(member_numbers),
+            countries=frozenset(["DE"]) if bank_types == "DE" else frozenset(),
+            exclude_countries=frozenset(["DE"]) if bank_types == "NDE" else frozenset(),
+        )
+
+    @classmethod
+    def from_saved(cls, saved) -> "Scope":
+        """The scope of a ``DirectDebitScope``."""
+        return cls(
+            member_numbers=parse_member_numbers(saved.member_numbers),
+            exclude_member_numbers=parse_member_numbers(saved.exclude_member_numbers),
+            countries=parse_countries(saved.countries),
+            exclude_countries=parse_countries(saved.exclude_countries),
+            fee_intervals=frozenset(saved.fee_intervals),
+        )
+
+    @classmethod
+    def from_parameters(cls, parameters: dict) -> "Scope":
+        return cls(
+            member_numbers=parse_member_numbers(parameters["member_numbers"]),
+            exclude_member_numbers=parse_member_numbers(
+                parameters["exclude_member_numbers"]
+            ),
+            countries=frozenset(parameters["countries"]),
+            exclude_countries=frozenset(parameters["exclude_countries"]),
+            fee_intervals=frozenset(parameters["fee_intervals"]),
+        )
+
+    def as_parameters(self) -> dict:
+        """A JSON serializable form, for the parameters of a job."""
+        return {
+            "member_numbers": format_member_numbers(self.member_numbers),
+            "exclude_member_numbers": format_member_numbers(
+                self.exclude_member_numbers
+            ),
+            "countries": sorted(self.countries),
+            "exclude_countries": sorted(self.exclude_countries),
+            "fee_intervals": sorted(self.fee_intervals),
+        }
+
+    def filter(self, queryset: QuerySet, at: datetime.date) -> QuerySet:
+        """Restrict a ``Member`` queryset to the scope, ``at`` the debit date."""
+        if self.member_numbers or self.exclude_member_numbers:
+            queryset = queryset.annotate(**{NUMBER_ANNOTATION: number_value()})
+        if self.member_numbers:
+            queryset = queryset.filter(_in_ranges(self.member_numbers))
+        if self.exclude_member_numbers:
+            # Members without a numeric number are outside of every range
+            queryset = queryset.filter(
+                Q(**{NUMBER_ANNOTATION: None})
+                | ~_in_ranges(self.exclude_member_numbers)
+            )
+        if self.countries:
+            queryset = queryset.filter(_with_country(self.countries))
+        if self.exclude_countries:
+            queryset = queryset.exclude(_with_country(self.exclude_countries))
+        if self.fee_intervals:
+            queryset = queryset.filter(
+                Exists(
+                    Membership.objects.filter(
+                        Q(end__isnull=True) | Q(end__gte=at),
+                        member=OuterRef("pk"),
+                        start__lte=at,
+                        interval__in=sorted(self.fee_intervals),
+                    )
+                )
+            )
+        return queryset
+
+
+def scoped(queryset: QuerySet, scopes: Iterable[Scope], at: datetime.date) -> QuerySet:
+    """Restrict a ``Member`` queryset to the members in all of ``scopes``."""
+    for scope in scopes:
+        queryset = scope.filter(queryset, at)
+    return queryset
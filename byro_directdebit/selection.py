@@ -0,0 +1,223 @@
+import operator
+from collections import Counter
+from decimal import Decimal
+from functools import reduce
+from itertools import chain
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from django.db.models import Exists, OuterRef, Q, QuerySet, Sum
+from django.utils.timezone import now
+
+from byro.bookkeeping.models import Booking
+from byro.bookkeeping.special_accounts import SpecialAccounts
+from byro.members.models import Member, Membership
+from byro.plugins.sepa.models import SepaDirectDebitState
+
+from byro_directdebit import validation
+from byro_directdebit.bulk import bulk_batch_size
+
+SEPA_STATE_FIELDS = (
+    "profile_sepa__iban",
+    "profile_sepa__bic",
+    "profile_sepa__mandate_state",
+    "profile_sepa__mandate_reference",
+)
+
+_HAS_IBAN = ~Q(profile_sepa__iban__isnull=True) & ~Q(profile_sepa__iban="")
+_HAS_MANDATE_REFERENCE = ~Q(profile_sepa__mandate_reference__isnull=True) & ~Q(
+    profile_sepa__mandate_reference=""
+)
+_MANDATE_ACTIVE = ~Q(
+    profile_sepa__mandate_state__in=["rescinded", "bounced", "inactive"]
+)
+
+# Necessary conditions on the profile columns for each state. Only NO_IBAN is
+# fully decided by them, all other states additionally depend on the IBAN/BIC
+# actually being valid, which is checked in Python on the narrowed candidates.
+SEPA_STATE_PREFILTERS = {
+    SepaDirectDebitState.NO_IBAN: ~_HAS_IBAN,
+    SepaDirectDebitState.INVALID_IBAN: _HAS_IBAN,
+    SepaDirectDebitState.RESCINDED: _HAS_IBAN
+    & Q(profile_sepa__mandate_state="rescinded"),
+    SepaDirectDebitState.BOUNCED: _HAS_IBAN & Q(profile_sepa__mandate_state="bounced"),
+    SepaDirectDebitState.INACTIVE: _HAS_IBAN
+    & Q(profile_sepa__mandate_state="inactive"),
+    SepaDirectDebitState.NO_BIC: _HAS_IBAN & _MANDATE_ACTIVE,
+    SepaDirectDebitState.INVALID_BIC: _HAS_IBAN & _MANDATE_ACTIVE,
+    SepaDirectDebitState.NO_MANDATE_REFERENCE: _HAS_IBAN
+    & _MANDATE_ACTIVE
+    & ~_HAS_MANDATE_REFERENCE,
+    SepaDirectDebitState.OK: _HAS_IBAN & _MANDATE_ACTIVE & _HAS_MANDATE_REFERENCE,
+}
+
+
+def fee_members(fees_receivable=None) -> QuerySet:
+    """All members with a paid membership or a booked membership fee."""
+    fees_receivable = fees_receivable or SpecialAccounts.fees_receivable
+    return Member.objects.filter(
+        Exists(Membership.objects.filter(member=OuterRef("pk"), amount__gt=0))
+        | Exists(
+            Booking.objects.filter(member=OuterRef("pk"), debit_account=fees_receivable)
+        )
+    )
+
+
+def fee_balances(
+    at=None, fees_receivable=None, member_ids: Optional[Iterable[int]] = None
+) -> Dict[int, Decimal]:
+    """The ``fee_balance`` of every member with fee bookings, in one grouped query.
+
+    Members without bookings have a balance of zero. With ``member_ids`` only
+    those members are summed."""
+    at = at or now()
+    fees_receivable = fees_receivable or SpecialAccounts.fees_receivable
+    bookings = Booking.objects.all()
+    if member_ids is not None:
+        bookings = bookings.filter(member_id__in=list(member_ids))
+    return {
+        member_id: (credit or Decimal("0.00")) - (debit or Decimal("0.00"))
+        for member_id, credit, debit in bookings.filter(
+            Q(credit_account=fees_receivable) | Q(debit_account=fees_receivable),
+            member__isnull=False,
+            transaction__value_datetime__lte=at,
+        )
+        .order_by()
+        .values("member")
+        .annotate(
+            credit=Sum("amount", filter=Q(credit_account=fees_receivable)),
+            debit=Sum("amount", filter=Q(debit_account=fees_receivable)),
+        )
+        .values_list("member", "credit", "debit")
+    }
+
+
+def in_sepa_state(queryset: QuerySet, *states: SepaDirectDebitState) -> QuerySet:
+    """Restrict ``queryset`` to members whose stored SEPA state is one of ``states``.
+
+    The states are the ones kept by ``counters``, which only covers members
+    with a membership fee and may be out of date, see
+    ``counters.get_counters()``. To evaluate the profiles themselves use
+    ``member_state_chunks()``."""
+    return queryset.filter(
+        direct_debit_status__sepa_state__in=[state.name for state in states]
+    )
+
+
+def keyset_chunks(queryset: QuerySet, *fields, size=None) -> Iterator[List[tuple]]:
+    """Yield the ``("pk", *fields)`` rows of ``queryset`` in chunks, newest first.
+
+    Each chunk is a separate query continuing after the last primary key of
+    the previous one, so that neither the rows nor a list of primary keys
+    have to be held for all members at once."""
+    queryset = queryset.order_by("-id")
+    size = size or bulk_batch_size()
+    after = None
+    while True:
+        chunk = queryset if after is None else queryset.filter(pk__lt=after)
+        rows = list(chunk.values_list("pk", *fields)[:size])
+        if not rows:
+            return
+        yield rows
+        after = rows[-1][0]
+
+
+class MemberState(NamedTuple):
+    pk: int
+    state: SepaDirectDebitState
+    balance: Decimal
+    check: validation.ProfileCheck
+    iban: Optional[str]
+    mandate_reference: Optional[str]
+    values: tuple  # the additional ``fields``
+
+    @property
+    def due(self) -> bool:
+        return self.balance < 0
+
+
+def member_state_chunks(
+    queryset: Optional[QuerySet] = None,
+    states: Iterable[SepaDirectDebitState] = (),
+    fees_receivable=None,
+    fields: Iterable[str] = (),
+) -> Iterator[List[MemberState]]:
+    """Evaluate the SEPA state and balance of members, one keyset chunk at a time.
+
+    With ``states`` the members are narrowed by the profile columns in the
+    database first and only the members in one of ``states`` are yielded.
+    ``fields`` are fetched along as ``MemberState.values``."""
+    fees_receivable = fees_receivable or SpecialAccounts.fees_receivable
+    queryset = fee_members(fees_receivable) if queryset is None else queryset
+    states = set(states)
+    if states:
+        queryset = queryset.filter(
+            reduce(operator.or_, (SEPA_STATE_PREFILTERS[state] for state in states))
+        )
+    fields = tuple(fields)
+
+    for rows in keyset_chunks(queryset, *SEPA_STATE_FIELDS, *fields):
+        balances = fee_balances(
+            fees_receivable=fees_receivable, member_ids=[row[0] for row in rows]
+        )
+        checks = validation.check_profiles((row[1], row[2]) for row in rows)
+        chunk = []
+        for pk, iban, bic, mandate_state, mandate_reference, *values in rows:
+            check = checks[(iban, bic)]
+            state = validation.sepa_state(
+                check, iban, mandate_state or "active", mandate_reference
+            )
+            if states and state not in states:
+                continue
+            chunk.append(
+                MemberState(
+                    pk,
+                    state,
+                    balances.get(pk, Decimal("0.00")),
+                    check,
+                    iban,
+                    mandate_reference,
+                    tuple(values),
+                )
+            )
+        if chunk:
+            yield chunk
+
+
+def member_sepa_states(
+    queryset: Optional[QuerySet] = None, fees_receivable=None
+) -> Iterator[MemberState]:
+    """Yield the ``MemberState`` of every member, see ``member_state_chunks()``."""
+    return chain.from_iterable(
+        member_state_chunks(queryset, fees_receivable=fees_receivable)
+    )
+
+
+def eligible_members(
+    queryset: Optional[QuerySet] = None, fields: Iterable[str] = ()
+) -> Iterator[List[MemberState]]:
+    """Chunks of the members with a due balance and usable SEPA direct debit information."""
+    for chunk in member_state_chunks(
+        queryset, states=[SepaDirectDebitState.OK], fields=fields
+    ):
+        chunk = [member for member in chunk if member.due]
+        if chunk:
+            yield chunk
+
+
+def sepa_state_counts(
+    queryset: Optional[QuerySet] = None,
+) -> Tuple[int, int, Counter, Counter]:
+    """Count members per SEPA state, see ``member_state_chunks()``.
+
+    Returns the number of members, the number of members with a due balance
+    and the per-state counts for both groups."""
+    total, due_total = 0, 0
+    counts, due_counts = Counter(), Counter()
+    for member in member_sepa_states(queryset):
+        total += 1
+        counts[member.state] += 1
+        if member.due:
+            due_total += 1
+            due_counts[member.state] += 1
+
+    return total, due_total, counts, due_counts
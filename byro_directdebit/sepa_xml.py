@@ -0,0 +1,337 @@
+import datetime
+import os
+import shutil
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from tempfile import SpooledTemporaryFile
+from typing import BinaryIO, Dict, Iterable, List, Tuple
+
+from lxml import etree
+from sepaxml.utils import int_to_decimal_str, make_id, make_msg_id
+from sepaxml.validation import ValidationError
+from text_unidecode import unidecode
+
+XSI_NAMESPACE = "http://www.w3.org/2001/XMLSchema-instance"
+PAIN_NAMESPACE_PREFIX = "urn:iso:std:iso:20022:tech:xsd:"
+
+
+def _element(tag, *children, text=None, **attrib):
+    element = etree.Element(tag, **attrib)
+    element.text = text
+    element.extend(children)
+    return element
+
+
+def _transaction_element(config, clean, payment):
+    if not isinstance(payment["amount"], int):
+        raise Exception("Payment did not validate: AMOUNT_NOT_INTEGER")
+    for key in ("mandate_date", "collection_date"):
+        if not isinstance(payment[key], datetime.date):
+            raise Exception(
+                "Payment did not validate: {}_INVALID_OR_NOT_DATETIME_INSTANCE".format(
+                    key.upper()
+                )
+            )
+
+    name, description = payment["name"], payment["description"]
+    if clean:
+        name = unidecode(name)[:70]
+        description = unidecode(description)[:140]
+
+    return _element(
+        "DrctDbtTxInf",
+        _element(
+            "PmtId",
+            _element(
+                "EndToEndId",
+                text=payment.get("endtoend_id") or make_id(config["name"]),
+            ),
+        ),
+        _element(
+            "InstdAmt",
+            text=int_to_decimal_str(payment["amount"]),
+            Ccy=config["currency"],
+        ),
+        _element(
+            "DrctDbtTx",
+            _element(
+                "MndtRltdInf",
+                _element("MndtId", text=payment["mandate_id"]),
+                _element("DtOfSgntr", text=str(payment["mandate_date"])),
+            ),
+        ),
+        _element(
+            "DbtrAgt",
+            _element(
+                "FinInstnId",
+                *([_element("BIC", text=payment["BIC"])] if payment.get("BIC") else [])
+            ),
+        ),
+        _element("Dbtr", _element("Nm", text=name)),
+        _element("DbtrAcct", _element("Id", _element("IBAN", text=payment["IBAN"]))),
+        _element("RmtInf", _element("Ustrd", text=description)),
+    )
+
+
+def serialize_payments(config, clean, payments: List[dict]) -> Tuple[bytes, int, int]:
+    """The ``DrctDbtTxInf`` elements of ``payments``, their count and sum.
+
+    A module level function, so that it can run in a worker process."""
+    transactions = b"".join(
+        etree.tostring(_transaction_element(config, clean, payment), encoding="utf-8")
+        for payment in payments
+    )
+    return transactions, len(payments), sum(payment["amount"] for payment in payments)
+
+
+class _Batch:
+    def __init__(self, spool_size):
+        self.transactions = SpooledTemporaryFile(max_size=spool_size)
+        self.count = 0
+        self.total = 0
+
+
+class StreamingSepaDD:
+    """A pain.008 writer with the payment interface of ``sepaxml.SepaDD``.
+
+    Transactions are serialized as soon as they are added and spooled per
+    payment information block (to disk once a block exceeds ``spool_size``
+    bytes), while counts and control sums are accumulated along the way.
+    ``export()`` then streams the finished document into a file object.
+
+    Payments get a block per sequence type, collection date and the optional
+    ``group`` of the payment, e.g. the debtor's country."""
+
+    root_el = "CstmrDrctDbtInitn"
+
+    def __init__(
+        self, config, schema="pain.008.002.02", clean=True, spool_size=1024 * 1024
+    ):
+        missing = [
+            key
+            for key in ("name", "IBAN", "BIC", "batch", "creditor_id", "currency")
+            if key not in config
+        ]
+        if missing:
+            raise Exception(
+                "Config file did not validate. "
+                + " ".join("{}_MISSING".format(key.upper()) for key in missing)
+            )
+
+        self._config = dict(config)
+        self._config.setdefault("instrument", "CORE")
+        if clean:
+            self._config["name"] = unidecode(self._config["name"])[:70]
+
+        self.schema = schema
+        self.clean = clean
+        self.msg_id = make_msg_id()
+        self.spool_size = spool_size
+        self._batches = OrderedDict()
+
+    @property
+    def count(self) -> int:
+        return sum(batch.count for batch in self._batches.values())
+
+    @property
+    def total(self) -> int:
+        """Control sum of all added payments, in cents."""
+        return sum(batch.total for batch in self._batches.values())
+
+    def _batch_key(self, payment):
+        key = (payment["type"], str(payment["collection_date"]), payment.get("group"))
+        if not self._config["batch"]:
+            key += (len(self._batches),)
+        return key
+
+    def _add_serialized(self, key, transactions: bytes, count: int, total: int):
+        batch = self._batches.get(key)
+        if batch is None:
+            batch = self._batches[key] = _Batch(self.spool_size)
+        batch.transactions.write(transactions)
+        batch.count += count
+        batch.total += total
+
+    def add_payment(self, payment):
+        self._add_serialized(
+            self._batch_key(payment),
+            *serialize_payments(self._config, self.clean, [payment])
+        )
+
+    def add_payments(self, payments: Iterable[dict], workers=1, piece_size=2000):
+        """Add many payments, serializing them in ``workers`` processes.
+
+        Payments with the same batch key are handed to the workers in pieces
+        of ``piece_size``, and the serialized pieces are appended to their
+        payment information block in the order they were added."""
+        if workers <= 1 or not self._config["batch"]:
+            for payment in payments:
+                self.add_payment(payment)
+            return
+
+        pending, futures = {}, deque()
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+
+            def submit(key):
+                futures.append(
+                    (
+                        key,
+                        executor.submit(
+                            serialize_payments,
+                            self._config,
+                            self.clean,
+                            pending.pop(key),
+                        ),
+                    )
+                )
+                # Merge finished pieces early to not keep them all in memory
+                while futures and futures[0][1].done():
+                    key, future = futures.popleft()
+                    self._add_serialized(key, *future.result())
+
+            for payment in payments:
+                key = self._batch_key(payment)
+                pending.setdefault(key, []).append(payment)
+                if len(pending[key]) >= piece_size:
+                    submit(key)
+            for key in list(pending):
+                submit(key)
+
+            for key, future in futures:
+                self._add_serialized(key, *future.result())
+
+    def _payment_information_header(self, key, batch):
+        sequence_type, collection_date = key[:2]
+        scheme_id = [
+            _element(
+                "Id",
+                _element(
+                    "PrvtId",
+                    _element(
+                        "Othr",
+                        _element("Id", text=self._config["creditor_id"]),
+                        _element("SchmeNm", _element("Prtry", text="SEPA")),
+                    ),
+                ),
+            )
+        ]
+        if self.schema == "pain.008.001.02":
+            scheme_id.insert(0, _element("Nm", text=self._config["name"]))
+
+        return [
+            _element("PmtInfId", text=make_id(self._config["name"])),
+            _element("PmtMtd", text="DD"),
+            _element("BtchBookg", text="true" if self._config["batch"] else "false"),
+            _element("NbOfTxs", text=str(batch.count)),
+            _element("CtrlSum", text=int_to_decimal_str(batch.total)),
+            _element(
+                "PmtTpInf",
+                _element("SvcLvl", _element("Cd", text="SEPA")),
+                _element("LclInstrm", _element("Cd", text=self._config["instrument"])),
+                _element("SeqTp", text=sequence_type),
+            ),
+            _element("ReqdColltnDt", text=collection_date),
+            _element("Cdtr", _element("Nm", text=self._config["name"])),
+            _element(
+                "CdtrAcct", _element("Id", _element("IBAN", text=self._config["IBAN"]))
+            ),
+            _element(
+                "CdtrAgt",
+                _element("FinInstnId", _element("BIC", text=self._config["BIC"])),
+            ),
+            _element("ChrgBr", text="SLEV"),
+            _element("CdtrSchmeId", *scheme_id),
+        ]
+
+    def _group_header(self):
+        return _element(
+            "GrpHdr",
+            _element("MsgId", text=self.msg_id),
+            _element(
+                "CreDtTm", text=datetime.datetime.now().strftime("%Y-%m-%dT%H:%M:%S")
+            ),
+            _element("NbOfTxs", text=str(self.count)),
+            _element("CtrlSum", text=int_to_decimal_str(self.total)),
+            _element(
+                "InitgPty",
+                _element("Nm", text=self._config["name"]),
+                _element(
+                    "Id",
+                    _element(
+                        "OrgId",
+                        _element(
+                            "Othr", _element("Id", text=self._config["creditor_id"])
+                        ),
+                    ),
+                ),
+            ),
+        )
+
+    def export(self, fileobj: BinaryIO, validate=True):
+        """Write the complete document to ``fileobj``.
+
+        With ``validate`` the written document is checked against the XSD
+        afterwards, which requires ``fileobj`` to be readable and seekable."""
+        start = fileobj.tell() if validate else None
+
+        fileobj.write(b'<?xml version="1.0" encoding="UTF-8"?>')
+        fileobj.write(
+            '<Document xmlns="{}{}" xmlns:xsi="{}"><{}>'.format(
+                PAIN_NAMESPACE_PREFIX, self.schema, XSI_NAMESPACE, self.root_el
+            ).encode("utf-8")
+        )
+        fileobj.write(etree.tostring(self._group_header(), encoding="utf-8"))
+
+        for key, batch in self._batches.items():
+            fileobj.write(b"<PmtInf>")
+            for element in self._payment_information_header(key, batch):
+                fileobj.write(etree.tostring(element, encoding="utf-8"))
+            batch.transactions.seek(0)
+            shutil.copyfileobj(batch.transactions, fileobj)
+            fileobj.write(b"</PmtInf>")
+
+        fileobj.write("</{}></Document>".format(self.root_el).encode("utf-8"))
+
+        if validate:
+            fileobj.flush()
+            fileobj.seek(start)
+            validate_file(fileobj, self.schema)
+            fileobj.seek(0, os.SEEK_END)
+
+    def close(self):
+        for batch in self._batches.values():
+            batch.transactions.close()
+
+
+@lru_cache(maxsize=None)
+def _get_schema(schema):
+    import sepaxml
+
+    return etree.XMLSchema(
+        etree.parse(
+            os.path.join(os.path.dirname(sepaxml.__file__), "schemas", schema + ".xsd")
+        )
+    )
+
+
+def validate_file(fileobj: BinaryIO, schema) -> Dict[str, str]:
+    """Validate a pain document while parsing it, without building the tree.
+
+    Returns the texts of the group header's elements, e.g. ``NbOfTxs``."""
+    group_header_tag = "{{{}{}}}GrpHdr".format(PAIN_NAMESPACE_PREFIX, schema)
+    group_header = {}
+    try:
+        for _event, element in etree.iterparse(
+            fileobj, events=("end",), schema=_get_schema(schema)
+        ):
+            parent = element.getparent()
+            if parent is not None and parent.tag == group_header_tag:
+                group_header[etree.QName(element).localname] = element.text
+            element.clear()
+    except etree.LxmlError as e:
+        raise ValidationError(
+            "The output SEPA file contains validation errors. This is likely due to an illegal value in one of "
+            "your input fields."
+        ) from e
+    return group_header
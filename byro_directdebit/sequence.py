@@ -0,0 +1,75 @@
+import datetime
+from typing import Dict, Iterable
+
+from django.db.models import (
+    BooleanField,
+    Count,
+    Exists,
+    ExpressionWrapper,
+    OuterRef,
+    Q,
+)
+
+from byro.members.models import Membership
+
+from byro_directdebit.bulk import bulk_batch_size
+from byro_directdebit.models import DirectDebitPayment, DirectDebitState
+
+FIRST = "FRST"
+RECURRING = "RCUR"
+FINAL = "FNAL"
+
+# Payments that used up the first collection of their mandate: settled ones
+# and those of debits that were handed to the bank and not bounced.
+SUCCESSFUL_COLLECTION = Q(
+    state__in=[DirectDebitState.EXECUTED.value, DirectDebitState.TRANSMITTED.value]
+) | Q(
+    state=DirectDebitState.UNKNOWN.value,
+    direct_debit__state__in=[
+        DirectDebitState.TRANSMITTED.value,
+        DirectDebitState.EXECUTED.value,
+    ],
+)
+
+
+def memberships_ended(by: datetime.date) -> ExpressionWrapper:
+    """Annotation for members whose memberships have all ended by ``by``."""
+    memberships = Membership.objects.filter(member=OuterRef("pk"))
+    return ExpressionWrapper(
+        Exists(memberships)
+        & ~Exists(memberships.filter(Q(end__isnull=True) | Q(end__gt=by))),
+        output_field=BooleanField(),
+    )
+
+
+class SequenceTypeResolver:
+    """Chooses FRST, RCUR or FNAL for the payments of a set of mandates.
+
+    The successful collections of the mandates are counted up front, in one
+    grouped query per ``DIRECTDEBIT_BULK_BATCH_SIZE`` mandates, ``resolve()``
+    does not query."""
+
+    def __init__(self, mandate_references: Iterable[str]):
+        self.collections: Dict[str, int] = {}
+        references = sorted(set(mandate_references))
+        size = bulk_batch_size()
+        for start in range(0, len(references), size):
+            self.collections.update(
+                DirectDebitPayment.objects.filter(
+                    SUCCESSFUL_COLLECTION,
+                    mandate_reference__in=references[start : start + size],
+                )
+                .order_by()
+                .values("mandate_reference")
+                .annotate(count=Count("pk"))
+                .values_list("mandate_reference", "count")
+            )
+
+    def resolve(self, mandate_reference: str, final: bool = False) -> str:
+        """The sequence type of the next payment with ``mandate_reference``.
+
+        ``final`` marks the last payment before the mandate goes out of use,
+        it only makes a difference once the mandate has been used."""
+        if not self.collections.get(mandate_reference):
+            return FIRST
+        return FINAL if final else RECURRING
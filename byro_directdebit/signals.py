@@ -1,9 +1,17 @@
 # Register your receivers here
+from django.apps import apps
+from django.db.models.signals import post_delete, post_save, pre_delete
 from django.dispatch import receiver
 from django.urls import reverse
 from django.utils.translation import ugettext_lazy as _
 
+from byro.bookkeeping.models import Booking, Transaction
+from byro.common.signals import periodic_task
+from byro.members.models import Member, Membership
 from byro.office.signals import nav_event
+from byro.plugins.sepa.models import MemberSepa
+
+from byro_directdebit import capabilities, counters, jobs
 
 
 @receiver(nav_event)
@@ -16,3 +24,64 @@ def directdebit_sidebar(sender, **kwargs):
             "url": reverse("plugins:byro_directdebit:finance.directdebit.dashboard"),
             "active": "byro_directdebit" in request.resolver_match.namespace,
         }
+
+
+@receiver(periodic_task)
+def directdebit_refresh_counters(sender, **kwargs):
+    counters.refresh()
+
+
+@receiver(periodic_task)
+def directdebit_run_jobs(sender, **kwargs):
+    jobs.run_pending_jobs()
+
+
+@receiver(post_save, sender=Member)
+def directdebit_member_changed(sender, instance, **kwargs):
+    counters.schedule_update(instance.pk)
+
+
+@receiver(pre_delete, sender=Member)
+def directdebit_member_deleted(sender, instance, **kwargs):
+    counters.forget_member(instance.pk)
+
+
+@receiver(post_save, sender=MemberSepa)
+@receiver(post_delete, sender=MemberSepa)
+@receiver(post_save, sender=Membership)
+@receiver(post_delete, sender=Membership)
+@receiver(post_save, sender=Booking)
+@receiver(post_delete, sender=Booking)
+def directdebit_member_data_changed(sender, instance, **kwargs):
+    counters.schedule_update(instance.member_id)
+
+
+@receiver(post_save, sender=Transaction)
+def directdebit_transaction_changed(sender, instance, created, **kwargs):
+    if not created:
+        for member_id in set(
+            instance.bookings.exclude(member=None).values_list("member_id", flat=True)
+        ):
+            counters.schedule_update(member_id)
+
+
+def directdebit_bank_connection_changed(sender, **kwargs):
+    capabilities.invalidate()
+
+
+def connect_bank_connection_changed():
+    """Connect ``directdebit_bank_connection_changed`` to the models of byro_fints.
+
+    They hold the bank logins and accounts that the capabilities are
+    discovered from. Called once the app registry is ready."""
+    try:
+        fints_app = apps.get_app_config("byro_fints")
+    except LookupError:
+        return
+    for model in fints_app.get_models():
+        for signal in (post_save, post_delete):
+            signal.connect(
+                directdebit_bank_connection_changed,
+                sender=model,
+                dispatch_uid="byro_directdebit.bank_connection_changed",
+            )
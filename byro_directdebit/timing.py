@@ -0,0 +1,68 @@
+import logging
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+TIMINGS_KEY = "timings"
+
+
+class _Stage:
+    def __init__(self):
+        self.count = 0
+
+
+class StageTimer:
+    """Accumulates the duration and item count of the stages of a flow.
+
+    The totals are kept in ``DirectDebit.additional_data["timings"][flow]``,
+    so a flow that is spread over several requests or jobs continues to add
+    to the numbers of its earlier parts."""
+
+    def __init__(self, flow: str, stages: Optional[Dict] = None):
+        self.flow = flow
+        self.stages = {name: dict(values) for name, values in (stages or {}).items()}
+
+    @classmethod
+    def for_debit(cls, debit, flow: str) -> "StageTimer":
+        return cls(flow, debit.additional_data.get(TIMINGS_KEY, {}).get(flow))
+
+    @contextmanager
+    def stage(self, name: str):
+        """Time the enclosed block, set ``count`` on the yielded object."""
+        stage = _Stage()
+        start = time.perf_counter()
+        try:
+            yield stage
+        finally:
+            self.add(name, time.perf_counter() - start, stage.count)
+
+    def add(self, name: str, seconds: float, count: int = 0):
+        values = self.stages.setdefault(name, {"seconds": 0.0, "count": 0})
+        values["seconds"] += seconds
+        values["count"] += count
+
+    def store(self, debit):
+        """Put the totals into the debit's additional_data, without saving."""
+        debit.additional_data.setdefault(TIMINGS_KEY, {})[self.flow] = self.stages
+
+    def log(self, debit):
+        logger.info(
+            "Direct debit %s, %s: %s",
+            debit.pk,
+            self.flow,
+            ", ".join(
+                "{} {:.3f}s ({} items)".format(name, values["seconds"], values["count"])
+                for name, values in self.stages.items()
+            ),
+        )
+
+
+def debit_timings(debit):
+    """Rows of ``(flow, stage, seconds, count)`` for display."""
+    return [
+        (flow, name, values["seconds"], values["count"])
+        for flow, stages in debit.additional_data.get(TIMINGS_KEY, {}).items()
+        for name, values in stages.items()
+    ]
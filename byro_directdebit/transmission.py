@@ -0,0 +1,216 @@
+import logging
+from typing import List, Optional
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from fints.client import ResponseStatus, TransactionResponse
+
+from byro_directdebit.models import DirectDebit, DirectDebitState
+from byro_directdebit.timing import StageTimer
+
+logger = logging.getLogger(__name__)
+
+SESSION_KEY = "byro_directdebit_batch_{}"
+RESULT_KEY = "transmission"
+
+# Debits in these states can be (re)sent to the bank
+TRANSMITTABLE_STATES = (
+    DirectDebitState.UNKNOWN.value,
+    DirectDebitState.FAILED.value,
+    DirectDebitState.UNCONFIRMED.value,
+)
+
+
+def use_standin() -> bool:
+    """Whether to talk to ``fints_standin`` instead of a bank, only with DEBUG on."""
+    return settings.DEBUG and getattr(settings, "DIRECTDEBIT_FINTS_STANDIN", False)
+
+
+def get_helper(fints_interface, request, user_login_pk):
+    if use_standin():
+        from byro_directdebit.fints_standin import StandInSepaDDHelper
+
+        return StandInSepaDDHelper(request)
+
+    from byro_fints.plugin_interface import SepaDDFinTSHelper
+
+    return fints_interface.get_fints(user_login_pk, SepaDDFinTSHelper)
+
+
+def restore_helper(request, resume_id):
+    if use_standin():
+        from byro_directdebit.fints_standin import StandInSepaDDHelper
+
+        return StandInSepaDDHelper.restore_from_session(request, resume_id)
+
+    from byro_fints.plugin_interface import SepaDDFinTSHelper
+
+    return SepaDDFinTSHelper.restore_from_session(request, resume_id)
+
+
+def response_state(response) -> str:
+    """The state of a debit after the bank answered its order with ``response``.
+
+    Anything but a ``TransactionResponse`` is an internal error."""
+    if not isinstance(response, TransactionResponse):
+        return DirectDebitState.FAILED.value
+    if response.status == ResponseStatus.ERROR:
+        return DirectDebitState.FAILED.value
+    if response.status == ResponseStatus.UNKNOWN:
+        return DirectDebitState.UNCONFIRMED.value
+    return DirectDebitState.TRANSMITTED.value
+
+
+def check_batch(debits: List[DirectDebit]):
+    """Raise ``ValueError`` unless ``debits`` can be sent in one dialog."""
+    if not debits:
+        raise ValueError("No direct debits selected.")
+    for debit in debits:
+        if debit.state not in TRANSMITTABLE_STATES:
+            raise ValueError(
+                "Direct debit {} is {} and cannot be transmitted.".format(
+                    debit.pk, debit.state
+                )
+            )
+        if not debit.sepa_xml_file:
+            raise ValueError("Direct debit {} has no SEPA-XML.".format(debit.pk))
+    if len({debit.additional_data.get("user_login_pk") for debit in debits}) > 1:
+        raise ValueError("The direct debits use different bank logins.")
+
+
+def _ordered(debits) -> List[DirectDebit]:
+    return sorted(debits, key=lambda debit: debit.datetime)
+
+
+def load_batch(debit_ids) -> List[DirectDebit]:
+    """The debits with ``debit_ids``, oldest first, raises ``ValueError`` for bad ids."""
+    try:
+        return _ordered(DirectDebit.objects.filter(pk__in=list(debit_ids)))
+    except ValidationError as e:
+        raise ValueError("Invalid direct debit id.") from e
+
+
+class BatchTransmission:
+    """Sends several direct debits to the bank over one FinTS dialog.
+
+    The dialog is opened once, so the PIN is only needed once, and every
+    debit is sent as its own order. A TAN is only asked for when the bank
+    requires one for an order: the dialog is then paused in the session
+    together with the debits that are still to be sent, and ``send_tan()``
+    continues with them after the TAN has been entered. The outcome of each
+    debit is stored on it as its state and in ``additional_data``."""
+
+    def __init__(self, helper, request, debits: List[DirectDebit], currency: str):
+        self.helper = helper
+        self.request = request
+        self.debits = list(debits)
+        self.currency = currency
+        self.pending = list(self.debits)
+        self.resume_id: Optional[str] = None
+
+    @classmethod
+    def restore(cls, request, resume_id: str, currency: str) -> "BatchTransmission":
+        """Continue a batch that waits for a TAN, raises ``KeyError`` if unknown."""
+        stored = request.session[SESSION_KEY.format(resume_id)]
+        debits = _ordered(DirectDebit.objects.filter(pk__in=stored["debits"]))
+        batch = cls(restore_helper(request, resume_id), request, debits, currency)
+        batch.pending = [
+            debit for debit in debits if str(debit.pk) in stored["pending"]
+        ]
+        batch.resume_id = resume_id
+        return batch
+
+    def start(self) -> Optional[str]:
+        """Open the dialog and send the debits.
+
+        Returns the resume id when the bank asks for a TAN, ``None`` when
+        all debits have been sent."""
+        self.helper.open()
+        return self._send_pending()
+
+    def send_tan(self, tan: str) -> Optional[str]:
+        """Authorize the debit that waits for a TAN and send the remaining ones."""
+        self.helper.open()
+        debit = self.pending[0]
+        timer = StageTimer.for_debit(debit, "transmit")
+        try:
+            with timer.stage("send_tan"):
+                response = self.helper.send_tan(tan)
+        except Exception:
+            logger.exception("Internal error when transmitting TAN")
+            response = None
+        self._complete(debit, response, timer)
+        return self._send_pending()
+
+    def _send_pending(self) -> Optional[str]:
+        while self.pending:
+            debit = self.pending[0]
+            timer = StageTimer.for_debit(debit, "transmit")
+            try:
+                with timer.stage("sepa_dd") as stage:
+                    response = self.helper.sepa_dd(
+                        debit.additional_data["account_iban"],
+                        pain_message=debit.get_sepa_xml(),
+                        multiple=debit.multiple,
+                        cor1=debit.cor1,
+                        control_sum=debit.control_sum,
+                        currency=self.currency,
+                        pain_descriptor=debit.pain_descriptor,
+                    )
+                    stage.count = debit.payment_count or 0
+            except Exception:
+                # The dialog cannot be trusted anymore, the remaining debits
+                # are left for another attempt.
+                logger.exception("Internal error when transmitting SEPA-XML")
+                self._complete(debit, None, timer)
+                self._finish()
+                return None
+
+            if response is False:
+                timer.store(debit)
+                debit.save(update_fields=["additional_data"])
+                return self._pause()
+            self._complete(debit, response, timer)
+
+        self._finish()
+        return None
+
+    def _pause(self) -> str:
+        if self.resume_id:
+            self.request.session.pop(SESSION_KEY.format(self.resume_id), None)
+            self.helper.delete_from_session()
+        self.resume_id = self.helper.save_in_session()
+        self.request.session[SESSION_KEY.format(self.resume_id)] = {
+            "debits": [str(debit.pk) for debit in self.debits],
+            "pending": [str(debit.pk) for debit in self.pending],
+        }
+        return self.resume_id
+
+    def _finish(self):
+        self.helper.close()
+        if self.resume_id:
+            self.request.session.pop(SESSION_KEY.format(self.resume_id), None)
+            self.helper.delete_from_session()
+            self.resume_id = None
+
+    def _complete(self, debit: DirectDebit, response, timer: StageTimer):
+        self.pending.remove(debit)
+        if isinstance(response, TransactionResponse):
+            result = {
+                "status": response.status.name,
+                "messages": [
+                    "{} {}".format(line.code, line.text) for line in response.responses
+                ],
+            }
+        else:
+            # An internal error (None) or an invalid response
+            result = {
+                "status": "ERROR",
+                "messages": [] if response is None else [repr(response)],
+            }
+
+        debit.state = response_state(response)
+        debit.additional_data[RESULT_KEY] = result
+        timer.store(debit)
+        debit.save(update_fields=["state", "additional_data"])
+        timer.log(debit)
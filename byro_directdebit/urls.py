@@ -13,6 +13,61 @@ urlpatterns = [
         views.MemberList.as_view(),
         name="finance.directdebit.list",
     ),
+    url(
+        r"^directdebit/list/export\.(?P<format>csv|ndjson)$",
+        views.MemberListExportView.as_view(),
+        name="finance.directdebit.list.export",
+    ),
+    url(
+        r"^directdebit/history$",
+        views.DirectDebitHistoryView.as_view(),
+        name="finance.directdebit.history",
+    ),
+    url(
+        r"^directdebit/api/history$",
+        views.DirectDebitHistoryAPIView.as_view(),
+        name="finance.directdebit.api.history",
+    ),
+    url(
+        r"^directdebit/api/members/(?P<pk>\d+)/payments$",
+        views.MemberDirectDebitPaymentsAPIView.as_view(),
+        name="finance.directdebit.api.member_payments",
+    ),
+    url(
+        r"^directdebit/scopes$",
+        views.DirectDebitScopeListView.as_view(),
+        name="finance.directdebit.scopes",
+    ),
+    url(
+        r"^directdebit/scopes/new$",
+        views.DirectDebitScopeCreateView.as_view(),
+        name="finance.directdebit.scopes.create",
+    ),
+    url(
+        r"^directdebit/scopes/(?P<pk>\d+)$",
+        views.DirectDebitScopeUpdateView.as_view(),
+        name="finance.directdebit.scopes.update",
+    ),
+    url(
+        r"^directdebit/scopes/(?P<pk>\d+)/delete$",
+        views.DirectDebitScopeDeleteView.as_view(),
+        name="finance.directdebit.scopes.delete",
+    ),
+    url(
+        r"^directdebit/transmit_batch$",
+        views.TransmitBatchView.as_view(),
+        name="finance.directdebit.transmit_batch",
+    ),
+    url(
+        r"^directdebit/transmit_batch/tan/(?P<resume_id>[0-9a-zA-Z_-]+)$",
+        views.TransmitBatchTANView.as_view(),
+        name="finance.directdebit.transmit_batch.tan_request",
+    ),
+    url(
+        r"^directdebit/import_returns$",
+        views.ImportReturnsView.as_view(),
+        name="finance.directdebit.import_returns",
+    ),
     url(
         r"^directdebit/assign_sepa_mandates$",
         views.AssignSepaMandatesView.as_view(),
@@ -23,11 +78,36 @@ urlpatterns = [
         views.PrepareDDView.as_view(),
         name="finance.directdebit.prepare_dd",
     ),
+    url(
+        r"^directdebit/prepare_dd/preview$",
+        views.PrepareDDPreviewView.as_view(),
+        name="finance.directdebit.prepare_dd.preview",
+    ),
+    url(
+        r"^directdebit/prepare_dd/jobs/(?P<pk>[0-9a-f-]+)$",
+        views.PrepareDDJobView.as_view(),
+        name="finance.directdebit.prepare_dd.job",
+    ),
+    url(
+        r"^directdebit/prepare_dd/jobs/(?P<pk>[0-9a-f-]+)/progress$",
+        views.PrepareDDJobProgressView.as_view(),
+        name="finance.directdebit.prepare_dd.job.progress",
+    ),
+    url(
+        r"^directdebit/prepare_dd/jobs/(?P<pk>[0-9a-f-]+)/resume$",
+        views.PrepareDDJobResumeView.as_view(),
+        name="finance.directdebit.prepare_dd.job.resume",
+    ),
     url(
         r"^directdebit/transmit_dd/(?P<pk>[0-9a-f-]+)$",
         views.TransmitDDView.as_view(),
         name="finance.directdebit.transmit_dd",
     ),
+    url(
+        r"^directdebit/transmit_dd/(?P<pk>[0-9a-f-]+)/sepa_xml$",
+        views.DirectDebitXMLView.as_view(),
+        name="finance.directdebit.transmit_dd.sepa_xml",
+    ),
     url(
         r"^directdebit/transmit_dd/(?P<pk>[0-9a-f-]+)/tan/(?P<resume_id>[0-9a-f-]+|test_data(?:_2)?)$",
         views.TransmitDDTANView.as_view(),
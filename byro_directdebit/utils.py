@@ -1,10 +1,21 @@
-from workalendar.registry import registry
+import calendar
 from datetime import datetime, timedelta
 
+from byro_directdebit.calendars import get_calendar_service
 
-def next_debit_date(target_days=14, start_date=None, region="DE"):
-    cal = registry.get(region)()
+
+def next_debit_date(target_days=14, start_date=None, region="DE", day=None):
+    """The first bank day ``target_days`` after ``start_date``.
+
+    With ``day``, the first bank day on or after that day of a month, the
+    last day of shorter months is used instead."""
     result = start_date or datetime.today()
     result = result + timedelta(days=target_days)
-    result = cal.find_following_working_day(result)
-    return result
+    if day:
+        last_day = calendar.monthrange(result.year, result.month)[1]
+        if result.day > min(day, last_day):
+            year, month = divmod(result.year * 12 + result.month, 12)
+            result = result.replace(year=year, month=month + 1, day=1)
+            last_day = calendar.monthrange(result.year, result.month)[1]
+        result = result.replace(day=min(day, last_day))
+    return get_calendar_service().following_working_day(result, [region])
@@ -0,0 +1,99 @@
+import re
+from functools import lru_cache
+from typing import Dict, Iterable, NamedTuple, Optional, Tuple
+
+from byro.plugins.sepa.models import SepaDirectDebitState
+from schwifty import BIC, IBAN
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+class IBANCheck(NamedTuple):
+    valid: bool
+    country: str = ""
+    bic: Optional[str] = None  # BIC of the bank, from the bank registry
+
+
+class ProfileCheck(NamedTuple):
+    iban_valid: bool
+    iban_country: str
+    bic: Optional[str]  # the stored BIC, or the one of the IBAN's bank
+    bic_valid: bool
+
+
+@lru_cache(maxsize=4096)
+def check_bic(bic: str) -> bool:
+    """Whether ``bic`` is usable, like ``MemberSepa.sepa_direct_debit_state``."""
+    try:
+        parsed = BIC(bic)
+    except ValueError:
+        return False
+
+    if parsed.country_code == "DE" and not parsed.exists:
+        # PBNKDEFF and PBNKDEFFXXX should be the same. byro raises for a
+        # branch code that does not exist, that one is invalid here.
+        return len(parsed) == 8 and BIC(str(parsed) + "XXX").exists
+    return True
+
+
+@lru_cache(maxsize=65536)
+def _check_compact_iban(compact: str) -> IBANCheck:
+    try:
+        parsed = IBAN(compact)
+    except ValueError:
+        return IBANCheck(False)
+
+    try:
+        bic = parsed.bic
+    except ValueError:
+        bic = None
+    return IBANCheck(True, parsed.country_code, str(bic) if bic else None)
+
+
+def check_iban(iban: str) -> IBANCheck:
+    """Check an IBAN like ``MemberSepa.iban_parsed`` and look up its BIC.
+
+    The results are cached, so checking the same IBAN again, e.g. when the
+    counters are rebuilt, does not parse it again."""
+    return _check_compact_iban(_WHITESPACE.sub("", iban).upper())
+
+
+def check_profile(iban: Optional[str], bic: Optional[str]) -> ProfileCheck:
+    iban_check = check_iban(iban) if iban else IBANCheck(False)
+    bic = bic or iban_check.bic
+    return ProfileCheck(
+        iban_check.valid, iban_check.country, bic, bool(bic) and check_bic(bic)
+    )
+
+
+def profile_bic(profile) -> Optional[str]:
+    """Like ``MemberSepa.bic_autocomplete``."""
+    return check_profile(profile.iban, profile.bic).bic
+
+
+def check_profiles(profiles: Iterable[Tuple]) -> Dict[Tuple, ProfileCheck]:
+    """Check many ``(iban, bic)`` pairs, each distinct pair only once."""
+    return {profile: check_profile(*profile) for profile in set(profiles)}
+
+
+def sepa_state(
+    check: ProfileCheck, iban, mandate_state, mandate_reference
+) -> SepaDirectDebitState:
+    """``MemberSepa.sepa_direct_debit_state`` from a profile check."""
+    if not iban:
+        return SepaDirectDebitState.NO_IBAN
+    if not check.iban_valid:
+        return SepaDirectDebitState.INVALID_IBAN
+    if mandate_state == "rescinded":
+        return SepaDirectDebitState.RESCINDED
+    if mandate_state == "bounced":
+        return SepaDirectDebitState.BOUNCED
+    if mandate_state == "inactive":
+        return SepaDirectDebitState.INACTIVE
+    # byro never reports NO_BIC: without a BIC from the bank registry it
+    # checks the string "None" and ends up with INVALID_BIC.
+    if not check.bic_valid:
+        return SepaDirectDebitState.INVALID_BIC
+    if not mandate_reference:
+        return SepaDirectDebitState.NO_MANDATE_REFERENCE
+    return SepaDirectDebitState.OK
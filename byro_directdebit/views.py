@@ -1,33 +1,41 @@
-from collections import Counter
+import datetime
 import logging
-import string
-from typing import Optional, Set, Dict
+from decimal import Decimal
+from typing import Optional, Set
 
 import django.http
-from django.http import HttpResponseRedirect
-from django.shortcuts import render
+from django.core.paginator import Paginator
+from django.http import (
+    FileResponse,
+    Http404,
+    HttpResponseRedirect,
+    JsonResponse,
+    StreamingHttpResponse,
+)
+from django.shortcuts import get_object_or_404, render
 from django.views.generic.base import TemplateResponseMixin, View
 from django.views.generic.detail import SingleObjectMixin
 from django.views.generic.edit import ProcessFormView
-from sepaxml import SepaDD
-from uuid import uuid4
 
-from django.views.generic import ListView, TemplateView, FormView
-from django.utils.crypto import get_random_string
-from django.db.models import Q, Sum
-from django.db.transaction import atomic
+from django.views.generic import DetailView, ListView, TemplateView, FormView
+from django.views.generic.edit import CreateView, DeleteView, UpdateView
+from django.utils.functional import cached_property
+from django.utils.text import slugify
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.db.transaction import atomic, on_commit
 from django.contrib import messages
 from django import forms
 from django.utils.translation import ugettext_lazy as _
 from django.utils.translation import ngettext_lazy
-from django.utils.timezone import now
+from django.utils.timezone import localtime, make_aware, now
 from django.urls import reverse_lazy, reverse
 
 from localflavor.generic.forms import IBANFormField, BICFormField
 
 from byro.common.models import Configuration
-from byro.members.models import Member
-from byro.plugins.sepa.models import SepaDirectDebitState
+from byro.members.models import FeeIntervals, Member
+from byro.plugins.sepa.models import MemberSepa, SepaDirectDebitState
 from byro.bookkeeping.special_accounts import SpecialAccounts
 
 from schwifty import IBAN
@@ -35,16 +43,38 @@ from schwifty import IBAN
 from byro_directdebit.models import (
     DirectDebitConfiguration,
     DirectDebit,
+    DirectDebitJob,
     DirectDebitPayment,
+    DirectDebitJobState,
+    DirectDebitScope,
     DirectDebitState,
 )
+from byro_directdebit import (
+    bulk,
+    capabilities,
+    counters,
+    export,
+    jobs,
+    returns,
+    scopes,
+    selection,
+    transmission,
+    validation,
+)
+from byro_directdebit.mandates import MandateReferenceAllocator
+from byro_directdebit.prepare import (
+    NOTIFICATION_CONSTANTS,
+    NOTIFICATION_FIELDS,
+    DirectDebitPreparation,
+)
+from byro_directdebit.rendering import MailRenderer, TemplateError, check_placeholders
+from byro_directdebit.timing import StageTimer, debit_timings
 from byro_directdebit.utils import next_debit_date
 
 from byro_fints.plugin_interface import FinTSPluginInterface, SepaDDFinTSHelper
 from byro_fints.fints_interface import with_fints
 from byro_fints.forms import PinRequestForm
 from fints.client import (
-    FinTSOperations,
     NeedTANResponse,
     TransactionResponse,
     ResponseStatus,
@@ -61,149 +91,138 @@ logger = logging.getLogger(__name__)
 DISABLE_AUDITLOGGING = True
 
 
+class MemberPaginator(Paginator):
+    @cached_property
+    def count(self):
+        # Counting does not need the joined profiles
+        return self.object_list.order_by().values("pk").count()
+
+
 class MemberList(ListView):
+    query_budget = 12
     template_name = "byro_directdebit/list.html"
     context_object_name = "members"
     model = Member
     paginate_by = 50
-
-    def get_queryset(self):
-        mode = self.request.GET.get("filter", "all")
-
-        all_members = list(
-            Member.objects.filter(
-                Q(memberships__amount__gt=0)
-                | Q(bookings__debit_account=SpecialAccounts.fees_receivable)
-            )
-                .order_by("-id")
-                .distinct()
-                .all()
-        )
-
+    paginator_class = MemberPaginator
+
+    STATE_FILTERS = {
+        "invalid_iban": SepaDirectDebitState.INVALID_IBAN,
+        "invalid_bic": SepaDirectDebitState.INVALID_BIC,
+        "rescinded": SepaDirectDebitState.RESCINDED,
+        "bounced": SepaDirectDebitState.BOUNCED,
+        "no_bic": SepaDirectDebitState.NO_BIC,
+        "no_iban": SepaDirectDebitState.NO_IBAN,
+        "no_mandate_reference": SepaDirectDebitState.NO_MANDATE_REFERENCE,
+    }
+    DUE_STATE_FILTERS = {
+        "inactive": SepaDirectDebitState.INACTIVE,
+        "eligible": SepaDirectDebitState.OK,
+    }
+
+    @classmethod
+    def select_members(cls, mode: str, fees_receivable):
+        """The members listed for the ``filter`` parameter ``mode``.
+
+        The SEPA states stored by ``counters`` are used, as they are: they
+        are not computed for a request."""
+        members = selection.fee_members(fees_receivable)
         if mode == "all":
-            return list(all_members)
-
-        if mode == "invalid_iban":
-            return [
-                m
-                for m in all_members
-                if m.profile_sepa.sepa_direct_debit_state
-                   == SepaDirectDebitState.INVALID_IBAN
-            ]
-
-        elif mode == "invalid_bic":
-            return [
-                m
-                for m in all_members
-                if m.profile_sepa.sepa_direct_debit_state
-                   == SepaDirectDebitState.INVALID_BIC
-            ]
+            return members
 
-        elif mode == "rescinded":
-            return [
-                m
-                for m in all_members
-                if m.profile_sepa.sepa_direct_debit_state
-                   == SepaDirectDebitState.RESCINDED
-            ]
+        if mode in cls.STATE_FILTERS:
+            return selection.in_sepa_state(members, cls.STATE_FILTERS[mode])
 
-        elif mode == "bounced":
-            return [
-                m
-                for m in all_members
-                if m.profile_sepa.sepa_direct_debit_state
-                   == SepaDirectDebitState.BOUNCED
-            ]
+        members = members.filter(direct_debit_status__due=True)
+        if mode in cls.DUE_STATE_FILTERS:
+            return selection.in_sepa_state(members, cls.DUE_STATE_FILTERS[mode])
+        return members
 
-        elif mode == "no_bic":
-            return [
-                m
-                for m in all_members
-                if m.profile_sepa.sepa_direct_debit_state == SepaDirectDebitState.NO_BIC
-            ]
-
-        elif mode == "no_iban":
-            return [
-                m
-                for m in all_members
-                if m.profile_sepa.sepa_direct_debit_state
-                   == SepaDirectDebitState.NO_IBAN
-            ]
+    def get_queryset(self):
+        self.fees_receivable = SpecialAccounts.fees_receivable
+        members = self.select_members(
+            self.request.GET.get("filter", "all"), self.fees_receivable
+        )
+        return members.select_related("profile_sepa").order_by("-id")
+
+    def paginate_queryset(self, queryset, page_size):
+        # ?after=<id> switches to keyset pagination, which stays cheap on deep pages
+        after = self.request.GET.get("after")
+        if after is None:
+            return super().paginate_queryset(queryset, page_size)
+
+        if after:
+            try:
+                queryset = queryset.filter(pk__lt=int(after))
+            except ValueError:
+                raise Http404(_("Invalid keyset position."))
+
+        members = list(queryset[: page_size + 1])
+        self.next_after = (
+            members[page_size - 1].pk if len(members) > page_size else None
+        )
+        return None, None, members[:page_size], False
 
-        elif mode == "no_mandate_reference":
-            return [
-                m
-                for m in all_members
-                if m.profile_sepa.sepa_direct_debit_state
-                   == SepaDirectDebitState.NO_MANDATE_REFERENCE
-            ]
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["keyset"] = "after" in self.request.GET
+        context["next_after"] = getattr(self, "next_after", None)
+        if self.request.GET.get("filter", "all") != "all":
+            context["counters_rebuilt"] = counters.last_rebuilt()
+            context["counters_stale"] = counters.is_stale(context["counters_rebuilt"])
+
+        # The balances are only summed for the members on the page
+        members = list(context["members"])
+        balances = selection.fee_balances(
+            fees_receivable=self.fees_receivable,
+            member_ids=[member.pk for member in members],
+        )
+        for member in members:
+            member.fee_balance = balances.get(member.pk, Decimal("0.00"))
+        context["members"] = context["object_list"] = members
+        return context
 
-        with_due_balance = [member for member in all_members if member.balance < 0]
 
-        if mode == "with_due_balance":
-            return with_due_balance
+class MemberListExportView(View):
+    query_budget = 4  # the rows are fetched while the response is streamed
 
-        elif mode == "inactive":
-            return [
-                m
-                for m in with_due_balance
-                if m.profile_sepa.sepa_direct_debit_state
-                   == SepaDirectDebitState.INACTIVE
-            ]
+    FORMATS = {
+        "csv": ("text/csv; charset=utf-8", export.csv_lines),
+        "ndjson": ("application/x-ndjson; charset=utf-8", export.ndjson_lines),
+    }
 
-        elif mode == "eligible":
-            return [
-                m
-                for m in with_due_balance
-                if m.profile_sepa.sepa_direct_debit_state == SepaDirectDebitState.OK
-            ]
-
-        else:
-            return list(with_due_balance)
+    def get(self, request, *args, **kwargs):
+        content_type, lines = self.FORMATS[kwargs["format"]]
+        mode = request.GET.get("filter", "all")
+        # Unlike the list, the export does not use the stored states: they
+        # are evaluated along with the balances while the rows are streamed
+        state = {**MemberList.STATE_FILTERS, **MemberList.DUE_STATE_FILTERS}.get(mode)
+        response = StreamingHttpResponse(
+            lines(
+                export.member_chunks(
+                    states=[state] if state else [],
+                    due=mode != "all" and mode not in MemberList.STATE_FILTERS,
+                    fees_receivable=SpecialAccounts.fees_receivable,
+                )
+            ),
+            content_type=content_type,
+        )
+        response["Content-Disposition"] = 'attachment; filename="members-{}.{}"'.format(
+            slugify(mode), kwargs["format"]
+        )
+        return response
 
 
 class Dashboard(TemplateView):
+    query_budget = 8
     template_name = "byro_directdebit/dashboard.html"
 
     def get_context_data(self, *args, **kwargs):
         context = super().get_context_data(*args, **kwargs)
         config = DirectDebitConfiguration.get_solo()
 
-        all_members = list(
-            Member.objects.filter(
-                Q(memberships__amount__gt=0)
-                | Q(bookings__debit_account=SpecialAccounts.fees_receivable)
-            )
-                .order_by("-id")
-                .distinct()
-                .all()
-        )
-
-        with_due_balance = {member for member in all_members if member.balance < 0}
-
-        counts = Counter([m.profile_sepa.sepa_direct_debit_state for m in all_members])
-        w_due_counts = Counter(
-            [m.profile_sepa.sepa_direct_debit_state for m in with_due_balance]
-        )
-
-        context.update(
-            {
-                "creditor_id": config.creditor_id,
-                "all_members": len(all_members),
-                "with_due_balance": len(with_due_balance),
-                "deactivated_sepa": w_due_counts[SepaDirectDebitState.INACTIVE],
-                "no_iban": counts[SepaDirectDebitState.NO_IBAN],
-                "eligible": w_due_counts[SepaDirectDebitState.OK],
-                "invalid_iban": counts[SepaDirectDebitState.INVALID_IBAN],
-                "no_bic": counts[SepaDirectDebitState.NO_BIC],
-                "invalid_bic": counts[SepaDirectDebitState.INVALID_BIC],
-                "rescinded": counts[SepaDirectDebitState.RESCINDED],
-                "bounced": counts[SepaDirectDebitState.BOUNCED],
-                "no_mandate_reference": counts[
-                    SepaDirectDebitState.NO_MANDATE_REFERENCE
-                ],
-            }
-        )
+        context["creditor_id"] = config.creditor_id
+        context.update(counters.get_counters())
 
         return context
 
@@ -231,75 +250,32 @@ class AssignSepaMandatesForm(forms.Form):
 
 
 class AssignSepaMandatesView(FormView):
+    query_budget = 25
     template_name = "byro_directdebit/assign_sepa_mandates.html"
     form_class = AssignSepaMandatesForm
     success_url = reverse_lazy("plugins:byro_directdebit:finance.directdebit.dashboard")
 
     @staticmethod
-    def _get_members():
-        all_members = list(
-            Member.objects.filter(
-                Q(memberships__amount__gt=0)
-                | Q(bookings__debit_account=SpecialAccounts.fees_receivable)
-            )
-                .order_by("-id")
-                .distinct()
-                .all()
+    def _member_chunks():
+        """The members without a mandate reference, in chunks of ``MemberState``."""
+        return selection.member_state_chunks(
+            states=[SepaDirectDebitState.NO_MANDATE_REFERENCE]
         )
 
-        return [
-            m
-            for m in all_members
-            if m.profile_sepa.sepa_direct_debit_state
-               == SepaDirectDebitState.NO_MANDATE_REFERENCE
-        ]
-
-    @staticmethod
-    def _find_unused_mandate_reference(prefix, length, member, now_=None):
-        now_ = now_ or now()
-
-        allowed_chars = [x for x in string.ascii_uppercase if x not in "XBGIOQSZ"]
-        format_string = "{}{:04d}{}{}"
-
-        member_number = member.number or "0"
-        formatted_number = (
-            "{:06d}".format(int(member_number))
-            if member_number.isdigit()
-            else "X{}".format(member_number)
-        )
-
-        mandate_reference: Optional[str] = None
-
-        for i in range(3):
-            format_params = [prefix, now_.year, "", formatted_number]
-
-            empty_len = len(format_string.format(*format_params))
-
-            random_string = get_random_string(
-                length=length - empty_len, allowed_chars=allowed_chars
+    def _members(self):
+        for chunk in self._member_chunks():
+            yield from (
+                Member.objects.filter(pk__in=[member.pk for member in chunk])
+                .select_related("profile_sepa")
+                .order_by("-id")
             )
 
-            format_params[2] = random_string
-
-            mandate_reference = format_string.format(*format_params).upper()
-
-            if Member.objects.filter(
-                    profile_sepa__mandate_reference=mandate_reference
-            ).exists():
-                mandate_reference = None
-                continue
-            else:
-                break
-
-        if mandate_reference is None:
-            raise Exception("Cannot assign mandate reference")
-
-        return mandate_reference
-
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
 
-        context["no_mandate_reference"] = len(self._get_members())
+        context["no_mandate_reference"] = sum(
+            len(chunk) for chunk in self._member_chunks()
+        )
 
         return context
 
@@ -314,53 +290,74 @@ class AssignSepaMandatesView(FormView):
     def form_valid(self, form):
         config = DirectDebitConfiguration.get_solo()
         global_config = Configuration.get_solo()
-        members = self._get_members()
         now_ = now()
 
-        error_count = 0
-        success_count = 0
+        try:
+            renderer = MailRenderer(
+                config.mandate_reference_notification_template,
+                {
+                    "creditor_id": config.creditor_id,
+                    "contact": global_config.mail_from,
+                    "association_name": global_config.name,
+                    "additional_information": "",
+                },
+                ["sepa_mandate_reference", "sepa_iban", "sepa_bic"],
+                locale=global_config.language,
+            )
+        except TemplateError as e:
+            messages.error(
+                self.request,
+                _("The notification template cannot be used: %(error)s")
+                % {"error": e},
+            )
+            return self.form_invalid(form)
 
-        for member in members:
+        error_count = 0
+        profiles, mails, mail_members, log_entries = [], [], [], []
 
-            with atomic():
-                mandate_reference = self._find_unused_mandate_reference(
-                    form.cleaned_data["prefix"],
-                    form.cleaned_data["length"],
-                    member,
-                    now_,
-                )
+        # The references are saved before the allocator releases its lock
+        with MandateReferenceAllocator(
+            form.cleaned_data["prefix"], form.cleaned_data["length"], now_
+        ) as allocator:
+            for member in self._members():
+                mandate_reference = allocator.allocate(member)
 
                 if not mandate_reference:
                     error_count = error_count + 1
                     continue
 
-                context = {
-                    "creditor_id": config.creditor_id,
-                    "sepa_mandate_reference": mandate_reference,
-                    "sepa_iban": member.profile_sepa.iban,
-                    "sepa_bic": member.profile_sepa.bic_autocomplete,
-                    "contact": global_config.mail_from,
-                    "association_name": global_config.name,
-                    "additional_information": "",
-                }
-
-                mail = config.mandate_reference_notification_template.to_mail(
-                    member.email, context=context, save=False
+                mail = renderer.to_mail(
+                    member.email,
+                    sepa_mandate_reference=mandate_reference,
+                    sepa_iban=member.profile_sepa.iban,
+                    sepa_bic=validation.profile_bic(member.profile_sepa),
                 )
-                mail.save()
-                mail.members.add(member)
+                mails.append(mail)
+                mail_members.append(member)
 
                 member.profile_sepa.mandate_reference = mandate_reference
-                member.profile_sepa.save()
-
-                member.log(self, ".updated")
-                member.log(
-                    self,
-                    ".finance.sepadd.mandate_reference_assigned",
-                    mandate_reference=mandate_reference,
+                profiles.append(member.profile_sepa)
+
+                log_entries.append((member, ".updated", {}))
+                log_entries.append(
+                    (
+                        member,
+                        ".finance.sepadd.mandate_reference_assigned",
+                        {"mandate_reference": mandate_reference},
+                    )
                 )
 
-                success_count = success_count + 1
+            MemberSepa.objects.bulk_update(
+                profiles, ["mandate_reference"], batch_size=bulk.bulk_batch_size()
+            )
+            bulk.save_mails(mails, mail_members)
+            bulk.log_many(self, log_entries)
+
+            # bulk_update() does not send post_save for the profiles
+            member_ids = [member.pk for member in mail_members]
+            on_commit(lambda: counters.update_members(member_ids))
+
+        success_count = len(profiles)
 
         if success_count:
             messages.success(
@@ -442,15 +439,44 @@ class PrepareDDForm(forms.Form):
         label=_("Member numbers"),
         help_text=_(
             "Allows to issue a direct debit for a subset of members only. "
-            "Example: 1-9,20-29,42"
+            "Example: 1-9,20-29,42,5000-"
         ),
     )
 
+    scope = forms.ModelChoiceField(
+        queryset=DirectDebitScope.objects.all(),
+        required=False,
+        label=_("Scope"),
+        help_text=_("Only debit the members of this saved scope."),
+    )
+
     subject = forms.CharField(required=True)
     text = forms.CharField(widget=forms.Textarea)
 
     debit_date.widget.attrs.update({"class": "datepicker"})
 
+    def clean_exp_member_numbers(self):
+        try:
+            scopes.parse_member_numbers(self.cleaned_data["exp_member_numbers"])
+        except ValueError as e:
+            raise forms.ValidationError(str(e))
+        return self.cleaned_data["exp_member_numbers"]
+
+    def _clean_notification(self, field):
+        try:
+            check_placeholders(
+                self.cleaned_data[field], NOTIFICATION_CONSTANTS + NOTIFICATION_FIELDS
+            )
+        except TemplateError as e:
+            raise forms.ValidationError(str(e))
+        return self.cleaned_data[field]
+
+    def clean_subject(self):
+        return self._clean_notification("subject")
+
+    def clean_text(self):
+        return self._clean_notification("text")
+
 
 class FinTSInterfaceMixin:
     fints_interface: Optional[FinTSPluginInterface]
@@ -469,8 +495,10 @@ UserLoginPk = int
 
 
 class PrepareDDView(FinTSInterfaceMixin, FormView):
+    query_budget = 15
     template_name = "byro_directdebit/prepare_dd.html"
     form_class = PrepareDDForm
+    warn_without_debit_account = True
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -478,87 +506,37 @@ class PrepareDDView(FinTSInterfaceMixin, FormView):
         self.do_cor1: bool = False
         self.selected_account_user_login_pk: Optional[UserLoginPk] = None
         self.selected_sepa_pain_formats: Optional[Set[PainFormat]] = None
-        self.bank_connections: Dict[UserLoginPk, dict] = {}
         self.selected_account: Optional[IBAN] = None
 
     def setup(self, *args, **kwargs):
         super().setup(*args, **kwargs)
 
-        capable_accounts = []
-
-        fallback_account: Optional[IBAN] = None
-        fallback_user_login_pk: Optional[UserLoginPk] = None
-
+        selected = capabilities.Selection()
         if self.fints_interface:
-            connections = self.fints_interface.get_bank_connections()
-            for user_login_pk, connection in connections.items():
-                for account in connection.get("accounts", []):
-                    if "iban" in account and account["iban"]:
-                        iban = IBAN(account["iban"])
-
-                        if (
-                                not fallback_account
-                        ):  # Randomly select the first one as fallback
-                            fallback_account = iban
-                            fallback_user_login_pk = user_login_pk
-
-                        if (
-                                account["supported_operations"][
-                                    FinTSOperations.SEPA_DEBIT_MULTIPLE
-                                ]
-                                or account["supported_operations"][
-                            FinTSOperations.SEPA_DEBIT_MULTIPLE_COR1
-                        ]
-                        ):
-
-                            capable_accounts.append(iban)
-
-                            if not self.selected_account:
-                                self.selected_account = iban
-                                self.selected_account_user_login_pk = user_login_pk
-
-                                if connection.get("bank", {}).get(
-                                        "supported_formats", {}
-                                ):
-                                    sup_mul = connection["bank"][
-                                        "supported_formats"
-                                    ].get(FinTSOperations.SEPA_DEBIT_MULTIPLE, None)
-                                    sup_mul_cor1 = connection["bank"][
-                                        "supported_formats"
-                                    ].get(
-                                        FinTSOperations.SEPA_DEBIT_MULTIPLE_COR1, None
-                                    )
-
-                                    if sup_mul:
-                                        self.selected_sepa_pain_formats = sup_mul
-                                        self.do_cor1 = False
-                                    elif sup_mul_cor1:
-                                        self.selected_sepa_pain_formats = sup_mul_cor1
-                                        self.do_cor1 = True
-                                    else:
-                                        self.selected_account = None
-                                        self.selected_account_user_login_pk = None
-
-            self.bank_connections = connections
-
-        if self.selected_sepa_pain_formats:
-            self.selected_sepa_pain_formats = set(
-                (e[:-4] if e.lower().endswith(".xsd") else e).rsplit(":", 1)[-1]
-                for e in self.selected_sepa_pain_formats
+            selected = capabilities.select(
+                capabilities.get_capabilities(self.fints_interface, self.request.user)
             )
 
-        if not self.selected_account:
+        self.selected_account = selected.account
+        self.selected_account_user_login_pk = selected.user_login_pk
+        self.do_cor1 = selected.cor1
+        if selected.pain_formats:
+            self.selected_sepa_pain_formats = set(selected.pain_formats)
+
+        if not selected.debit_capable and self.warn_without_debit_account:
             messages.warning(self.request, "No account with DEBIT capability found")
-            if fallback_account:
-                self.selected_account = fallback_account
-                self.selected_account_user_login_pk = fallback_user_login_pk
 
     def get_initial(self):
         config = DirectDebitConfiguration.get_solo()
         global_config = Configuration.get_solo()
         retval = super().get_initial()
 
-        retval["debit_date"] = next_debit_date(region=config.creditor_id[:2])
+        scope = self._initial_scope()
+        retval["debit_date"] = next_debit_date(
+            region=config.creditor_id[:2], day=scope.debit_day if scope else None
+        )
+        if scope:
+            retval["scope"] = scope.pk
         retval["debit_text"] = _(
             "Membership fees for %(organization_name)s"
             % {
@@ -596,150 +574,127 @@ class PrepareDDView(FinTSInterfaceMixin, FormView):
 
         return retval
 
-    @staticmethod
-    def _get_members():
-        all_members = list(
-            Member.objects.filter(
-                Q(memberships__amount__gt=0)
-                | Q(bookings__debit_account=SpecialAccounts.fees_receivable)
-            )
-                .order_by("-id")
-                .distinct()
-                .all()
-        )
-
-        return [
-            m
-            for m in all_members
-            if m.balance < 0
-               and m.profile_sepa.sepa_direct_debit_state == SepaDirectDebitState.OK
-        ]
+    def _initial_scope(self) -> Optional[DirectDebitScope]:
+        """The saved scope from the ``scope`` parameter, to prepare a run for it."""
+        try:
+            return DirectDebitScope.objects.filter(
+                pk=int(self.request.GET.get("scope", ""))
+            ).first()
+        except ValueError:
+            return None
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
 
-        context["eligible"] = len(self._get_members())
+        context["eligible"] = counters.get_counters()["eligible"]
 
         return context
 
     def form_valid(self, form):
-        config = DirectDebitConfiguration.get_solo()
-        global_config = Configuration.get_solo()
-        members = self._get_members()
-        now_ = now()
+        job = jobs.enqueue_prepare(
+            DirectDebitPreparation.parameters_from_form(
+                form.cleaned_data, self.selected_account_user_login_pk
+            )
+        )
 
-        dd_config = {
-            "name": form.cleaned_data["own_name"],
-            "IBAN": str(form.cleaned_data["own_iban"]),
-            "BIC": str(form.cleaned_data["own_bic"]),
-            "batch": True,
-            "creditor_id": config.creditor_id,
-            "currency": global_config.currency,
-            "instrument": "COR1" if form.cleaned_data["cor1"] else "CORE",
-        }
-        sepa = SepaDD(dd_config, schema=form.cleaned_data["sepa_format"], clean=True)
-
-        exp_member_numbers = [
-            (
-                (int(x.split("-")[0]), int(x.split("-")[1]))
-                if "-" in x
-                else (int(x), int(x))
+        return HttpResponseRedirect(
+            reverse(
+                "plugins:byro_directdebit:finance.directdebit.prepare_dd.job",
+                kwargs={"pk": job.pk},
             )
-            for x in form.cleaned_data["exp_member_numbers"].split(",")
-            if x
-        ]
+        )
 
-        with atomic():
-            debit = DirectDebit(
-                datetime=now_,
-                multiple=True,
-                cor1=form.cleaned_data["cor1"],
-                pain_descriptor="urn:iso:std:iso:20022:tech:xsd:"
-                                + form.cleaned_data["sepa_format"],
-                additional_data={
-                    "user_login_pk": self.selected_account_user_login_pk,
-                    "account_iban": form.cleaned_data["own_iban"],
-                    "account_bic": form.cleaned_data["own_bic"],
-                },
+
+class PrepareDDPreviewView(PrepareDDView):
+    """Dry run of the prepare form: what would be collected, as JSON.
+
+    Nothing is written, neither a debit nor payments, mails or messages."""
+
+    query_budget = 15
+    http_method_names = ["post"]
+    warn_without_debit_account = False
+
+    def get_initial(self):
+        return {}
+
+    def form_valid(self, form):
+        preparation = DirectDebitPreparation(
+            DirectDebitPreparation.parameters_from_form(
+                form.cleaned_data, self.selected_account_user_login_pk
             )
-            debit_payments = []
-
-            for member in members:
-                # Experimental gates
-                if form.cleaned_data["exp_bank_types"] == "DE":
-                    if not member.profile_sepa.iban.upper().startswith("DE"):
-                        continue
-                elif form.cleaned_data["exp_bank_types"] == "NDE":
-                    if member.profile_sepa.iban.upper().startswith("DE"):
-                        continue
-
-                if exp_member_numbers:
-                    if not any(
-                            a <= int(member.number) <= b for (a, b) in exp_member_numbers
-                    ):
-                        continue
-
-                debit_payment = DirectDebitPayment(
-                    id=uuid4(),
-                    type="FRST",  # FIXME Based on existing data
-                    mandate_reference=member.profile_sepa.mandate_reference,
-                    collection_date=form.cleaned_data["debit_date"],
-                    amount=-member.balance,
-                    direct_debit=debit,
-                    member=member,
-                )
+        )
+        return JsonResponse(preparation.preview())
 
-                payment = {
-                    "name": member.name,
-                    "IBAN": member.profile_sepa.iban,
-                    "BIC": member.profile_sepa.bic_autocomplete,
-                    "collection_date": debit_payment.collection_date,
-                    "amount": int(debit_payment.amount * 100),  # in cents
-                    "type": debit_payment.type,
-                    "mandate_id": debit_payment.mandate_reference,
-                    "mandate_date": member.profile_sepa.issue_date or now_.date(),
-                    "description": form.cleaned_data["debit_text"],
-                    "endtoend_id": debit_payment.id.hex,
-                }
-                sepa.add_payment(payment)
-                debit_payments.append(debit_payment)
-
-                context = {
-                    "creditor_id": config.creditor_id,
-                    "sepa_mandate_reference": debit_payment.mandate_reference,
-                    "sepa_iban": member.profile_sepa.iban,
-                    "sepa_bic": member.profile_sepa.bic_autocomplete,
-                    "contact": global_config.mail_from,
-                    "association_name": global_config.name,
-                    "additional_information": "",
-                    "debit_date": form.cleaned_data["debit_date"],
-                    "amount": "%.2f %s"
-                              % (debit_payment.amount, global_config.currency),
-                }
+    def form_invalid(self, form):
+        return JsonResponse({"errors": form.errors.get_json_data()}, status=400)
 
-                mail = config.debit_notification_template.to_mail(
-                    member.email,
-                    context=context,
-                    save=False,
-                )
-                mail.text = form.cleaned_data["text"].format(**context)
-                mail.subject = form.cleaned_data["subject"].format(**context)
-                mail.save()
-                mail.members.add(member)
 
-            debit.sepa_xml = sepa.export(validate=True).decode("utf-8")
-            debit.save()
-            for p in debit_payments:
-                p.save()
+class PrepareDDJobView(DetailView):
+    query_budget = 8
+    template_name = "byro_directdebit/prepare_dd_job.html"
+    model = DirectDebitJob
+    context_object_name = "job"
+
+
+class PrepareDDJobProgressView(SingleObjectMixin, View):
+    query_budget = 2
+    model = DirectDebitJob
+
+    def get(self, request, *args, **kwargs):
+        job = self.get_object()
+
+        redirect = None
+        if job.state == DirectDebitJobState.DONE.value:
+            redirect = reverse(
+                "plugins:byro_directdebit:finance.directdebit.transmit_dd",
+                kwargs={"pk": job.direct_debit_id},
+            )
+
+        return JsonResponse(
+            {
+                "state": job.state,
+                "processed": job.processed,
+                "total": job.total,
+                "error": job.error,
+                "redirect": redirect,
+            }
+        )
+
+
+class PrepareDDJobResumeView(SingleObjectMixin, View):
+    query_budget = 4
+    model = DirectDebitJob
+
+    def post(self, request, *args, **kwargs):
+        job = self.get_object()
+        jobs.resume_job(job)
 
         return HttpResponseRedirect(
             reverse(
-                "plugins:byro_directdebit:finance.directdebit.transmit_dd",
-                kwargs={"pk": debit.pk},
+                "plugins:byro_directdebit:finance.directdebit.prepare_dd.job",
+                kwargs={"pk": job.pk},
             )
         )
 
 
+class DirectDebitXMLView(SingleObjectMixin, View):
+    query_budget = 2
+    model = DirectDebit
+
+    def get(self, request, *args, **kwargs):
+        debit = self.get_object()
+        xml = debit.open_sepa_xml()
+        if xml is None:
+            raise Http404(_("This direct debit has no SEPA-XML file."))
+
+        return FileResponse(
+            xml,
+            as_attachment=True,
+            filename="{}.xml".format(debit.pk),
+            content_type="application/xml",
+        )
+
+
 class TransmitDDMixin(FinTSInterfaceMixin, SingleObjectMixin):
     model = DirectDebit
     object: DirectDebit
@@ -768,6 +723,11 @@ class TransmitDDMixin(FinTSInterfaceMixin, SingleObjectMixin):
                 )
             )
 
+    def _store_timings(self, timer):
+        timer.store(self.object)
+        self.object.save(update_fields=["additional_data"])
+        timer.log(self.object)
+
     def _show_transaction_messages(self, response):
         if response.status == ResponseStatus.UNKNOWN:
             messages.warning(
@@ -786,13 +746,15 @@ class TransmitDDMixin(FinTSInterfaceMixin, SingleObjectMixin):
 class TransmitDDView(
     TransmitDDMixin, TemplateResponseMixin, View
 ):
+    query_budget = 15
     template_name = "byro_directdebit/transmit_dd.html"
 
     def setup(self, *args, **kwargs):
         super().setup(*args, **kwargs)
-        self.sepadd_helper = self.fints_interface.get_fints(
+        self.sepadd_helper = transmission.get_helper(
+            self.fints_interface,
+            self.request,
             self.object.additional_data["user_login_pk"],
-            SepaDDFinTSHelper
         )
 
     def get_context_data(self, **kwargs):
@@ -809,16 +771,26 @@ class TransmitDDView(
         self.sepadd_helper.augment_form_pin_fields(fints_form)
 
         context["fints_form"] = fints_form
-        context["debit_count"] = self.object.payments.count()
+        context["debit_count"] = self.object.payment_count
         context["debit_currency"] = global_config.currency
-        context["debit_sum"] = self.object.payments.aggregate(amount=Sum("amount"))[
-            "amount"
-        ]
+        context["debit_sum"] = self.object.control_sum
+        context["sequence_type_totals"] = self.object.sequence_type_totals
         context["debit_account"] = self.object.additional_data["account_iban"]
+        context["timings"] = debit_timings(self.object)
 
         return context
 
     def get(self, request, *args, **kwargs):
+        if self.object.state == DirectDebitState.PREPARING.value:
+            job = self.object.jobs.order_by("-created").first()
+            if job:
+                return HttpResponseRedirect(
+                    reverse(
+                        "plugins:byro_directdebit:finance.directdebit.prepare_dd.job",
+                        kwargs={"pk": job.pk},
+                    )
+                )
+
         return self.render_to_response(self.get_context_data())
 
     @with_fints
@@ -827,8 +799,10 @@ class TransmitDDView(
 
         if context["fints_form"]:
             if context["fints_form"].is_valid():
+                timer = StageTimer.for_debit(self.object, "transmit")
                 self.sepadd_helper.load_from_form(context["fints_form"])
-                self.sepadd_helper.open()
+                with timer.stage("fints_open"):
+                    self.sepadd_helper.open()
                 # FIXME load user_name/pin from form  V
                 # Open helper V
                 # Handle pin error
@@ -844,18 +818,22 @@ class TransmitDDView(
                 # show result                V
 
                 try:
-                    response = self.sepadd_helper.sepa_dd(
-                        self.object.additional_data["account_iban"],
-                        pain_message=self.object.sepa_xml,
-                        multiple=self.object.multiple,
-                        cor1=self.object.cor1,
-                        control_sum=context["debit_sum"],
-                        currency=context["debit_currency"],
-                        pain_descriptor=self.object.pain_descriptor,
-                    )
+                    with timer.stage("sepa_dd") as stage:
+                        response = self.sepadd_helper.sepa_dd(
+                            self.object.additional_data["account_iban"],
+                            pain_message=self.object.get_sepa_xml(),
+                            multiple=self.object.multiple,
+                            cor1=self.object.cor1,
+                            control_sum=context["debit_sum"],
+                            currency=context["debit_currency"],
+                            pain_descriptor=self.object.pain_descriptor,
+                        )
+                        stage.count = context["debit_count"]
 
                     if isinstance(response, TransactionResponse):
-                        self._handle_completed_dd(response)
+                        with timer.stage("fints_close"):
+                            self._handle_completed_dd(response)
+                        self.object.state = transmission.response_state(response)
                     elif response is False:
                         resume_id = self.sepadd_helper.save_in_session()
                         if not DISABLE_AUDITLOGGING:
@@ -870,22 +848,28 @@ class TransmitDDView(
                             )
                         )
                     else:
-                        self.sepadd_helper.close()
+                        with timer.stage("fints_close"):
+                            self.sepadd_helper.close()
                         if not DISABLE_AUDITLOGGING:
                             self.object.log(self, ".transmitdd.internal_error")
                         messages.error(
                             self.request, _("Invalid response: {}".format(response))
                         )
+                        self.object.state = DirectDebitState.FAILED.value
                 except:
                     if not DISABLE_AUDITLOGGING:
                         self.object.log(self, ".transmitdd.internal_error")
                     logger.exception("Internal error when transmitting SEPA-XML")
+                    self.object.state = DirectDebitState.FAILED.value
                     messages.error(
                         self.request,
                         _(
                             "An error occurred, please see server log for more information"
                         ),
                     )
+                finally:
+                    self.object.save(update_fields=["state"])
+                    self._store_timings(timer)
 
         return self.render_to_response(context)
 
@@ -893,11 +877,14 @@ class TransmitDDView(
 class TransmitDDTANView(
     TransmitDDMixin, TemplateResponseMixin, View
 ):
+    query_budget = 15
     template_name = "byro_directdebit/transmit_dd_tan.html"
 
     def setup(self, *args, **kwargs):
         super().setup(*args, **kwargs)
-        self.sepadd_helper = SepaDDFinTSHelper.restore_from_session(self.request, self.kwargs["resume_id"])
+        self.sepadd_helper = transmission.restore_helper(
+            self.request, self.kwargs["resume_id"]
+        )
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -922,9 +909,12 @@ class TransmitDDTANView(
 
         if context["tan_form"]:
             if context["tan_form"].is_valid():
-                self.sepadd_helper.open()
+                timer = StageTimer.for_debit(self.object, "transmit")
+                with timer.stage("fints_open"):
+                    self.sepadd_helper.open()
                 try:
-                    response = self.sepadd_helper.send_tan(context["tan_form"].cleaned_data["tan"].strip())
+                    with timer.stage("send_tan"):
+                        response = self.sepadd_helper.send_tan(context["tan_form"].cleaned_data["tan"].strip())
                     if isinstance(response, TransactionResponse):
                         self._handle_completed_dd(response)
                         messages.success(
@@ -933,7 +923,7 @@ class TransmitDDTANView(
                                 "Successfully authorized the direct debit with your bank"
                             ),
                         )
-                        self.object.state = DirectDebitState.TRANSMITTED.value
+                        self.object.state = transmission.response_state(response)
                     else:
                         if not DISABLE_AUDITLOGGING:
                             self.object.log(
@@ -945,7 +935,8 @@ class TransmitDDTANView(
                             self.request, _("Invalid response: {}".format(response))
                         )
                         self.object.state = DirectDebitState.FAILED.value
-                    self.sepadd_helper.close()
+                    with timer.stage("fints_close"):
+                        self.sepadd_helper.close()
                     self.sepadd_helper.delete_from_session()
                 except:
                     if not DISABLE_AUDITLOGGING:
@@ -963,7 +954,441 @@ class TransmitDDTANView(
                         ),
                     )
                 self.object.save(update_fields=["state"])
+                self._store_timings(timer)
 
                 return HttpResponseRedirect(self.success_url)
 
         return self.render_to_response(context)
+
+
+class TransmitBatchMixin(FinTSInterfaceMixin, TemplateResponseMixin):
+    request: django.http.HttpRequest
+    batch: transmission.BatchTransmission
+
+    def get_context_data(self, form, **kwargs):
+        return dict(
+            kwargs,
+            form=form,
+            debits=self.batch.debits,
+            pending=self.batch.pending,
+            currency=self.batch.currency,
+            debit_sum=sum(
+                (debit.control_sum or Decimal("0.00") for debit in self.batch.pending),
+                Decimal("0.00"),
+            ),
+        )
+
+    def _form(self):
+        return PinRequestForm(
+            **(
+                {"data": self.request.POST, "files": self.request.FILES}
+                if self.request.method in ("POST", "PUT")
+                else {}
+            )
+        )
+
+    def _next(self, resume_id):
+        if resume_id:
+            return HttpResponseRedirect(
+                reverse(
+                    "plugins:byro_directdebit:finance.directdebit.transmit_batch.tan_request",
+                    kwargs={"resume_id": resume_id},
+                )
+            )
+        return HttpResponseRedirect(
+            "{}?{}".format(
+                reverse("plugins:byro_directdebit:finance.directdebit.transmit_batch"),
+                "&".join("debit={}".format(debit.pk) for debit in self.batch.debits),
+            )
+        )
+
+
+class TransmitBatchView(TransmitBatchMixin, View):
+    """Send several prepared direct debits to the bank in one FinTS dialog."""
+
+    query_budget = 15
+    template_name = "byro_directdebit/transmit_batch.html"
+
+    def setup(self, *args, **kwargs):
+        super().setup(*args, **kwargs)
+        try:
+            debits = transmission.load_batch(self.request.GET.getlist("debit"))
+        except ValueError:
+            raise Http404(_("Invalid direct debit id."))
+        self.batch = transmission.BatchTransmission(
+            None, self.request, debits, Configuration.get_solo().currency
+        )
+        try:
+            transmission.check_batch(debits)
+            self.batch_error = None
+        except ValueError as e:
+            self.batch_error = str(e)
+            self.batch.pending = [
+                debit
+                for debit in debits
+                if debit.state in transmission.TRANSMITTABLE_STATES
+            ]
+        if not self.batch_error:
+            self.batch.helper = transmission.get_helper(
+                self.fints_interface,
+                self.request,
+                debits[0].additional_data["user_login_pk"],
+            )
+
+    def get_context_data(self, form, **kwargs):
+        if self.batch.helper:
+            self.batch.helper.augment_form_pin_fields(form)
+        return super().get_context_data(
+            form if self.batch.helper else None, batch_error=self.batch_error, **kwargs
+        )
+
+    def get(self, request, *args, **kwargs):
+        return self.render_to_response(self.get_context_data(self._form()))
+
+    @with_fints
+    def post(self, request, *args, **kwargs):
+        form = self._form()
+        context = self.get_context_data(form)
+        if self.batch_error or not form.is_valid():
+            return self.render_to_response(context)
+
+        self.batch.helper.load_from_form(form)
+        return self._next(self.batch.start())
+
+
+class TransmitBatchTANView(TransmitBatchMixin, View):
+    query_budget = 15
+    template_name = "byro_directdebit/transmit_batch_tan.html"
+
+    def setup(self, *args, **kwargs):
+        super().setup(*args, **kwargs)
+        try:
+            self.batch = transmission.BatchTransmission.restore(
+                self.request,
+                self.kwargs["resume_id"],
+                Configuration.get_solo().currency,
+            )
+        except KeyError:
+            raise Http404(_("This transmission is not waiting for a TAN."))
+
+    def get_context_data(self, form, **kwargs):
+        helper = self.batch.helper
+        helper.augment_form_pin_fields(form)
+        helper.augment_form_tan_fields(form)
+        return dict(
+            super().get_context_data(form, **kwargs),
+            standin=transmission.use_standin(),
+            **helper.get_tan_context_data(helper.tan_request)
+        )
+
+    def get(self, request, *args, **kwargs):
+        return self.render_to_response(self.get_context_data(self._form()))
+
+    @with_fints
+    def post(self, request, *args, **kwargs):
+        form = self._form()
+        context = self.get_context_data(form)
+        if not form.is_valid():
+            return self.render_to_response(context)
+
+        return self._next(self.batch.send_tan(form.cleaned_data["tan"].strip()))
+
+
+class DirectDebitScopeForm(forms.ModelForm):
+    fee_intervals = forms.TypedMultipleChoiceField(
+        choices=FeeIntervals.choices,
+        coerce=int,
+        required=False,
+        widget=forms.CheckboxSelectMultiple,
+        label=_("Fee intervals"),
+        help_text=DirectDebitScope._meta.get_field("fee_intervals").help_text,
+    )
+
+    class Meta:
+        model = DirectDebitScope
+        fields = [
+            "name",
+            "member_numbers",
+            "exclude_member_numbers",
+            "countries",
+            "exclude_countries",
+            "fee_intervals",
+            "debit_day",
+        ]
+
+    def _clean_member_numbers(self, field):
+        try:
+            return scopes.format_member_numbers(
+                scopes.parse_member_numbers(self.cleaned_data[field])
+            )
+        except ValueError as e:
+            raise forms.ValidationError(str(e))
+
+    def _clean_countries(self, field):
+        try:
+            return ",".join(sorted(scopes.parse_countries(self.cleaned_data[field])))
+        except ValueError as e:
+            raise forms.ValidationError(str(e))
+
+    def clean_member_numbers(self):
+        return self._clean_member_numbers("member_numbers")
+
+    def clean_exclude_member_numbers(self):
+        return self._clean_member_numbers("exclude_member_numbers")
+
+    def clean_countries(self):
+        return self._clean_countries("countries")
+
+    def clean_exclude_countries(self):
+        return self._clean_countries("exclude_countries")
+
+
+class DirectDebitScopeListView(ListView):
+    query_budget = 6
+    template_name = "byro_directdebit/scopes.html"
+    model = DirectDebitScope
+    context_object_name = "scopes"
+
+
+class DirectDebitScopeMixin:
+    model = DirectDebitScope
+    success_url = reverse_lazy("plugins:byro_directdebit:finance.directdebit.scopes")
+
+
+class DirectDebitScopeCreateView(DirectDebitScopeMixin, CreateView):
+    query_budget = 6
+    template_name = "byro_directdebit/scope_form.html"
+    form_class = DirectDebitScopeForm
+
+
+class DirectDebitScopeUpdateView(DirectDebitScopeMixin, UpdateView):
+    query_budget = 6
+    template_name = "byro_directdebit/scope_form.html"
+    form_class = DirectDebitScopeForm
+
+
+class DirectDebitScopeDeleteView(DirectDebitScopeMixin, DeleteView):
+    query_budget = 6
+    template_name = "byro_directdebit/scope_confirm_delete.html"
+    context_object_name = "scope"
+
+
+class ImportReturnsForm(forms.Form):
+    status_report = forms.FileField(
+        label=_("Status report"),
+        help_text=_(
+            "A pain.002 payment status report or a camt.054 debit/credit notification from your bank."
+        ),
+    )
+
+
+class ImportReturnsView(FormView):
+    query_budget = 12
+    template_name = "byro_directdebit/import_returns.html"
+    form_class = ImportReturnsForm
+    success_url = reverse_lazy("plugins:byro_directdebit:finance.directdebit.history")
+
+    def form_valid(self, form):
+        try:
+            result = returns.import_status_report(form.cleaned_data["status_report"])
+        except ValueError as e:
+            form.add_error("status_report", str(e))
+            return self.form_invalid(form)
+
+        messages.success(
+            self.request,
+            _(
+                "Read %(entries)s entries: %(executed)s payments executed, %(bounced)s bounced."
+            )
+            % {
+                "entries": result.entries,
+                "executed": result.updated[returns.EXECUTED],
+                "bounced": result.updated[returns.BOUNCED],
+            },
+        )
+        if result.unmatched:
+            messages.warning(
+                self.request,
+                ngettext_lazy(
+                    "%(n)s entry did not match any payment.",
+                    "%(n)s entries did not match any payment.",
+                    len(result.unmatched),
+                )
+                % {"n": len(result.unmatched)},
+            )
+        return super().form_valid(form)
+
+
+class DirectDebitHistoryFilterForm(forms.Form):
+    state = forms.ChoiceField(
+        required=False,
+        choices=[("", _("All states"))]
+        + [(state.value, state.value) for state in DirectDebitState],
+    )
+    start = forms.DateField(required=False, label=_("From"))
+    end = forms.DateField(required=False, label=_("Until"))
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if (
+            cleaned_data.get("start")
+            and cleaned_data.get("end")
+            and cleaned_data["start"] > cleaned_data["end"]
+        ):
+            raise forms.ValidationError(_("The start date must not be after the end."))
+        return cleaned_data
+
+    def datetime_range(self, field="datetime") -> dict:
+        """Lookups restricting ``field`` to the selected days, index friendly."""
+        lookups = {}
+        if self.cleaned_data.get("start"):
+            lookups[field + "__gte"] = make_aware(
+                datetime.datetime.combine(self.cleaned_data["start"], datetime.time())
+            )
+        if self.cleaned_data.get("end"):
+            lookups[field + "__lt"] = make_aware(
+                datetime.datetime.combine(
+                    self.cleaned_data["end"] + datetime.timedelta(days=1),
+                    datetime.time(),
+                )
+            )
+        return lookups
+
+
+class DirectDebitHistoryMixin:
+    paginate_by = 50
+    request: django.http.HttpRequest
+
+    @cached_property
+    def filter_form(self):
+        return DirectDebitHistoryFilterForm(data=self.request.GET or None)
+
+    def get_queryset(self):
+        debits = DirectDebit.objects.defer("additional_data").order_by(
+            "-datetime", "-pk"
+        )
+        if self.filter_form.is_valid():
+            if self.filter_form.cleaned_data["state"]:
+                debits = debits.filter(state=self.filter_form.cleaned_data["state"])
+            debits = debits.filter(**self.filter_form.datetime_range())
+        return debits
+
+    def get_page(self):
+        """The debits of the current page and the ``after`` value of the next one.
+
+        Keyset pagination on ``(datetime, id)``: ``?after=<id>`` continues
+        after the debit with that id."""
+        debits = self.get_queryset()
+
+        after = self.request.GET.get("after")
+        if after:
+            try:
+                last = DirectDebit.objects.only("datetime").get(pk=after)
+            except (DirectDebit.DoesNotExist, ValidationError):
+                raise Http404(_("Invalid keyset position."))
+            debits = debits.filter(
+                Q(datetime__lt=last.datetime)
+                | Q(datetime=last.datetime, pk__lt=last.pk)
+            )
+
+        page = list(debits[: self.paginate_by + 1])
+        next_after = (
+            page[self.paginate_by - 1].pk if len(page) > self.paginate_by else None
+        )
+        return page[: self.paginate_by], next_after
+
+
+class DirectDebitHistoryView(DirectDebitHistoryMixin, TemplateView):
+    query_budget = 10
+    template_name = "byro_directdebit/history.html"
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["debits"], context["next_after"] = self.get_page()
+        context["form"] = self.filter_form
+        context["currency"] = Configuration.get_solo().currency
+        context["transmittable_states"] = transmission.TRANSMITTABLE_STATES
+        return context
+
+
+def _debit_json(debit: DirectDebit) -> dict:
+    return {
+        "id": str(debit.pk),
+        "datetime": debit.datetime.isoformat(),
+        "state": debit.state,
+        "cor1": debit.cor1,
+        "payment_count": debit.payment_count,
+        "control_sum": (
+            str(debit.control_sum) if debit.control_sum is not None else None
+        ),
+        "sequence_type_totals": debit.sequence_type_totals,
+    }
+
+
+class DirectDebitHistoryAPIView(DirectDebitHistoryMixin, View):
+    query_budget = 3
+
+    def get(self, request, *args, **kwargs):
+        if self.filter_form.is_bound and not self.filter_form.is_valid():
+            return JsonResponse(
+                {"errors": self.filter_form.errors.get_json_data()}, status=400
+            )
+
+        debits, next_after = self.get_page()
+        return JsonResponse(
+            {
+                "results": [_debit_json(debit) for debit in debits],
+                "next_after": str(next_after) if next_after else None,
+            }
+        )
+
+
+class MemberDirectDebitPaymentsAPIView(View):
+    """The direct debit payments of a member, by collection date.
+
+    ``total`` only sums the executed payments, ``totals`` has the sums for
+    every payment state."""
+
+    query_budget = 3
+
+    def get(self, request, *args, **kwargs):
+        member = get_object_or_404(Member, pk=kwargs["pk"])
+        form = DirectDebitHistoryFilterForm(data=request.GET or None)
+        if form.is_bound and not form.is_valid():
+            return JsonResponse({"errors": form.errors.get_json_data()}, status=400)
+
+        payments = DirectDebitPayment.objects.filter(member=member).order_by(
+            "collection_date"
+        )
+        if form.is_bound:
+            payments = payments.filter(**form.datetime_range("collection_date"))
+            if form.cleaned_data["state"]:
+                payments = payments.filter(state=form.cleaned_data["state"])
+
+        results = [
+            {
+                "id": str(payment.pk),
+                "direct_debit": str(payment.direct_debit_id),
+                "collection_date": localtime(payment.collection_date)
+                .date()
+                .isoformat(),
+                "type": payment.type,
+                "amount": str(payment.amount),
+                "state": payment.state,
+            }
+            for payment in payments
+        ]
+        totals = {}
+        for result in results:
+            amount = Decimal(result["amount"])
+            totals[result["state"]] = totals.get(result["state"], 0) + amount
+        return JsonResponse(
+            {
+                "member": member.pk,
+                "results": results,
+                "total": str(
+                    totals.get(DirectDebitState.EXECUTED.value, Decimal("0.00"))
+                ),
+                "totals": {state: str(total) for state, total in totals.items()},
+            }
+        )
@@ -0,0 +1,357 @@
+import datetime
+import io
+import time
+from decimal import Decimal
+from itertools import cycle
+
+from django.contrib.auth import get_user_model
+from django.contrib.messages.storage.fallback import FallbackStorage
+from django.contrib.sessions.backends.db import SessionStore
+from django.db import connection
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+from django.utils.timezone import now
+
+from byro.bookkeeping.models import Booking, Transaction
+from byro.bookkeeping.special_accounts import SpecialAccounts
+from byro.members.models import Member, Membership
+from byro.plugins.sepa.models import MemberSepa
+from schwifty import IBAN
+
+from byro_directdebit import counters, jobs, returns
+from byro_directdebit.bulk import bulk_batch_size
+from byro_directdebit.models import (
+    DirectDebitConfiguration,
+    DirectDebitJob,
+    DirectDebitPayment,
+)
+from byro_directdebit.querybudget import budget_report, budgeted, get_query_budget
+from byro_directdebit.timing import debit_timings
+
+NAME_PREFIX = "Benchmark member "
+
+# (country, bank code, BIC to store). Austrian IBANs cannot be mapped to a
+# BIC, so some of them end up without one.
+BANKS = [
+    ("DE", "37040044", None),
+    ("DE", "37040044", None),
+    ("DE", "37040044", "COBADEFFXXX"),
+    ("AT", "19043", "BKAUATWW"),
+    ("AT", "19043", None),
+    ("NL", "ABNA", None),
+    ("FR", "3000600001", None),
+    ("ES", "21000418", None),
+]
+
+# One entry per member in turn: mandate state and how the profile is broken
+PROFILES = [
+    ("active", "no_iban"),
+    ("active", "invalid_iban"),
+    ("rescinded", None),
+    ("bounced", None),
+    ("inactive", None),
+    ("active", "invalid_bic"),
+    ("active", "no_mandate_reference"),
+] + [("active", None)] * 13
+
+
+def create_population(size: int):
+    """Create ``size`` members with a mix of SEPA profiles and balances.
+
+    A third of the members owes a fee, a third has paid it and a third only
+    has a membership without any bookings yet."""
+    fees_receivable = SpecialAccounts.fees_receivable
+    fees = SpecialAccounts.fees
+    today = now().date()
+
+    Member.objects.bulk_create(
+        (
+            Member(
+                number=str(900000000 + i),
+                name="{}{}".format(NAME_PREFIX, i),
+                email="member{}@example.org".format(i),
+            )
+            for i in range(size)
+        ),
+        batch_size=bulk_batch_size(),
+    )
+    member_ids = list(
+        Member.objects.filter(name__startswith=NAME_PREFIX)
+        .order_by("pk")
+        .values_list("pk", flat=True)
+    )
+
+    profiles, memberships, bookings = [], [], []
+    transaction = Transaction.objects.create(
+        value_datetime=now() - datetime.timedelta(days=1),
+        memo="Benchmark",
+        user_or_context="benchmark",
+    )
+    for i, (member_id, (country, bank_code, bic), (mandate_state, broken)) in enumerate(
+        zip(member_ids, cycle(BANKS), cycle(PROFILES))
+    ):
+        iban = str(IBAN.generate(country, bank_code=bank_code, account_code=str(i)))
+        profiles.append(
+            MemberSepa(
+                member_id=member_id,
+                iban={"no_iban": "", "invalid_iban": iban[:-1] + "X"}.get(broken, iban),
+                bic="XXXX" if broken == "invalid_bic" else bic,
+                mandate_state=mandate_state,
+                mandate_reference=(
+                    None
+                    if broken == "no_mandate_reference"
+                    else "BENCH{:010d}".format(i)
+                ),
+                issue_date=today,
+            )
+        )
+        memberships.append(
+            Membership(
+                member_id=member_id,
+                start=today - datetime.timedelta(days=365),
+                amount=Decimal("10.00"),
+                interval=1,
+            )
+        )
+        if i % 3 != 2:
+            bookings.append(
+                Booking(
+                    transaction=transaction,
+                    amount=Decimal(10 + i % 7),
+                    debit_account=fees_receivable,
+                    credit_account=fees,
+                    member_id=member_id,
+                )
+            )
+        if i % 3 == 1:
+            bookings.append(
+                Booking(
+                    transaction=transaction,
+                    amount=Decimal(10 + i % 7),
+                    credit_account=fees_receivable,
+                    member_id=member_id,
+                )
+            )
+
+    MemberSepa.objects.bulk_create(profiles, batch_size=bulk_batch_size())
+    Membership.objects.bulk_create(memberships, batch_size=bulk_batch_size())
+    Booking.objects.bulk_create(bookings, batch_size=bulk_batch_size())
+
+
+def status_report(endtoend_ids) -> bytes:
+    """A pain.002 report that rejects every tenth payment and settles the rest."""
+    transactions = "".join(
+        "<TxInfAndSts><OrgnlEndToEndId>{}</OrgnlEndToEndId><TxSts>{}</TxSts></TxInfAndSts>".format(
+            endtoend_id, "RJCT" if i % 10 == 0 else "ACSC"
+        )
+        for i, endtoend_id in enumerate(endtoend_ids)
+    )
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<Document xmlns="urn:iso:std:iso:20022:tech:xsd:pain.002.001.03">'
+        "<CstmrPmtStsRpt><OrgnlPmtInfAndSts>{}</OrgnlPmtInfAndSts></CstmrPmtStsRpt>"
+        "</Document>".format(transactions)
+    ).encode("utf-8")
+
+
+def view_request(user, url_name: str, method="get", data=None, **kwargs):
+    """A request for a plugin view as ``user``, without the middleware.
+
+    Call ``request.resolver_match.func`` with it to run the view."""
+    path = reverse("plugins:byro_directdebit:" + url_name, kwargs=kwargs)
+    request = getattr(RequestFactory(), method)(path, data or {})
+    request.user = user
+    request.session = SessionStore()
+    request._messages = FallbackStorage(request)
+    request.resolver_match = resolve(path)
+    return request
+
+
+def assign_mandates_data() -> dict:
+    template = (
+        DirectDebitConfiguration.get_solo().mandate_reference_notification_template
+    )
+    return {
+        "prefix": "BENCH",
+        "length": 22,
+        "subject": template.subject,
+        "text": template.text,
+    }
+
+
+def prepare_data() -> dict:
+    template = DirectDebitConfiguration.get_solo().debit_notification_template
+    return {
+        "debit_date": (now() + datetime.timedelta(days=14)).date(),
+        "debit_text": "Benchmark",
+        "own_name": "Benchmark",
+        "own_iban": "DE89370400440532013000",
+        "own_bic": "COBADEFFXXX",
+        "sepa_format": "pain.008.001.02",
+        "exp_bank_types": "ALL",
+        "exp_member_numbers": "",
+        "subject": template.subject,
+        "text": template.text,
+    }
+
+
+def create_user():
+    return get_user_model().objects.create(
+        username="directdebit-benchmark", is_staff=True, is_superuser=True
+    )
+
+
+class Benchmark:
+    """Runs the plugin's views against the current database and measures them.
+
+    Every case is run once, recording the wall clock time and the number
+    of queries, and for views also their ``query_budget``."""
+
+    def __init__(self, size: int):
+        self.size = size
+        self.results = []
+        self.user = create_user()
+
+    def measure(self, name, function, *args, budget=None, **kwargs):
+        start = time.perf_counter()
+        with CaptureQueriesContext(connection) as queries:
+            result = function(*args, **kwargs)
+            if hasattr(result, "render"):
+                result.render()
+        record = {
+            "size": self.size,
+            "case": name,
+            "seconds": time.perf_counter() - start,
+            "queries": len(queries.captured_queries),
+        }
+        if budget is not None:
+            record["budget"] = budget
+            counted = budgeted(queries.captured_queries)
+            if len(counted) > budget:
+                record["over_budget"] = budget_report(name, counted, budget)
+        self.results.append(record)
+        return result
+
+    def measure_view(self, name, url_name, method="get", data=None, **kwargs):
+        request = view_request(self.user, url_name, method, data, **kwargs)
+        return self.measure(
+            name,
+            request.resolver_match.func,
+            request,
+            budget=get_query_budget(request.resolver_match.func),
+            **request.resolver_match.kwargs
+        )
+
+    def run(self):
+        from byro_directdebit.views import MemberList, MemberListExportView
+
+        self.measure("create_population", create_population, self.size)
+        self.measure("counters_rebuild", counters.rebuild)
+
+        self.measure_view("dashboard", "finance.directdebit.dashboard")
+
+        for mode in (
+            ["all", "due"]
+            + list(MemberList.STATE_FILTERS)
+            + list(MemberList.DUE_STATE_FILTERS)
+        ):
+            self.measure_view(
+                "member_list:{}".format(mode),
+                "finance.directdebit.list",
+                data={"filter": mode},
+            )
+        for export_format in MemberListExportView.FORMATS:
+            response = self.measure_view(
+                "member_list:export:{}".format(export_format),
+                "finance.directdebit.list.export",
+                data={"filter": "all"},
+                format=export_format,
+            )
+            # The rows are only fetched while the response is consumed
+            self.measure(
+                "member_list:export:{}:stream".format(export_format),
+                lambda: sum(len(chunk) for chunk in response.streaming_content),
+            )
+        self.measure_view(
+            "member_list:all:keyset",
+            "finance.directdebit.list",
+            data={"after": 2**31},
+        )
+
+        self.measure_view(
+            "assign_mandates:form", "finance.directdebit.assign_sepa_mandates"
+        )
+        self.measure_view(
+            "assign_mandates",
+            "finance.directdebit.assign_sepa_mandates",
+            method="post",
+            data=assign_mandates_data(),
+        )
+
+        self.measure_view("prepare:form", "finance.directdebit.prepare_dd")
+        self.measure_view(
+            "prepare:preview",
+            "finance.directdebit.prepare_dd.preview",
+            method="post",
+            data=prepare_data(),
+        )
+        self.measure_view(
+            "prepare",
+            "finance.directdebit.prepare_dd",
+            method="post",
+            data=prepare_data(),
+        )
+        self.measure("prepare_job", jobs.run_pending_jobs)
+
+        self.measure_view("history", "finance.directdebit.history")
+        self.measure_view(
+            "history:api",
+            "finance.directdebit.api.history",
+            data={"state": "unknown", "start": now().date()},
+        )
+        self.measure_view(
+            "history:member_payments",
+            "finance.directdebit.api.member_payments",
+            data={"start": now().date().replace(month=1, day=1)},
+            pk=Member.objects.filter(name__startswith=NAME_PREFIX).latest("pk").pk,
+        )
+
+        report = status_report(
+            pk.hex for pk in DirectDebitPayment.objects.values_list("pk", flat=True)
+        )
+        self.measure(
+            "import_returns",
+            returns.import_status_report,
+            io.BytesIO(report),
+        )
+
+        for job in DirectDebitJob.objects.filter(direct_debit__isnull=False):
+            self.measure_view(
+                "prepare:job", "finance.directdebit.prepare_dd.job", pk=job.pk
+            )
+            self.measure_view(
+                "prepare:job_progress",
+                "finance.directdebit.prepare_dd.job.progress",
+                pk=job.pk,
+            )
+            debit = job.direct_debit
+            self.measure("load_sepa_xml", debit.get_sepa_xml)
+            self.measure_view(
+                "transmit:sepa_xml",
+                "finance.directdebit.transmit_dd.sepa_xml",
+                pk=debit.pk,
+            ).close()
+            for flow, stage, seconds, count in debit_timings(debit):
+                self.results.append(
+                    {
+                        "size": self.size,
+                        "case": "{}:{}".format(flow, stage),
+                        "seconds": seconds,
+                        "count": count,
+                    }
+                )
+            if debit.sepa_xml_file:
+                debit.sepa_xml_file.delete(save=False)
+
+        return self.results
@@ -0,0 +1,62 @@
+import json
+import platform
+
+import pytest
+from django.db import connection
+
+from .benchmark import Benchmark
+
+RESULTS = []
+
+
+def pytest_generate_tests(metafunc):
+    sizes = metafunc.config.getoption("benchmark_sizes")
+    metafunc.parametrize("size", [int(x) for x in sizes.split(",") if x])
+
+
+@pytest.fixture(scope="module")
+def results(request):
+    yield RESULTS
+    if not RESULTS:
+        return
+
+    try:
+        from importlib.metadata import version
+
+        plugin_version = version("byro-directdebit")
+    except Exception:
+        plugin_version = None
+
+    output = request.config.getoption("benchmark_output")
+    with open(output, "w") as f:
+        json.dump(
+            {
+                "plugin_version": plugin_version,
+                "database": connection.vendor,
+                "python": platform.python_version(),
+                "results": RESULTS,
+            },
+            f,
+            indent=2,
+        )
+
+
+def test_benchmark(configuration, results, request, capsys, settings, tmp_path, size):
+    settings.DIRECTDEBIT_PRIVATE_ROOT = str(tmp_path)
+    size_results = Benchmark(size).run()
+    results.extend(size_results)
+
+    with capsys.disabled():
+        print("\nPopulation of {} members".format(size))
+        for result in size_results:
+            print(
+                "  {case:40} {seconds:10.3f}s {queries:>8} {budget:>8}".format(
+                    **dict({"queries": "", "budget": ""}, **result)
+                )
+            )
+
+    if request.config.getoption("check_budgets"):
+        over_budget = [
+            result["over_budget"] for result in size_results if "over_budget" in result
+        ]
+        assert not over_budget, "\n".join(over_budget)
@@ -0,0 +1,80 @@
+from types import SimpleNamespace
+
+import pytest
+from django.db.models.signals import post_delete, post_save
+
+from byro.common.models import Configuration
+
+from byro_directdebit import counters, signals
+from byro_directdebit.models import DirectDebitConfiguration, DirectDebitScope
+
+from .benchmarks.benchmark import create_population, create_user
+
+# More than a page of the member list and several cycles of the profiles,
+# so that per row queries go over the budgets
+POPULATION = 120
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup("byro-directdebit benchmark")
+    group.addoption(
+        "--benchmark-sizes",
+        default="",
+        help="Comma separated population sizes to run tests/benchmarks with",
+    )
+    group.addoption(
+        "--benchmark-output",
+        default="directdebit-benchmark.json",
+        help="File to write the benchmark results to, as JSON",
+    )
+    group.addoption(
+        "--check-budgets",
+        action="store_true",
+        help="Fail the benchmark if a view runs more queries than its query_budget",
+    )
+
+
+@pytest.fixture(autouse=True)
+def static_files(settings):
+    """Render templates without a collectstatic manifest."""
+    settings.STATICFILES_STORAGE = (
+        "django.contrib.staticfiles.storage.StaticFilesStorage"
+    )
+
+
+@pytest.fixture
+def user(db):
+    return create_user()
+
+
+@pytest.fixture
+def configuration(db):
+    """The association and creditor settings a debit needs."""
+    global_config = Configuration.get_solo()
+    global_config.name = "Verein e.V."
+    global_config.currency = "EUR"
+    global_config.save()
+    config = DirectDebitConfiguration.get_solo()
+    config.creditor_id = "DE98ZZZ09999999999"
+    config.save()
+
+
+@pytest.fixture
+def population(configuration):
+    """``POPULATION`` members of the benchmark, with the counters built."""
+    create_population(POPULATION)
+    counters.rebuild()
+
+
+@pytest.fixture
+def fints_model(monkeypatch):
+    """Stand in for the models of byro_fints with ``DirectDebitScope``."""
+    fints_app = SimpleNamespace(get_models=lambda: [DirectDebitScope])
+    monkeypatch.setattr(signals.apps, "get_app_config", lambda label: fints_app)
+    signals.connect_bank_connection_changed()
+    yield DirectDebitScope
+    for signal in (post_save, post_delete):
+        signal.disconnect(
+            sender=DirectDebitScope,
+            dispatch_uid="byro_directdebit.bank_connection_changed",
+        )
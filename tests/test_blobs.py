@@ -0,0 +1,38 @@
+import hashlib
+import io
+
+import pytest
+
+from byro_directdebit.blobs import private_storage
+from byro_directdebit.models import DirectDebit
+
+XML = b'<?xml version="1.0" encoding="UTF-8"?><Document/>'
+
+
+@pytest.fixture
+def private_root(settings, tmp_path):
+    settings.MEDIA_ROOT = str(tmp_path / "media")
+    settings.DIRECTDEBIT_PRIVATE_ROOT = str(tmp_path / "private")
+    return tmp_path / "private"
+
+
+def test_store_and_open(private_root):
+    first, second = DirectDebit(), DirectDebit()
+    first.store_sepa_xml(io.BytesIO(XML))
+    second.store_sepa_xml(io.BytesIO(XML))
+
+    assert first.sepa_xml_sha256 == hashlib.sha256(XML).hexdigest()
+    assert first.sepa_xml_file.name == second.sepa_xml_file.name
+    assert first.get_sepa_xml() == XML.decode("utf-8")
+    assert [path.name for path in private_root.rglob("*.gz")] == [
+        first.sepa_xml_sha256 + ".xml.gz"
+    ]
+
+
+def test_not_public(private_root):
+    debit = DirectDebit()
+    debit.store_sepa_xml(io.BytesIO(XML))
+    assert debit.sepa_xml_file.storage is private_storage
+    with pytest.raises(ValueError):
+        debit.sepa_xml_file.url
+    assert not (private_root.parent / "media").exists()
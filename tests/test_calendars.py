@@ -0,0 +1,66 @@
+import datetime
+
+import pytest
+
+from byro_directdebit.calendars import TARGET2, CalendarService
+
+
+@pytest.fixture
+def service():
+    return CalendarService()
+
+
+def test_closed_days(service):
+    days = service.closed_days("DE", 2024)
+    assert datetime.date(2024, 12, 25) in days  # Christmas
+    assert datetime.date(2024, 6, 1) in days  # Saturday
+    assert datetime.date(2024, 6, 3) not in days
+    assert service.closed_days("DE", 2024) is days
+
+
+def test_is_working_day(service):
+    assert service.is_working_day(datetime.date(2024, 6, 3), ["DE"])
+    assert service.is_working_day(datetime.datetime(2024, 6, 3, 12), ["DE"])
+    assert not service.is_working_day(datetime.date(2024, 6, 2), ["DE"])
+    # Whit Monday is a holiday in Germany, but not in the TARGET2 calendar
+    assert not service.is_working_day(datetime.date(2024, 5, 20), ["DE"])
+    assert service.is_working_day(datetime.date(2024, 5, 20), [TARGET2])
+    assert not service.is_working_day(datetime.date(2024, 5, 20), ["DE", TARGET2])
+
+
+def test_following_working_day(service):
+    assert service.following_working_day(
+        datetime.date(2024, 12, 24), [TARGET2]
+    ) == datetime.date(2024, 12, 24)
+    # Christmas, Boxing Day and the weekend
+    assert service.following_working_day(
+        datetime.date(2024, 12, 25), [TARGET2]
+    ) == datetime.date(2024, 12, 27)
+    assert service.following_working_day(
+        datetime.date(2024, 12, 28), [TARGET2]
+    ) == datetime.date(2024, 12, 30)
+
+
+def test_collection_dates(service):
+    dates = service.collection_dates(
+        [1, 2, 5], ["DE"], start_date=datetime.date(2024, 12, 23), target2=True
+    )
+    assert dates == {
+        ("DE", 1): datetime.date(2024, 12, 24),
+        ("DE", 2): datetime.date(2024, 12, 27),
+        ("DE", 5): datetime.date(2024, 12, 30),
+    }
+
+
+def test_cache_is_bounded(service):
+    service.maxsize = 2
+    first = service.closed_days("DE", 2023)
+    service.closed_days("DE", 2024)
+    assert service.closed_days("DE", 2023) is first
+    service.closed_days("DE", 2025)
+    assert list(service._closed_days) == [("DE", 2023), ("DE", 2025)]
+
+
+def test_unknown_region(service):
+    with pytest.raises(LookupError):
+        service.closed_days("XX-YY", 2024)
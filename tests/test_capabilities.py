@@ -0,0 +1,176 @@
+import itertools
+from types import SimpleNamespace
+
+import pytest
+from django.core.cache import cache
+from fints.client import FinTSOperations
+from schwifty import IBAN
+
+from byro_directdebit import capabilities
+
+CORE = "urn:iso:std:iso:20022:tech:xsd:pain.008.003.02.xsd"
+CORE_OLD = "urn:iso:std:iso:20022:tech:xsd:pain.008.002.02"
+COR1 = "urn:iso:std:iso:20022:tech:xsd:pain.008.001.02.xsd"
+
+ACCOUNTS = {
+    "no iban": {"iban": ""},
+    "no debit": {"iban": "DE89370400440532013000"},
+    "core": {
+        "iban": "de02 1203 0000 0000 2020 51",
+        "operations": [FinTSOperations.SEPA_DEBIT_MULTIPLE],
+    },
+    "cor1": {
+        "iban": "DE02500105170137075030",
+        "operations": [FinTSOperations.SEPA_DEBIT_MULTIPLE_COR1],
+    },
+}
+
+FORMATS = {
+    "unknown": {},
+    "core": {FinTSOperations.SEPA_DEBIT_MULTIPLE: [CORE, CORE_OLD]},
+    "cor1": {FinTSOperations.SEPA_DEBIT_MULTIPLE_COR1: [COR1]},
+    "both": {
+        FinTSOperations.SEPA_DEBIT_MULTIPLE: [CORE],
+        FinTSOperations.SEPA_DEBIT_MULTIPLE_COR1: [COR1],
+    },
+    "other": {FinTSOperations.SEPA_TRANSFER_MULTIPLE: [CORE]},
+}
+
+
+def connection(accounts, formats):
+    return {
+        "accounts": [
+            {
+                "iban": ACCOUNTS[name]["iban"],
+                "supported_operations": {
+                    operation: operation in ACCOUNTS[name].get("operations", ())
+                    for operation in FinTSOperations
+                },
+            }
+            for name in accounts
+        ],
+        "bank": {"supported_formats": FORMATS[formats]},
+    }
+
+
+def previous_selection(connections):
+    """The account selection of ``PrepareDDView.setup()`` before it was cached."""
+    selected_account = selected_user_login_pk = selected_formats = None
+    do_cor1 = False
+    fallback_account = fallback_user_login_pk = None
+    for user_login_pk, connection in connections.items():
+        for account in connection.get("accounts", []):
+            if "iban" in account and account["iban"]:
+                iban = IBAN(account["iban"])
+                if not fallback_account:
+                    fallback_account = iban
+                    fallback_user_login_pk = user_login_pk
+                operations = account["supported_operations"]
+                if (
+                    operations[FinTSOperations.SEPA_DEBIT_MULTIPLE]
+                    or operations[FinTSOperations.SEPA_DEBIT_MULTIPLE_COR1]
+                ) and not selected_account:
+                    selected_account = iban
+                    selected_user_login_pk = user_login_pk
+                    supported = connection.get("bank", {}).get("supported_formats", {})
+                    if supported:
+                        sup_mul = supported.get(FinTSOperations.SEPA_DEBIT_MULTIPLE)
+                        sup_mul_cor1 = supported.get(
+                            FinTSOperations.SEPA_DEBIT_MULTIPLE_COR1
+                        )
+                        if sup_mul:
+                            selected_formats, do_cor1 = sup_mul, False
+                        elif sup_mul_cor1:
+                            selected_formats, do_cor1 = sup_mul_cor1, True
+                        else:
+                            selected_account = selected_user_login_pk = None
+
+    if selected_formats:
+        selected_formats = set(
+            (e[:-4] if e.lower().endswith(".xsd") else e).rsplit(":", 1)[-1]
+            for e in selected_formats
+        )
+    debit_capable = bool(selected_account)
+    if not selected_account:
+        selected_account = fallback_account
+        selected_user_login_pk = fallback_user_login_pk
+    return (
+        selected_account,
+        selected_user_login_pk,
+        selected_formats,
+        do_cor1,
+        debit_capable,
+    )
+
+
+LOGINS = [
+    (accounts, formats)
+    for accounts in [
+        (),
+        ("no iban",),
+        ("no debit",),
+        ("no debit", "cor1"),
+        ("core",),
+        ("cor1", "core"),
+    ]
+    for formats in FORMATS
+]
+
+
+@pytest.mark.parametrize(
+    "logins",
+    [[login] for login in LOGINS] + list(itertools.product(LOGINS[::3], LOGINS[1::4])),
+)
+def test_select_matches_previous_selection(logins):
+    connections = {
+        user_login_pk: connection(accounts, formats)
+        for user_login_pk, (accounts, formats) in enumerate(logins, 1)
+    }
+    selected = capabilities.select(
+        capabilities.discover(user_login_pk, connection)
+        for user_login_pk, connection in connections.items()
+    )
+    assert (
+        selected.account,
+        selected.user_login_pk,
+        set(selected.pain_formats) if selected.pain_formats else None,
+        selected.cor1,
+        selected.debit_capable,
+    ) == previous_selection(connections)
+
+
+class FinTSInterface:
+    def __init__(self, connections):
+        self.connections = connections
+        self.calls = 0
+
+    def get_bank_connections(self):
+        self.calls += 1
+        return self.connections
+
+
+@pytest.fixture
+def fints_interface():
+    cache.clear()
+    yield FinTSInterface({1: connection(["core"], "core")})
+    cache.clear()
+
+
+@pytest.mark.django_db
+def test_cache_is_invalidated_on_bank_connection_changed(fints_model, fints_interface):
+    user = SimpleNamespace(pk=1)
+    first = capabilities.get_capabilities(fints_interface, user)
+    assert capabilities.get_capabilities(fints_interface, user) == first
+    assert capabilities.get_capabilities(fints_interface, SimpleNamespace(pk=2))
+    assert fints_interface.calls == 2
+
+    fints_interface.connections = {1: connection(["cor1"], "cor1")}
+    assert capabilities.get_capabilities(fints_interface, user) == first
+    fints_model.objects.create(name="Bank")
+    changed = capabilities.get_capabilities(fints_interface, user)
+    assert fints_interface.calls == 3
+    assert capabilities.select(changed).cor1
+
+    fints_model.objects.get().delete()
+    capabilities.get_capabilities(fints_interface, user)
+    assert fints_interface.calls == 4
@@ -0,0 +1,105 @@
+import datetime
+
+import pytest
+from django.db import transaction
+from django.utils.timezone import now
+
+from byro.plugins.sepa.models import MemberSepa
+
+from byro_directdebit import counters
+from byro_directdebit.models import DirectDebitCounter, MemberDirectDebitStatus
+
+from .benchmarks.benchmark import create_population, view_request
+from .conftest import POPULATION
+
+
+@pytest.fixture
+def unbuilt(configuration):
+    create_population(POPULATION)
+
+
+def get(user, url_name, data=None):
+    request = view_request(user, url_name, data=data)
+    response = request.resolver_match.func(request)
+    response.render()
+    return response
+
+
+@pytest.mark.django_db
+def test_views_do_not_build_the_counters(unbuilt, user):
+    response = get(user, "finance.directdebit.dashboard")
+    assert response.context_data["counters_stale"]
+    assert response.context_data["eligible"] == 0
+    assert "have not been computed yet" in response.content.decode()
+
+    response = get(user, "finance.directdebit.list", {"filter": "eligible"})
+    assert response.context_data["counters_stale"]
+    assert response.context_data["members"] == []
+
+    assert not DirectDebitCounter.objects.exists()
+
+
+@pytest.mark.django_db
+def test_refresh_builds_the_counters(unbuilt, user):
+    counters.refresh()
+
+    values = counters.get_counters()
+    assert not values["counters_stale"]
+    assert values["all_members"] == POPULATION
+    assert values["eligible"] > 0
+
+    response = get(user, "finance.directdebit.list", {"filter": "eligible"})
+    assert not response.context_data["counters_stale"]
+    assert len(response.context_data["members"]) == values["eligible"]
+
+
+@pytest.mark.django_db
+def test_overdue_rebuild_is_stale(population, user, settings):
+    settings.DIRECTDEBIT_COUNTERS_REBUILD_INTERVAL = datetime.timedelta(hours=1)
+    DirectDebitCounter.objects.update(rebuilt=now() - datetime.timedelta(hours=2))
+
+    response = get(user, "finance.directdebit.dashboard")
+    assert response.context_data["counters_stale"]
+    assert "may be out of date" in response.content.decode()
+
+    counters.refresh()
+    assert not counters.get_counters()["counters_stale"]
+
+
+def remove_iban(profile):
+    profile.iban = ""
+    profile.save()
+
+
+@pytest.mark.django_db
+def test_changes_are_updated_together(population, django_capture_on_commit_callbacks):
+    profiles = MemberSepa.objects.exclude(iban="").order_by("pk")[:3]
+    no_iban = counters.get_counters()["no_iban"]
+
+    with django_capture_on_commit_callbacks(execute=True) as callbacks:
+        with transaction.atomic():
+            for profile in profiles:
+                remove_iban(profile)
+
+    assert len(callbacks) == 1
+    assert counters.get_counters()["no_iban"] == no_iban + 3
+
+
+@pytest.mark.django_db
+def test_rolled_back_changes(population, django_capture_on_commit_callbacks):
+    rolled_back, changed = MemberSepa.objects.exclude(iban="").order_by("pk")[:2]
+    no_iban = counters.get_counters()["no_iban"]
+
+    with django_capture_on_commit_callbacks(execute=True) as callbacks:
+        with pytest.raises(RuntimeError):
+            with transaction.atomic():
+                remove_iban(rolled_back)
+                raise RuntimeError()
+        remove_iban(changed)
+
+    assert len(callbacks) == 1
+    assert counters.get_counters()["no_iban"] == no_iban + 1
+    assert (
+        MemberDirectDebitStatus.objects.get(member_id=changed.member_id).sepa_state
+        == "NO_IBAN"
+    )
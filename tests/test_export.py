@@ -0,0 +1,79 @@
+import csv
+import io
+import json
+
+import pytest
+
+from byro.bookkeeping.special_accounts import SpecialAccounts
+from byro.members.models import Member
+
+from byro_directdebit import export
+from byro_directdebit.models import DirectDebitCounter, MemberDirectDebitStatus
+from byro_directdebit.views import MemberList
+
+from .benchmarks.benchmark import view_request
+
+MODES = (
+    ["all", "due"] + list(MemberList.STATE_FILTERS) + list(MemberList.DUE_STATE_FILTERS)
+)
+
+
+@pytest.mark.parametrize(
+    "value,cell",
+    [
+        ("=1+2", "'=1+2"),
+        ("+49 30 123", "'+49 30 123"),
+        ("-2+3", "'-2+3"),
+        ("@SUM(A1)", "'@SUM(A1)"),
+        ("\t=1", "'\t=1"),
+        ("-12.50", "-12.50"),
+        ("Jane = Doe", "Jane = Doe"),
+        (None, None),
+        (42, 42),
+    ],
+)
+def test_csv_cell(value, cell):
+    assert export.csv_cell(value) == cell
+
+
+def export_lines(user, export_format, mode):
+    request = view_request(
+        user,
+        "finance.directdebit.list.export",
+        data={"filter": mode},
+        format=export_format,
+    )
+    response = request.resolver_match.func(request, **request.resolver_match.kwargs)
+    return b"".join(response.streaming_content).decode("utf-8")
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("mode", MODES)
+def test_modes_match_member_list(population, user, settings, mode):
+    settings.DIRECTDEBIT_BULK_BATCH_SIZE = 7
+    listed = list(
+        MemberList.select_members(mode, SpecialAccounts.fees_receivable)
+        .order_by("-id")
+        .values_list("pk", flat=True)
+    )
+
+    # The export evaluates the states itself
+    MemberDirectDebitStatus.objects.all().delete()
+    DirectDebitCounter.objects.all().delete()
+
+    exported = [
+        json.loads(line)["id"]
+        for line in export_lines(user, "ndjson", mode).splitlines()
+    ]
+    assert exported == listed
+
+
+@pytest.mark.django_db
+def test_csv_escapes_formulas(population, user):
+    member = Member.objects.latest("pk")
+    member.name = '=HYPERLINK("http://example.org")'
+    member.save()
+
+    rows = list(csv.DictReader(io.StringIO(export_lines(user, "csv", "all"))))
+    assert rows[0]["name"] == "'" + member.name
+    assert any(row["balance"].startswith("-") for row in rows)
@@ -0,0 +1,77 @@
+import json
+from decimal import Decimal
+
+import pytest
+from django.utils.timezone import now
+
+from byro.members.models import Member
+
+from byro_directdebit.models import DirectDebit, DirectDebitPayment, DirectDebitState
+
+from .benchmarks.benchmark import view_request
+
+
+def get_json(user, url_name, data, **kwargs):
+    request = view_request(user, url_name, data=data, **kwargs)
+    response = request.resolver_match.func(request, **request.resolver_match.kwargs)
+    return response.status_code, json.loads(response.content)
+
+
+@pytest.fixture
+def member(db):
+    return Member.objects.create(number="1", name="Jane Doe")
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize(
+    "url_name",
+    ["finance.directdebit.api.history", "finance.directdebit.api.member_payments"],
+)
+def test_invalid_filter(user, member, url_name):
+    kwargs = {"pk": member.pk} if "member" in url_name else {}
+    status, data = get_json(
+        user,
+        url_name,
+        {"state": "lost", "start": "2024-02-01", "end": "2024-01-01"},
+        **kwargs
+    )
+    assert status == 400
+    assert data["errors"]["state"][0]["code"] == "invalid_choice"
+    assert data["errors"]["__all__"][0]["message"] == (
+        "The start date must not be after the end."
+    )
+
+
+@pytest.mark.django_db
+def test_member_payment_totals(user, member):
+    debit = DirectDebit.objects.create(
+        pain_descriptor="urn:iso:std:iso:20022:tech:xsd:pain.008.001.02",
+        state=DirectDebitState.EXECUTED.value,
+    )
+    for amount, state in [
+        ("10.00", DirectDebitState.EXECUTED),
+        ("12.50", DirectDebitState.EXECUTED),
+        ("20.00", DirectDebitState.BOUNCED),
+        ("5.00", DirectDebitState.UNKNOWN),
+    ]:
+        DirectDebitPayment.objects.create(
+            direct_debit=debit,
+            member=member,
+            type="RCUR",
+            mandate_reference="REF1",
+            collection_date=now(),
+            amount=Decimal(amount),
+            state=state.value,
+        )
+
+    status, data = get_json(
+        user, "finance.directdebit.api.member_payments", {}, pk=member.pk
+    )
+    assert status == 200
+    assert len(data["results"]) == 4
+    assert data["total"] == "22.50"
+    assert data["totals"] == {
+        "executed": "22.50",
+        "bounced": "20.00",
+        "unknown": "5.00",
+    }
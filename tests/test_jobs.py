@@ -0,0 +1,151 @@
+import datetime
+
+import pytest
+from django.utils.timezone import now
+
+from byro.plugins.sepa.models import MemberSepa
+
+from byro_directdebit import jobs
+from byro_directdebit.models import DirectDebitJob, DirectDebitJobState
+from byro_directdebit.prepare import DirectDebitPreparation
+
+from .benchmarks.benchmark import prepare_data, view_request
+
+CHUNK_SIZE = 10
+
+
+@pytest.fixture
+def job(population, user, settings, tmp_path):
+    settings.DIRECTDEBIT_PRIVATE_ROOT = str(tmp_path)
+    settings.DIRECTDEBIT_CHUNK_SIZE = CHUNK_SIZE
+    request = view_request(
+        user, "finance.directdebit.prepare_dd", "post", prepare_data()
+    )
+    request.resolver_match.func(request)
+    return DirectDebitJob.objects.get()
+
+
+def fail_after(monkeypatch, chunks):
+    """Let ``process_members`` fail after ``chunks`` chunks."""
+    process_members = DirectDebitPreparation.process_members
+    calls = []
+
+    def failing(self, debit, member_ids):
+        calls.append(member_ids)
+        if len(calls) > chunks:
+            raise RuntimeError("Stopped")
+        return process_members(self, debit, member_ids)
+
+    monkeypatch.setattr(DirectDebitPreparation, "process_members", failing)
+
+
+def paid_member_ids(job):
+    return set(job.direct_debit.payments.values_list("member_id", flat=True))
+
+
+@pytest.mark.django_db
+def test_resume_skips_members_no_longer_eligible(job, monkeypatch):
+    fail_after(monkeypatch, 1)
+    jobs.run_pending_jobs()
+    job.refresh_from_db()
+    assert job.state == DirectDebitJobState.FAILED.value
+    assert job.processed == CHUNK_SIZE
+    assert job.total > 2 * CHUNK_SIZE
+
+    # Change two members that are still to be processed
+    no_iban, rescinded = job.member_ids[CHUNK_SIZE : CHUNK_SIZE + 2]
+    MemberSepa.objects.filter(member_id=no_iban).update(iban="")
+    MemberSepa.objects.filter(member_id=rescinded).update(mandate_state="rescinded")
+
+    monkeypatch.undo()
+    jobs.resume_job(job)
+    jobs.run_pending_jobs()
+    job.refresh_from_db()
+    assert job.state == DirectDebitJobState.DONE.value, job.error
+
+    assert paid_member_ids(job) == set(job.member_ids) - {no_iban, rescinded}
+    debit = job.direct_debit
+    assert debit.payment_count == job.total - 2
+    assert debit.get_sepa_xml().count("<DrctDbtTxInf>") == job.total - 2
+
+
+class Died(BaseException):
+    """The worker process ends without cleaning up."""
+
+
+def make_stale(job):
+    DirectDebitJob.objects.filter(pk=job.pk).update(
+        heartbeat=now() - jobs.STALE_AFTER - datetime.timedelta(minutes=1)
+    )
+
+
+@pytest.mark.django_db
+def test_kick_leaves_jobs_to_the_worker(settings, django_capture_on_commit_callbacks):
+    with django_capture_on_commit_callbacks() as callbacks:
+        jobs.kick()
+    assert not callbacks
+
+    settings.DIRECTDEBIT_JOBS_IN_PROCESS = True
+    with django_capture_on_commit_callbacks() as callbacks:
+        jobs.kick()
+    assert len(callbacks) == 1
+
+
+@pytest.mark.django_db
+def test_lost_claim(job):
+    first = jobs.claim_next_job()
+    assert jobs.claim_next_job() is None
+
+    make_stale(first)
+    second = jobs.claim_next_job()
+    assert second.pk == first.pk and second.owner != first.owner
+
+    with pytest.raises(jobs.JobLost):
+        jobs.heartbeat(first)
+    with pytest.raises(jobs.JobLost):
+        with jobs._fenced(first, "processed"):
+            pass
+
+    # The first worker gives up without writing anything
+    jobs.run_job(first)
+    job.refresh_from_db()
+    assert job.owner == second.owner
+    assert job.state == DirectDebitJobState.RUNNING.value
+    assert job.direct_debit is None
+
+
+@pytest.mark.django_db
+def test_stale_job_is_resumed_from_checkpoint(job, monkeypatch):
+    process_members = DirectDebitPreparation.process_members
+    chunks = []
+
+    def dying(self, debit, member_ids):
+        if chunks:
+            raise Died()
+        chunks.append(member_ids)
+        return process_members(self, debit, member_ids)
+
+    monkeypatch.setattr(DirectDebitPreparation, "process_members", dying)
+    with pytest.raises(Died):
+        jobs.run_job(jobs.claim_next_job())
+    job.refresh_from_db()
+    assert job.state == DirectDebitJobState.RUNNING.value
+    assert job.processed == CHUNK_SIZE
+
+    make_stale(job)
+    reclaimed = jobs.claim_next_job()
+
+    def recording(self, debit, member_ids):
+        chunks.append(member_ids)
+        return process_members(self, debit, member_ids)
+
+    monkeypatch.setattr(DirectDebitPreparation, "process_members", recording)
+    jobs.run_job(reclaimed)
+    job.refresh_from_db()
+    assert job.state == DirectDebitJobState.DONE.value, job.error
+
+    # Every member was processed once, the second worker started after the checkpoint
+    assert chunks[1][0] == job.member_ids[CHUNK_SIZE]
+    assert sum(chunks, []) == job.member_ids
+    assert paid_member_ids(job) == set(job.member_ids)
+    assert job.direct_debit.payments.count() == job.total
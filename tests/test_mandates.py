@@ -0,0 +1,97 @@
+import pytest
+from django.db import connection
+from django.db.models import QuerySet
+
+from byro.mails.models import EMail
+from byro.members.models import Member
+from byro.plugins.sepa.models import MemberSepa
+
+from byro_directdebit import bulk
+from byro_directdebit.mandates import MandateReferenceAllocator
+from byro_directdebit.models import DirectDebitConfiguration
+
+from .benchmarks.benchmark import assign_mandates_data, view_request
+
+
+@pytest.fixture
+def locks(monkeypatch):
+    """Record the model and savepoint of every ``select_for_update()``."""
+    select_for_update = QuerySet.select_for_update
+    locks = []
+
+    def recording(self, *args, **kwargs):
+        locks.append((self.model, connection.savepoint_ids[-1]))
+        return select_for_update(self, *args, **kwargs)
+
+    monkeypatch.setattr(QuerySet, "select_for_update", recording)
+    return locks
+
+
+def lock_held(locks, model):
+    return any(
+        locked is model and savepoint in connection.savepoint_ids
+        for locked, savepoint in locks
+    )
+
+
+@pytest.mark.django_db
+def test_references_are_saved_under_the_lock(population, user, locks, monkeypatch):
+    bulk_update = QuerySet.bulk_update
+    saved = []
+
+    def recording(self, objs, fields, **kwargs):
+        if self.model is MemberSepa:
+            saved.append(lock_held(locks, DirectDebitConfiguration))
+        return bulk_update(self, objs, fields, **kwargs)
+
+    monkeypatch.setattr(QuerySet, "bulk_update", recording)
+    without_reference = MemberSepa.objects.filter(mandate_reference__isnull=True)
+    assert without_reference.exists()
+
+    request = view_request(
+        user,
+        "finance.directdebit.assign_sepa_mandates",
+        "post",
+        assign_mandates_data(),
+    )
+    request.resolver_match.func(request)
+
+    assert saved == [True]
+    assert not lock_held(locks, DirectDebitConfiguration)
+    assert not without_reference.exists()
+    references = list(MemberSepa.objects.values_list("mandate_reference", flat=True))
+    assert len(references) == len(set(references))
+
+
+@pytest.mark.django_db
+def test_allocations_see_each_other(configuration, locks):
+    member = Member(number="17")
+    with MandateReferenceAllocator("TEST", 15) as first:
+        assert lock_held(locks, DirectDebitConfiguration)
+        reference = first.allocate(member)
+        assert reference.startswith("TEST") and len(reference) == 15
+        MemberSepa.objects.create(
+            member=Member.objects.create(number="17"), mandate_reference=reference
+        )
+    assert not lock_held(locks, DirectDebitConfiguration)
+
+    # There is only one random character, so the second allocation has to
+    # avoid the reference of the first
+    with MandateReferenceAllocator("TEST", 15) as second:
+        assert reference in second.used
+        assert second.allocate(member) != reference
+
+
+@pytest.mark.django_db
+def test_save_mails(configuration):
+    members = [Member.objects.create(number=str(n)) for n in range(3)]
+    mails = [
+        EMail(to="{}@example.org".format(n), subject="Test", text=str(n))
+        for n in range(3)
+    ]
+    # A mail saved concurrently must not be mistaken for one of ours
+    EMail.objects.create(to="other@example.org", subject="Other", text="")
+
+    bulk.save_mails(mails, members)
+    for n, member in enumerate(members):
+        assert [mail.text for mail in EMail.objects.filter(members=member)] == [str(n)]
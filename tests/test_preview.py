@@ -0,0 +1,72 @@
+import json
+import re
+
+import pytest
+from django.contrib.messages import get_messages
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from byro.common.models import LogEntry
+from byro.mails.models import EMail
+
+from byro_directdebit import jobs
+from byro_directdebit.models import (
+    DirectDebit,
+    DirectDebitJob,
+    DirectDebitJobState,
+    DirectDebitPayment,
+)
+
+from .benchmarks.benchmark import prepare_data, view_request
+
+WRITE = re.compile(r"^\s*(INSERT|UPDATE|DELETE|REPLACE)\b", re.IGNORECASE)
+
+
+def run_view(user, url_name, data):
+    request = view_request(user, url_name, "post", data)
+    return request, request.resolver_match.func(request)
+
+
+def row_counts():
+    return [
+        model.objects.count()
+        for model in (DirectDebit, DirectDebitPayment, DirectDebitJob, EMail, LogEntry)
+    ]
+
+
+@pytest.mark.django_db
+def test_preview_matches_the_prepared_debit(population, user, settings, tmp_path):
+    settings.DIRECTDEBIT_PRIVATE_ROOT = str(tmp_path)
+    data = prepare_data()
+    before = row_counts()
+
+    with CaptureQueriesContext(connection) as queries:
+        request, response = run_view(
+            user, "finance.directdebit.prepare_dd.preview", data
+        )
+    assert response.status_code == 200
+    assert [
+        query["sql"] for query in queries.captured_queries if WRITE.match(query["sql"])
+    ] == []
+    assert row_counts() == before
+    assert not list(get_messages(request))
+    assert not list(tmp_path.iterdir())
+    preview = json.loads(response.content)
+    assert preview["count"] > 0
+
+    run_view(user, "finance.directdebit.prepare_dd", data)
+    jobs.run_pending_jobs()
+    job = DirectDebitJob.objects.get()
+    assert job.state == DirectDebitJobState.DONE.value, job.error
+    debit = job.direct_debit
+
+    assert preview["count"] == debit.payment_count == job.total
+    assert preview["amount"] == "{:.2f}".format(debit.control_sum)
+    assert preview["by_sequence_type"] == debit.sequence_type_totals
+    paid = {
+        str(payment.member_id): "{:.2f}".format(payment.amount)
+        for payment in debit.payments.all()
+    }
+    assert {
+        str(row["member"]): row["amount"] for row in preview["sample"]
+    }.items() <= paid.items()
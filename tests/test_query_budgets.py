@@ -0,0 +1,131 @@
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils.timezone import now
+
+from byro.members.models import Member
+
+from byro_directdebit import jobs
+from byro_directdebit.models import DirectDebitJob, DirectDebitJobState
+from byro_directdebit.querybudget import budget_report, budgeted, get_query_budget
+from byro_directdebit.views import MemberList, MemberListExportView
+
+from .benchmarks.benchmark import (
+    NAME_PREFIX,
+    assign_mandates_data,
+    prepare_data,
+    view_request,
+)
+from .conftest import POPULATION
+
+
+@pytest.fixture
+def prepared_job(population, user, settings, tmp_path):
+    settings.DIRECTDEBIT_PRIVATE_ROOT = str(tmp_path)
+    run_view(user, "finance.directdebit.prepare_dd", "post", prepare_data())
+    jobs.run_pending_jobs()
+    job = DirectDebitJob.objects.get()
+    assert job.state == DirectDebitJobState.DONE.value, job.error
+    return job
+
+
+def run_view(user, url_name, method="get", data=None, **kwargs):
+    """Run a view and check that it stays within its ``query_budget``."""
+    request = view_request(user, url_name, method, data, **kwargs)
+    view = request.resolver_match.func
+    budget = get_query_budget(view)
+    assert budget is not None, "{} has no query_budget".format(url_name)
+
+    with CaptureQueriesContext(connection) as queries:
+        response = view(request, **request.resolver_match.kwargs)
+        if hasattr(response, "render"):
+            response.render()
+    counted = budgeted(queries.captured_queries)
+    assert len(counted) <= budget, budget_report(url_name, counted, budget)
+    assert response.status_code < 400
+    return response
+
+
+@pytest.mark.parametrize(
+    "mode",
+    ["all", "due"]
+    + list(MemberList.STATE_FILTERS)
+    + list(MemberList.DUE_STATE_FILTERS),
+)
+def test_member_list(population, user, mode):
+    run_view(user, "finance.directdebit.list", data={"filter": mode})
+
+
+def test_member_list_keyset(population, user):
+    run_view(user, "finance.directdebit.list", data={"after": 2**31})
+
+
+@pytest.mark.parametrize("export_format", list(MemberListExportView.FORMATS))
+def test_member_list_export(population, user, export_format):
+    response = run_view(
+        user,
+        "finance.directdebit.list.export",
+        data={"filter": "all"},
+        format=export_format,
+    )
+    lines = b"".join(response.streaming_content).decode("utf-8").splitlines()
+    assert len(lines) >= POPULATION
+
+
+@pytest.mark.parametrize(
+    "url_name",
+    [
+        "finance.directdebit.dashboard",
+        "finance.directdebit.assign_sepa_mandates",
+        "finance.directdebit.prepare_dd",
+        "finance.directdebit.history",
+        "finance.directdebit.scopes",
+        "finance.directdebit.scopes.create",
+        "finance.directdebit.import_returns",
+    ],
+)
+def test_get(population, user, url_name):
+    run_view(user, url_name)
+
+
+def test_assign_mandates(population, user):
+    run_view(
+        user,
+        "finance.directdebit.assign_sepa_mandates",
+        "post",
+        assign_mandates_data(),
+    )
+
+
+def test_prepare_preview(population, user):
+    run_view(user, "finance.directdebit.prepare_dd.preview", "post", prepare_data())
+
+
+def test_prepared_debit(prepared_job, user):
+    for url_name in (
+        "finance.directdebit.prepare_dd.job",
+        "finance.directdebit.prepare_dd.job.progress",
+    ):
+        run_view(user, url_name, pk=prepared_job.pk)
+    run_view(
+        user,
+        "finance.directdebit.prepare_dd.job.resume",
+        "post",
+        pk=prepared_job.pk,
+    )
+    run_view(
+        user,
+        "finance.directdebit.transmit_dd.sepa_xml",
+        pk=prepared_job.direct_debit_id,
+    ).close()
+    run_view(
+        user,
+        "finance.directdebit.api.history",
+        data={"state": "unknown", "start": now().date()},
+    )
+    run_view(
+        user,
+        "finance.directdebit.api.member_payments",
+        data={"start": now().date().replace(month=1, day=1)},
+        pk=Member.objects.filter(name__startswith=NAME_PREFIX).latest("pk").pk,
+    )
@@ -0,0 +1,133 @@
+import datetime
+from decimal import Decimal
+
+import pytest
+from i18nfield.strings import LazyI18nString
+
+from byro.common.models import Configuration
+from byro.mails.models import MailTemplate
+
+from byro_directdebit.rendering import (
+    CompiledFormat,
+    MailRenderer,
+    TemplateError,
+    check_placeholders,
+)
+
+VALUES = {
+    "name": "Jane Doe",
+    "amount": Decimal("12.5"),
+    "date": datetime.date(2024, 3, 1),
+    "reference": "REF-1",
+    "items": ["first", "second"],
+}
+
+
+@pytest.mark.parametrize(
+    "format_string",
+    [
+        "Hello {name}",
+        "{{literal}} braces, {{{name}}} and }}",
+        "{amount:.2f} {amount:>10} {amount!s:*^12}",
+        "{date:%d.%m.%Y}, {date.year}",
+        "{reference!r} {items[1]}",
+        "{name}{reference}{amount}",
+        "No placeholders at all",
+        "",
+    ],
+)
+@pytest.mark.parametrize("constants", [(), ("name",), ("name", "amount", "date")])
+def test_compiled_format_matches_str_format(format_string, constants):
+    compiled = CompiledFormat(
+        format_string,
+        {name: VALUES[name] for name in constants},
+        [name for name in VALUES if name not in constants],
+    )
+    fields = {name: value for name, value in VALUES.items() if name not in constants}
+    assert compiled.render(fields) == format_string.format(**VALUES)
+
+
+@pytest.mark.parametrize(
+    "format_string,error",
+    [
+        ("Hello {nam}", "Unknown placeholder {nam}"),
+        ("Hello {nam.attribute}", "Unknown placeholder {nam.attribute}"),
+        ("Hello {}", "Placeholders need a name"),
+        ("Hello {name", "expected '}' before end of string"),
+        ("Hello }", "Single '}' encountered in format string"),
+    ],
+)
+def test_check_placeholders(format_string, error):
+    with pytest.raises(TemplateError, match=error):
+        check_placeholders(format_string, VALUES)
+
+
+def test_constant_that_cannot_be_rendered():
+    with pytest.raises(TemplateError, match="Cannot render"):
+        CompiledFormat("{name:%d}", {"name": "Jane"}, [])
+    with pytest.raises(TemplateError, match="Cannot render"):
+        CompiledFormat("{items[5]}", {"items": VALUES["items"]}, [])
+
+
+@pytest.fixture
+def template(db):
+    return MailTemplate.objects.create(
+        subject=LazyI18nString(
+            {"en": "Debit {reference}", "de": "Lastschrift {reference}"}
+        ),
+        text=LazyI18nString(
+            {
+                "en": "Dear {name}, we collect {amount}.",
+                "de": "Hallo {name}, wir ziehen {amount} ein.",
+            }
+        ),
+    )
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("language", ["de", "en"])
+def test_mail_renderer_matches_to_mail(template, language):
+    config = Configuration.get_solo()
+    config.language = language
+    config.save()
+
+    renderer = MailRenderer(template, {"reference": "REF-1"}, ["name", "amount"])
+    assert renderer.locale == language
+    mail = renderer.to_mail("jane@example.org", name="Jane", amount="12.50 EUR")
+    expected = template.to_mail(
+        "jane@example.org",
+        context={"reference": "REF-1", "name": "Jane", "amount": "12.50 EUR"},
+        save=False,
+    )
+    assert (mail.to, mail.subject, mail.text, mail.template) == (
+        expected.to,
+        expected.subject,
+        expected.text,
+        expected.template,
+    )
+    assert mail.pk is None
+
+
+@pytest.mark.django_db
+def test_mail_renderer_locale(template):
+    config = Configuration.get_solo()
+    config.language = "de"
+    config.save()
+
+    mail = MailRenderer(
+        template, {}, ["reference", "name", "amount"], locale="en"
+    ).to_mail("jane@example.org", reference="REF-1", name="Jane", amount="1")
+    assert mail.subject == "Debit REF-1"
+
+
+@pytest.mark.django_db
+def test_mail_renderer_overrides(template):
+    renderer = MailRenderer(
+        template,
+        {"reference": "REF-1"},
+        ["name"],
+        subject="{{{reference}}}",
+        text="{name}",
+    )
+    mail = renderer.to_mail("jane@example.org", name="Jane")
+    assert (mail.subject, mail.text) == ("{REF-1}", "Jane")
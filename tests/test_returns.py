@@ -0,0 +1,68 @@
+import io
+
+import pytest
+
+from byro_directdebit.models import DirectDebitState
+from byro_directdebit.returns import parse_status_report
+
+EXECUTED = DirectDebitState.EXECUTED.value
+BOUNCED = DirectDebitState.BOUNCED.value
+
+PAIN002 = """<?xml version="1.0" encoding="UTF-8"?>
+<Document xmlns="urn:iso:std:iso:20022:tech:xsd:pain.002.001.03">
+<CstmrPmtStsRpt><OrgnlPmtInfAndSts>
+<TxInfAndSts><OrgnlEndToEndId>E1</OrgnlEndToEndId><TxSts>ACSC</TxSts></TxInfAndSts>
+<TxInfAndSts><OrgnlEndToEndId>E2</OrgnlEndToEndId><TxSts>RJCT</TxSts></TxInfAndSts>
+<TxInfAndSts><OrgnlEndToEndId>E3</OrgnlEndToEndId><TxSts>PDNG</TxSts></TxInfAndSts>
+<TxInfAndSts><OrgnlEndToEndId>E4</OrgnlEndToEndId><TxSts>CANC</TxSts></TxInfAndSts>
+<TxInfAndSts><TxSts>ACCC</TxSts></TxInfAndSts>
+</OrgnlPmtInfAndSts></CstmrPmtStsRpt>
+</Document>"""
+
+CAMT054 = """<?xml version="1.0" encoding="UTF-8"?>
+<Document xmlns="urn:iso:std:iso:20022:tech:xsd:camt.054.001.{version}">
+<BkToCstmrDbtCdtNtfctn><Ntfctn>
+<Ntry><Sts>{booked}</Sts><NtryDtls>
+<TxDtls><Refs><EndToEndId>C1</EndToEndId></Refs></TxDtls>
+<TxDtls><Refs><EndToEndId>C2</EndToEndId></Refs><RtrInf><Rsn><Cd>AC04</Cd></Rsn></RtrInf></TxDtls>
+</NtryDtls></Ntry>
+<Ntry><RvslInd>true</RvslInd><Sts>{booked}</Sts><NtryDtls>
+<TxDtls><Refs><EndToEndId>C3</EndToEndId></Refs></TxDtls>
+</NtryDtls></Ntry>
+<Ntry><Sts>{pending}</Sts><NtryDtls>
+<TxDtls><Refs><EndToEndId>C4</EndToEndId></Refs></TxDtls>
+</NtryDtls></Ntry>
+<Ntry><Sts>{booked}</Sts><NtryDtls>
+<TxDtls><Refs><EndToEndId>C5</EndToEndId></Refs></TxDtls>
+</NtryDtls></Ntry>
+</Ntfctn></BkToCstmrDbtCdtNtfctn>
+</Document>"""
+
+
+def parse(text):
+    return list(parse_status_report(io.BytesIO(text.encode("utf-8"))))
+
+
+def test_pain002_final_states():
+    assert parse(PAIN002) == [("E1", EXECUTED), ("E2", BOUNCED), ("E4", BOUNCED)]
+
+
+@pytest.mark.parametrize(
+    "version,booked,pending",
+    [
+        ("02", "BOOK", "PDNG"),
+        ("08", "<Cd>BOOK</Cd>", "<Cd>PDNG</Cd>"),
+    ],
+)
+def test_camt054_booked_entries(version, booked, pending):
+    assert parse(CAMT054.format(version=version, booked=booked, pending=pending)) == [
+        ("C1", EXECUTED),
+        ("C2", BOUNCED),
+        ("C3", BOUNCED),
+        ("C5", EXECUTED),
+    ]
+
+
+def test_malformed_file():
+    with pytest.raises(ValueError):
+        parse("<Document><TxInfAndSts>")
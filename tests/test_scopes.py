@@ -0,0 +1,45 @@
+import pytest
+
+from byro_directdebit.scopes import (
+    format_member_numbers,
+    parse_countries,
+    parse_member_numbers,
+)
+
+
+@pytest.mark.parametrize(
+    "text,ranges",
+    [
+        ("", ()),
+        (" , ", ()),
+        ("42", ((42, 42),)),
+        ("1-9, 20-29,42,5000-", ((1, 9), (20, 29), (42, 42), (5000, None))),
+        ("-10", ((None, 10),)),
+        ("20-29,1-9", ((1, 9), (20, 29))),
+        ("1-10,5-20", ((1, 20),)),
+        ("1-10,11-20", ((1, 20),)),
+        ("1-20,5-10", ((1, 20),)),
+        ("-10,5-20", ((None, 20),)),
+        ("5-,1-3,10-20", ((1, 3), (5, None))),
+        ("-3,-10", ((None, 10),)),
+    ],
+)
+def test_parse_member_numbers(text, ranges):
+    assert parse_member_numbers(text) == ranges
+
+
+@pytest.mark.parametrize("text", ["-", "a", "1-b", "1-2-3", "10-1"])
+def test_parse_member_numbers_invalid(text):
+    with pytest.raises(ValueError):
+        parse_member_numbers(text)
+
+
+def test_format_member_numbers_round_trip():
+    text = "-9,20-29,42,5000-"
+    assert format_member_numbers(parse_member_numbers(text)) == text
+
+
+def test_parse_countries():
+    assert parse_countries("de, AT,,") == frozenset(["DE", "AT"])
+    with pytest.raises(ValueError):
+        parse_countries("DEU")
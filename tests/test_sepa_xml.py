@@ -0,0 +1,208 @@
+import datetime
+import io
+from decimal import Decimal
+
+import pytest
+from django.db.models import Sum
+from lxml import etree
+from sepaxml import SepaDD
+
+from byro_directdebit import jobs
+from byro_directdebit.models import DirectDebit, DirectDebitJob, DirectDebitJobState
+from byro_directdebit.sepa_xml import StreamingSepaDD, validate_file
+
+from .benchmarks.benchmark import prepare_data, view_request
+
+CONFIG = {
+    "name": "Verein Ü e.V.",
+    "IBAN": "DE89370400440532013000",
+    "BIC": "COBADEFFXXX",
+    "batch": True,
+    "creditor_id": "DE98ZZZ09999999999",
+    "currency": "EUR",
+}
+
+# Differ between two runs anyway
+GENERATED = {"MsgId", "CreDtTm", "PmtInfId"}
+
+
+def payments(all_bics=False):
+    """Some payments without a BIC, unless ``all_bics`` as pain.008.002.02
+    requires it."""
+    for i in range(25):
+        payment = {
+            "name": "Mitglied Nr. {} – Jürgen".format(i),
+            "IBAN": "DE02120300000000202051",
+            "amount": 1000 + i,
+            "type": ["FRST", "RCUR"][i % 2],
+            "collection_date": datetime.date(2030, 1, 2 + i % 3),
+            "mandate_id": "REF{:05d}".format(i),
+            "mandate_date": datetime.date(2020, 1, 1),
+            "description": "Mitgliedsbeitrag {}".format(i),
+            "endtoend_id": "E2E{:05d}".format(i),
+        }
+        if all_bics or i % 4:
+            payment["BIC"] = "BYLADEM1001"
+        yield payment
+
+
+def canonical(element):
+    """Tag, text and children, without the generated ids."""
+    return (
+        etree.QName(element).localname,
+        (element.text or "").strip(),
+        [
+            canonical(child)
+            for child in element
+            if etree.QName(child).localname not in GENERATED
+        ],
+    )
+
+
+def document(xml: bytes):
+    root = canonical(etree.fromstring(xml))
+    (initiation,) = root[2]
+    group_header, *payment_information = initiation[2]
+    # sepaxml does not guarantee the order of the payment information blocks
+    return group_header, sorted(payment_information)
+
+
+def streaming_xml(schema, config=CONFIG, **kwargs):
+    sepa = StreamingSepaDD(config, schema=schema)
+    sepa.add_payments(payments(schema == "pain.008.002.02"), **kwargs)
+    output = io.BytesIO()
+    sepa.export(output)
+    sepa.close()
+    return output.getvalue()
+
+
+@pytest.mark.parametrize("schema", ["pain.008.001.02", "pain.008.002.02"])
+def test_matches_sepaxml(schema):
+    sepa = SepaDD(dict(CONFIG), schema=schema)
+    for payment in payments(schema == "pain.008.002.02"):
+        sepa.add_payment(payment)
+    assert document(streaming_xml(schema)) == document(sepa.export())
+
+
+@pytest.mark.parametrize("schema", ["pain.008.001.02", "pain.008.002.02"])
+def test_matches_sepaxml_without_batch(schema):
+    config = dict(CONFIG, batch=False)
+    sepa = SepaDD(dict(config), schema=schema)
+    for payment in payments(schema == "pain.008.002.02"):
+        sepa.add_payment(payment)
+    assert document(streaming_xml(schema, config)) == document(sepa.export())
+
+
+def test_workers_keep_the_order():
+    schema = "pain.008.001.02"
+    assert document(streaming_xml(schema, workers=2, piece_size=4)) == document(
+        streaming_xml(schema)
+    )
+
+
+def test_groups_and_totals():
+    sepa = StreamingSepaDD(CONFIG, schema="pain.008.001.02", spool_size=100)
+    for payment in payments():
+        payment["group"] = payment["IBAN"][:2] if payment.get("BIC") else "XX"
+        sepa.add_payment(payment)
+    assert sepa.count == 25
+    assert sepa.total == sum(payment["amount"] for payment in payments())
+    # The payments without a BIC are all FRST
+    assert len(sepa._batches) == 9
+
+    output = io.BytesIO()
+    sepa.export(output, validate=False)
+    sepa.close()
+    output.seek(0)
+    group_header = validate_file(output, "pain.008.001.02")
+    assert group_header["NbOfTxs"] == "25"
+    assert group_header["CtrlSum"] == "253.00"
+
+
+def test_invalid_payment():
+    payment = next(payments())
+    payment["amount"] = "10.00"
+    sepa = StreamingSepaDD(CONFIG, schema="pain.008.001.02")
+    with pytest.raises(Exception, match="AMOUNT_NOT_INTEGER"):
+        sepa.add_payment(payment)
+
+
+@pytest.fixture
+def prepare_job(population, user, settings, tmp_path):
+    settings.DIRECTDEBIT_PRIVATE_ROOT = str(tmp_path)
+
+    def prepare():
+        request = view_request(
+            user, "finance.directdebit.prepare_dd", "post", prepare_data()
+        )
+        request.resolver_match.func(request)
+        jobs.run_pending_jobs()
+        return DirectDebitJob.objects.get()
+
+    return prepare
+
+
+def xml_totals(xml: str):
+    """The group header totals and the totals per sequence type of a SEPA-XML."""
+    root = etree.fromstring(xml.encode("utf-8"))
+    namespaces = {"p": etree.QName(root).namespace}
+    group_header = root.find("p:CstmrDrctDbtInitn/p:GrpHdr", namespaces)
+    sequence_types = {}
+    for info in root.iterfind("p:CstmrDrctDbtInitn/p:PmtInf", namespaces):
+        sequence_type = info.findtext("p:PmtTpInf/p:SeqTp", namespaces=namespaces)
+        count, amount = sequence_types.get(sequence_type, (0, Decimal("0.00")))
+        sequence_types[sequence_type] = (
+            count + int(info.findtext("p:NbOfTxs", namespaces=namespaces)),
+            amount + Decimal(info.findtext("p:CtrlSum", namespaces=namespaces)),
+        )
+    return (
+        int(group_header.findtext("p:NbOfTxs", namespaces=namespaces)),
+        Decimal(group_header.findtext("p:CtrlSum", namespaces=namespaces)),
+        sequence_types,
+    )
+
+
+@pytest.mark.django_db
+def test_stored_totals_match_the_xml(prepare_job):
+    job = prepare_job()
+    assert job.state == DirectDebitJobState.DONE.value, job.error
+    debit = job.direct_debit
+    payment_count, control_sum, sequence_types = xml_totals(debit.get_sepa_xml())
+
+    assert payment_count > 0
+    assert (debit.payment_count, debit.control_sum) == (payment_count, control_sum)
+    assert {
+        sequence_type: (values["count"], Decimal(values["amount"]))
+        for sequence_type, values in debit.sequence_type_totals.items()
+    } == sequence_types
+    assert payment_count == debit.payments.count()
+    assert control_sum == debit.payments.aggregate(total=Sum("amount"))["total"]
+
+
+def test_check_totals():
+    debit = DirectDebit()
+    debit.set_totals([("FRST", 2, Decimal("20.00")), ("RCUR", 1, Decimal("5.5"))])
+    assert debit.sequence_type_totals == {
+        "FRST": {"count": 2, "amount": "20.00"},
+        "RCUR": {"count": 1, "amount": "5.50"},
+    }
+    debit.check_totals(3, Decimal("25.50"))
+    with pytest.raises(ValueError, match="3 payments over 25.51"):
+        debit.check_totals(3, Decimal("25.51"))
+    with pytest.raises(ValueError, match="2 payments over 25.50"):
+        debit.check_totals(2, Decimal("25.50"))
+
+
+@pytest.mark.django_db
+def test_mismatching_totals_are_rejected(prepare_job, monkeypatch):
+    set_totals = DirectDebit.set_totals
+
+    def miscounting(self, totals):
+        set_totals(self, totals)
+        self.control_sum += Decimal("0.01")
+
+    monkeypatch.setattr(DirectDebit, "set_totals", miscounting)
+    job = prepare_job()
+    assert job.state == DirectDebitJobState.FAILED.value
+    assert "The SEPA-XML has" in job.error
+    assert not DirectDebit.objects.filter(sepa_xml_sha256__isnull=False).exists()
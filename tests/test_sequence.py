@@ -0,0 +1,73 @@
+import datetime
+from decimal import Decimal
+
+import pytest
+from django.test.utils import override_settings
+from django.utils.timezone import now
+
+from byro_directdebit.models import DirectDebit, DirectDebitPayment, DirectDebitState
+from byro_directdebit.sequence import FINAL, FIRST, RECURRING, SequenceTypeResolver
+
+
+def debit_with_payments(debit_state, *payments):
+    debit = DirectDebit.objects.create(
+        pain_descriptor="urn:iso:std:iso:20022:tech:xsd:pain.008.001.02",
+        state=debit_state.value,
+    )
+    for mandate_reference, state in payments:
+        DirectDebitPayment.objects.create(
+            direct_debit=debit,
+            type=FIRST,
+            mandate_reference=mandate_reference,
+            collection_date=now() - datetime.timedelta(days=30),
+            amount=Decimal("10.00"),
+            state=state.value,
+        )
+    return debit
+
+
+@pytest.mark.django_db
+@override_settings(DIRECTDEBIT_BULK_BATCH_SIZE=2)
+def test_resolve():
+    debit_with_payments(
+        DirectDebitState.EXECUTED,
+        ("EXECUTED", DirectDebitState.EXECUTED),
+        ("BOUNCED", DirectDebitState.BOUNCED),
+        ("USED_TWICE", DirectDebitState.EXECUTED),
+    )
+    debit_with_payments(
+        DirectDebitState.TRANSMITTED,
+        ("TRANSMITTED", DirectDebitState.UNKNOWN),
+        ("USED_TWICE", DirectDebitState.UNKNOWN),
+    )
+    debit_with_payments(
+        DirectDebitState.UNKNOWN, ("PREPARED", DirectDebitState.UNKNOWN)
+    )
+
+    references = [
+        "EXECUTED",
+        "BOUNCED",
+        "USED_TWICE",
+        "TRANSMITTED",
+        "PREPARED",
+        "NEW",
+    ]
+    resolver = SequenceTypeResolver(references)
+    assert resolver.collections == {"EXECUTED": 1, "USED_TWICE": 2, "TRANSMITTED": 1}
+    assert [resolver.resolve(reference) for reference in references] == [
+        RECURRING,
+        FIRST,
+        RECURRING,
+        RECURRING,
+        FIRST,
+        FIRST,
+    ]
+    assert resolver.resolve("EXECUTED", final=True) == FINAL
+    assert resolver.resolve("NEW", final=True) == FIRST
+
+
+@pytest.mark.django_db
+def test_resolve_does_not_query(django_assert_num_queries):
+    resolver = SequenceTypeResolver(["A", "B"])
+    with django_assert_num_queries(0):
+        assert resolver.resolve("A") == FIRST
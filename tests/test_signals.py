@@ -0,0 +1,23 @@
+import pytest
+
+from byro.members.models import Member
+
+from byro_directdebit import capabilities
+
+
+@pytest.fixture
+def invalidations(monkeypatch):
+    calls = []
+    monkeypatch.setattr(capabilities, "invalidate", lambda: calls.append(True))
+    return calls
+
+
+@pytest.mark.django_db
+def test_bank_connection_changed(fints_model, invalidations):
+    scope = fints_model.objects.create(name="Bank")
+    assert len(invalidations) == 1
+    scope.delete()
+    assert len(invalidations) == 2
+
+    Member.objects.create(number="1", name="Not a bank connection")
+    assert len(invalidations) == 2
@@ -0,0 +1,225 @@
+import datetime
+import io
+from decimal import Decimal
+
+import pytest
+from django.contrib.sessions.backends.db import SessionStore
+from django.test import RequestFactory
+from django.utils.timezone import now
+from fints.client import ResponseStatus
+
+from byro_directdebit import transmission
+from byro_directdebit.fints_standin import (
+    STATS,
+    StandInResponse,
+    StandInSepaDDHelper,
+)
+from byro_directdebit.models import DirectDebit, DirectDebitPayment, DirectDebitState
+from byro_directdebit.sequence import FIRST, RECURRING, SequenceTypeResolver
+
+from .benchmarks.benchmark import view_request
+
+XML = (
+    "<Document><CstmrDrctDbtInitn><GrpHdr><CtrlSum>{}</CtrlSum></GrpHdr>"
+    "</CstmrDrctDbtInitn></Document>"
+)
+
+
+class UnknownResponseHelper(StandInSepaDDHelper):
+    def sepa_dd(self, *args, **kwargs):
+        super().sepa_dd(*args, **kwargs)
+        return StandInResponse(ResponseStatus.UNKNOWN, "3040", "Order pending")
+
+
+@pytest.fixture
+def standin(settings, tmp_path):
+    settings.DEBUG = True
+    settings.DIRECTDEBIT_PRIVATE_ROOT = str(tmp_path)
+
+    def configure(**options):
+        settings.DIRECTDEBIT_FINTS_STANDIN = dict({"tan": "never"}, **options)
+
+    configure()
+    return configure
+
+
+@pytest.fixture
+def request_():
+    request = RequestFactory().post("/")
+    request.session = SessionStore()
+    return request
+
+
+def create_debit(days, control_sum, xml_sum=None):
+    debit = DirectDebit.objects.create(
+        datetime=now() - datetime.timedelta(days=days),
+        pain_descriptor="urn:iso:std:iso:20022:tech:xsd:pain.008.001.02",
+        payment_count=1,
+        control_sum=Decimal(control_sum),
+        additional_data={"account_iban": "DE89370400440532013000", "user_login_pk": 1},
+    )
+    debit.store_sepa_xml(io.BytesIO(XML.format(xml_sum or control_sum).encode("utf-8")))
+    debit.save()
+    return debit
+
+
+def start(request, debits, helper_class=StandInSepaDDHelper):
+    batch = transmission.BatchTransmission(
+        helper_class(request), request, debits, "EUR"
+    )
+    return batch.start()
+
+
+def send_tan(request, resume_id, tan="123456"):
+    batch = transmission.BatchTransmission.restore(request, resume_id, "EUR")
+    return batch.send_tan(tan)
+
+
+def states(debits):
+    return [
+        DirectDebit.objects.get(pk=debit.pk).get_state_display() for debit in debits
+    ]
+
+
+@pytest.mark.django_db
+def test_without_tan(standin, request_):
+    debits = [create_debit(2, "10.00"), create_debit(1, "20.00")]
+    dialogs = STATS["dialogs"]
+
+    assert start(request_, debits) is None
+    assert states(debits) == ["Transmitted", "Transmitted"]
+    assert STATS["dialogs"] == dialogs + 1
+    assert DirectDebit.objects.get(pk=debits[0].pk).additional_data[
+        transmission.RESULT_KEY
+    ] == {"status": "SUCCESS", "messages": ["0020 Order accepted"]}
+
+
+@pytest.mark.django_db
+def test_tan_for_every_order(standin, request_):
+    standin(tan="every")
+    debits = [create_debit(2, "10.00"), create_debit(1, "20.00")]
+    dialogs = STATS["dialogs"]
+
+    first = start(request_, debits)
+    assert first
+    assert states(debits) == ["Unknown", "Unknown"]
+    assert request_.session[transmission.SESSION_KEY.format(first)]["pending"] == [
+        str(debit.pk) for debit in debits
+    ]
+
+    second = send_tan(request_, first)
+    assert second and second != first
+    assert transmission.SESSION_KEY.format(first) not in request_.session
+    assert states(debits) == ["Transmitted", "Unknown"]
+
+    assert send_tan(request_, second) is None
+    assert transmission.SESSION_KEY.format(second) not in request_.session
+    assert states(debits) == ["Transmitted", "Transmitted"]
+    # The dialog was paused and resumed, not opened again
+    assert STATS["dialogs"] == dialogs + 1
+
+
+@pytest.mark.django_db
+def test_tan_for_first_order(standin, request_):
+    standin(tan="first")
+    debits = [create_debit(2, "10.00"), create_debit(1, "20.00")]
+
+    resume_id = start(request_, debits)
+    assert resume_id
+    assert send_tan(request_, resume_id) is None
+    assert states(debits) == ["Transmitted", "Transmitted"]
+
+
+@pytest.mark.django_db
+def test_rejected_tan(standin, request_):
+    standin(tan="first")
+    debits = [create_debit(2, "10.00"), create_debit(1, "20.00")]
+
+    assert send_tan(request_, start(request_, debits), tan="") is None
+    assert states(debits) == ["Failed", "Transmitted"]
+
+
+@pytest.mark.django_db
+def test_mixed_batch(standin, request_):
+    debits = [
+        create_debit(3, "10.00"),
+        create_debit(2, "20.00", xml_sum="21.00"),
+        create_debit(1, "30.00"),
+    ]
+
+    assert start(request_, debits) is None
+    assert states(debits) == ["Transmitted", "Failed", "Transmitted"]
+    assert DirectDebit.objects.get(pk=debits[1].pk).additional_data[
+        transmission.RESULT_KEY
+    ] == {"status": "ERROR", "messages": ["9210 Control sum does not match"]}
+
+    # Only the failed debit can be sent again
+    reloaded = transmission.load_batch(debit.pk for debit in debits)
+    with pytest.raises(ValueError):
+        transmission.check_batch(reloaded)
+    transmission.check_batch([reloaded[1]])
+
+
+@pytest.mark.django_db
+def test_unknown_response(standin, request_):
+    debits = [create_debit(1, "10.00")]
+
+    assert start(request_, debits, UnknownResponseHelper) is None
+    assert states(debits) == ["Unconfirmed"]
+    # Not counted as transmitted, but can be sent again
+    transmission.check_batch(transmission.load_batch([debits[0].pk]))
+
+
+def transmit_view(user, debit, data=None, session=None, **kwargs):
+    url_name = "finance.directdebit.transmit_dd"
+    if "resume_id" in kwargs:
+        url_name += ".tan_request"
+    request = view_request(user, url_name, "post", data, pk=debit.pk, **kwargs)
+    if session is not None:
+        request.session = session
+    return request, request.resolver_match.func(
+        request, **request.resolver_match.kwargs
+    )
+
+
+@pytest.fixture
+def debit_with_payment(configuration, standin):
+    debit = create_debit(1, "10.00")
+    DirectDebitPayment.objects.create(
+        direct_debit=debit,
+        type=FIRST,
+        mandate_reference="REF1",
+        collection_date=now(),
+        amount=Decimal("10.00"),
+    )
+    return debit
+
+
+@pytest.mark.django_db
+def test_transmit_view_without_tan(debit_with_payment, user):
+    transmit_view(user, debit_with_payment)
+
+    debit_with_payment.refresh_from_db()
+    assert debit_with_payment.state == DirectDebitState.TRANSMITTED.value
+    # The next debit of the mandate is a recurring one
+    assert SequenceTypeResolver(["REF1"]).resolve("REF1") == RECURRING
+
+
+@pytest.mark.django_db
+def test_transmit_view_with_tan(debit_with_payment, user, standin):
+    standin(tan="every")
+    request, response = transmit_view(user, debit_with_payment)
+    debit_with_payment.refresh_from_db()
+    assert debit_with_payment.state == DirectDebitState.UNKNOWN.value
+
+    resume_id = response.url.rstrip("/").rsplit("/", 1)[-1]
+    transmit_view(
+        user,
+        debit_with_payment,
+        {"tan": "123456"},
+        session=request.session,
+        resume_id=resume_id,
+    )
+    debit_with_payment.refresh_from_db()
+    assert debit_with_payment.state == DirectDebitState.TRANSMITTED.value
+    assert SequenceTypeResolver(["REF1"]).resolve("REF1") == RECURRING
@@ -0,0 +1,86 @@
+import itertools
+
+import pytest
+
+from byro.plugins.sepa.models import MemberSepa
+
+from byro_directdebit.validation import (
+    check_bic,
+    check_iban,
+    check_profile,
+    profile_bic,
+    sepa_state,
+)
+
+PROFILES = [
+    ("DE89370400440532013000", None),
+    ("de89 3704 0044 0532 0130 00", None),
+    ("DE??370400440532013000", None),
+    # Wrong IBAN check digits
+    ("DE89370400440532013001", None),
+    # Right IBAN check digits, wrong national account checksum
+    ("DE33370400440001234567", None),
+    ("FR8830006000010053201300100", None),
+    # A bank without a BIC in the registry
+    ("DE05100200300532013001", None),
+    ("DE05100200300532013001", "COBADEFFXXX"),
+    ("DE8937040044053201300", None),
+    ("XX89370400440532013000", None),
+    ("", None),
+    ("DE89370400440532013000", "XXXX"),
+    ("DE89370400440532013000", "COBADEFF"),
+    ("DE89370400440532013000", "PBNKDEFF"),
+]
+
+
+@pytest.mark.parametrize(
+    "iban,bic,mandate_state,mandate_reference",
+    [
+        profile + mandate
+        for profile, mandate in itertools.product(
+            PROFILES,
+            [
+                ("active", "REF1"),
+                ("active", None),
+                ("rescinded", "REF1"),
+                ("bounced", "REF1"),
+                ("inactive", "REF1"),
+            ],
+        )
+    ],
+)
+def test_sepa_state_matches_member_sepa(iban, bic, mandate_state, mandate_reference):
+    profile = MemberSepa(
+        iban=iban,
+        bic=bic,
+        mandate_state=mandate_state,
+        mandate_reference=mandate_reference,
+    )
+    check = check_profile(iban, bic)
+    assert (
+        sepa_state(check, iban, mandate_state, mandate_reference)
+        == profile.sepa_direct_debit_state
+    )
+    assert check.iban_valid == bool(profile.iban_parsed)
+
+
+@pytest.mark.parametrize("iban,bic", PROFILES)
+def test_profile_bic_matches_member_sepa(iban, bic):
+    profile = MemberSepa(iban=iban, bic=bic)
+    # byro turns a missing BIC of the bank into the string "None"
+    expected = profile.bic_autocomplete
+    assert profile_bic(profile) == (None if expected == "None" else expected)
+
+
+def test_check_iban():
+    assert check_iban("de89 3704 0044 0532 0130 00") == (True, "DE", "COBADEFFXXX")
+    assert check_iban("DE05100200300532013001") == (True, "DE", None)
+    assert not check_iban("DE89370400440532013001").valid
+
+
+def test_check_bic():
+    assert check_bic("COBADEFF")
+    assert check_bic("COBADEFFXXX")
+    assert not check_bic("XXXX")
+    # byro raises ValueError for this one
+    assert not check_bic("PBNKDEFFXXY")